@@ -17,6 +17,10 @@ echo "PostgreSQL iniciado com sucesso."
 echo "Aplicando migrações..."
 python manage.py migrate
 
+# Partições diárias do histórico de posições
+echo "Preparando partições do histórico de posições..."
+python manage.py manage_position_partitions
+
 # Coletar estáticos
 echo "Coletando arquivos estáticos..."
 python manage.py collectstatic --noinput
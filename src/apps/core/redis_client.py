@@ -0,0 +1,26 @@
+import asyncio
+import weakref
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_redis():
+    """Cliente Redis compartilhado pelo processo (thread-safe, com pool de conexões)"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL)
+    return _client
+
+
+def get_async_redis():
+    """Cliente Redis assíncrono; um por event loop (as conexões ficam presas ao loop)"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = aioredis.Redis.from_url(settings.REDIS_URL)
+    return client
@@ -3,7 +3,8 @@ from .models import (
     Vehicle, Tire, MaintenancePlan, WorkOrder, 
     DriverScore, WorkShift, ShiftEvent,
     DeliveryRoute, RouteStop,
-    Contract, Expense, Fine
+    Contract, Expense, Fine,
+    Geofence, GeofenceEvent
 )
 
 # --- Inlines ---
@@ -67,4 +68,15 @@ class ExpenseAdmin(admin.ModelAdmin):
 @admin.register(Fine)
 class FineAdmin(admin.ModelAdmin):
     list_display = ('vehicle', 'amount', 'infraction_date', 'is_paid')
-    list_filter = ('is_paid', 'tenant')
\ No newline at end of file
+    list_filter = ('is_paid', 'tenant')
+
+@admin.register(Geofence)
+class GeofenceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'kind', 'shape', 'active', 'tenant')
+    list_filter = ('kind', 'active', 'tenant')
+    search_fields = ('name',)
+
+@admin.register(GeofenceEvent)
+class GeofenceEventAdmin(admin.ModelAdmin):
+    list_display = ('vehicle', 'geofence', 'event', 'time')
+    list_filter = ('event', 'tenant')
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 class FleetConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.fleet'
-    verbose_name = "Gestão de Frota"
\ No newline at end of file
+    verbose_name = "Gestão de Frota"
+
+    def ready(self):
+        from . import signals  # Conecta os receivers
@@ -0,0 +1,323 @@
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .history import parse_fix_time
+from .models import DeliveryRoute, RouteStop
+
+logger = logging.getLogger(__name__)
+
+METERS_PER_DEGREE = 111320.0
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+    """Equiretangular: erro desprezível nas distâncias de um raio de chegada"""
+    dy = (lat2 - lat1) * METERS_PER_DEGREE
+    dx = (lng2 - lng1) * METERS_PER_DEGREE * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.sqrt(dx * dx + dy * dy)
+
+
+def active_routes():
+    """
+    {route_id: (vehicle_id, tenant_id, versão)} das rotas IN_PROGRESS com
+    veículo, numa query só. A versão é o último updated_at das paradas: muda
+    quando uma parada é criada, reordenada, chega ou é atendida.
+    """
+    return {
+        str(route_id): (str(vehicle_id), tenant_id, version)
+        for route_id, vehicle_id, tenant_id, version in DeliveryRoute.objects.filter(
+            status='IN_PROGRESS', vehicle__isnull=False,
+        ).annotate(version=Max('stops__updated_at')).values_list('id', 'vehicle_id', 'tenant_id', 'version')
+    }
+
+
+class RouteIndex:
+    """
+    Paradas PENDING de uma rota num grid de células do tamanho do raio de
+    chegada (em metros nos dois eixos). Cada parada entra nas 9 células em
+    volta da sua, então uma posição faz um único acesso ao dict e só mede a
+    distância das paradas daquela vizinhança.
+    """
+
+    __slots__ = ('route_id', 'tenant_id', 'version', 'stops', 'cells', 'cell_lat', 'cell_lng')
+
+    def __init__(self, route_id, tenant_id, version, stops, radius_m):
+        self.route_id = route_id
+        self.tenant_id = tenant_id
+        self.version = version
+        self.stops = {}  # stop_id -> (lat, lng)
+        self.cells = defaultdict(list)
+        mean_lat = sum(lat for _, lat, _ in stops) / len(stops) if stops else 0.0
+        self.cell_lat = radius_m / METERS_PER_DEGREE
+        self.cell_lng = self.cell_lat / max(math.cos(math.radians(mean_lat)), 0.01)
+        for stop_id, lat, lng in stops:
+            self.add(stop_id, lat, lng)
+
+    def add(self, stop_id, lat, lng):
+        self.stops[stop_id] = (lat, lng)
+        for cell in self.neighborhood(lat, lng):
+            self.cells[cell].append(stop_id)
+
+    def cell(self, lat, lng):
+        return math.floor(lat / self.cell_lat), math.floor(lng / self.cell_lng)
+
+    def neighborhood(self, lat, lng):
+        row, column = self.cell(lat, lng)
+        return [(row + d_row, column + d_column) for d_row in (-1, 0, 1) for d_column in (-1, 0, 1)]
+
+    def within(self, lat, lng, radius_m):
+        """[(distância, stop_id)] das paradas a até radius_m (radius_m <= tamanho da célula)"""
+        candidates = self.cells.get(self.cell(lat, lng))
+        if not candidates:
+            return []
+        found = []
+        for stop_id in candidates:
+            stop_lat, stop_lng = self.stops[stop_id]
+            distance = distance_m(lat, lng, stop_lat, stop_lng)
+            if distance <= radius_m:
+                found.append((distance, stop_id))
+        return found
+
+    def discard(self, stop_id):
+        position = self.stops.pop(stop_id, None)
+        if position is not None:
+            for cell in self.neighborhood(*position):
+                self.cells[cell].remove(stop_id)
+
+
+class VisitState:
+    """Por veículo: parada candidata (dentro do raio desde `since`) e as paradas em atendimento"""
+
+    __slots__ = ('last_time', 'candidate', 'since', 'arrived')
+
+    def __init__(self):
+        self.last_time = 0.0
+        self.candidate = None
+        self.since = 0.0
+        self.arrived = []  # [(RouteIndex, stop_id)]
+
+
+class ArrivalDetector:
+    """
+    Chegada e atendimento das paradas pelas posições ao vivo.
+    Chegada: o veículo fica DWELL segundos a até RADIUS metros de uma parada
+    PENDING de uma rota IN_PROGRESS dele; vale para todas as paradas a até
+    RADIUS dali (várias entregas no mesmo endereço), com arrival_time no
+    instante em que entrou no raio. Atendimento (VISITED, completion_time):
+    quando ele se afasta mais que EXIT_RADIUS (folga contra o ruído do GPS).
+    As rotas ficam em memória (RouteIndex por rota) e são recarregadas a
+    cada REFRESH segundos por uma query só, que compara a versão de cada
+    rota (último updated_at das paradas) e relê apenas as que mudaram:
+    nenhuma query por posição.
+    O estado é do processo; com vários telemetry_worker cada um vê parte
+    das posições de um veículo, como no HarshEventDetector.
+    """
+
+    def __init__(self, radius_m=None, dwell=None, refresh=None):
+        self.radius = settings.STOP_ARRIVAL_RADIUS_M if radius_m is None else radius_m
+        self.exit_radius = 2 * self.radius
+        self.dwell = settings.STOP_ARRIVAL_DWELL_SECONDS if dwell is None else dwell
+        self.refresh_interval = settings.STOP_ARRIVAL_REFRESH_SECONDS if refresh is None else refresh
+        self.routes = {}  # route_id -> RouteIndex
+        self.by_vehicle = {}  # vehicle_id -> [RouteIndex]
+        self.states = {}  # vehicle_id -> VisitState
+        self.next_refresh = 0.0
+        self._lock = threading.Lock()
+
+    # --- rotas ---
+
+    def refresh(self):
+        active = active_routes()
+        changed = [
+            route_id for route_id, (_, _, version) in active.items()
+            if route_id not in self.routes or self.routes[route_id].version != version
+        ]
+        stops = defaultdict(list)
+        arrived = defaultdict(list)
+        if changed:
+            for stop_id, route_id, lat, lng, arrival_time in RouteStop.objects.filter(
+                route_id__in=changed, status='PENDING',
+            ).values_list('id', 'route_id', 'latitude', 'longitude', 'arrival_time'):
+                stops[str(route_id)].append((str(stop_id), lat, lng))
+                if arrival_time is not None:
+                    arrived[str(route_id)].append(str(stop_id))
+        self.load(active, stops, arrived)
+
+    def load(self, active, stops, arrived=None):
+        """
+        active: {route_id: (vehicle_id, tenant_id, versão)}; stops:
+        {route_id: [(stop_id, lat, lng)]} das rotas novas/alteradas;
+        arrived: {route_id: [stop_id]} já com chegada gravada.
+        """
+        arrived = arrived or {}
+        routes = {}
+        for route_id, (vehicle_id, tenant_id, version) in active.items():
+            if route_id in stops or route_id not in self.routes:
+                routes[route_id] = RouteIndex(route_id, tenant_id, version, stops.get(route_id, []), self.radius)
+            else:
+                routes[route_id] = self.routes[route_id]
+        by_vehicle = defaultdict(list)
+        for route_id, (vehicle_id, _, _) in active.items():
+            by_vehicle[vehicle_id].append(routes[route_id])
+
+        # Paradas em atendimento apontam para o índice novo (ou saem, se a rota saiu de IN_PROGRESS)
+        for vehicle_id, state in list(self.states.items()):
+            if vehicle_id not in by_vehicle:
+                del self.states[vehicle_id]
+                continue
+            state.arrived = [
+                (routes[index.route_id], stop_id) for index, stop_id in state.arrived
+                if index.route_id in routes and stop_id in routes[index.route_id].stops
+            ]
+        # Chegada gravada por outro processo (ou antes de um restart)
+        for route_id, stop_ids in arrived.items():
+            vehicle_id = active[route_id][0]
+            state = self.states.setdefault(vehicle_id, VisitState())
+            known = {stop_id for _, stop_id in state.arrived}
+            state.arrived += [(routes[route_id], stop_id) for stop_id in stop_ids if stop_id not in known]
+
+        self.routes = routes
+        self.by_vehicle = dict(by_vehicle)
+
+    # --- posições ---
+
+    def check(self, updates, undo=None):
+        """
+        updates: [(vehicle, pos, attributes)] do lote. Devolve os eventos
+        [{'event': 'arrived'|'visited', 'stop_id', 'route_id', 'vehicle_id',
+        'tenant_id', 'time'}] na ordem das posições.
+        undo: dict preenchido com o estado de antes do lote de cada veículo
+        com evento, para o rollback() se a gravação dos eventos falhar.
+        """
+        with self._lock:
+            if time.monotonic() >= self.next_refresh:
+                self.refresh()
+                self.next_refresh = time.monotonic() + self.refresh_interval
+            if not self.by_vehicle:
+                return []
+            events = []
+            for vehicle, pos, attributes in updates:
+                vehicle_id = str(vehicle.id)
+                routes = self.by_vehicle.get(vehicle_id)
+                lat, lng = pos.get('latitude'), pos.get('longitude')
+                if routes is None or lat is None or lng is None:
+                    continue
+                self.visit(vehicle_id, routes, lat, lng, parse_fix_time(pos).timestamp(), events, undo)
+            return events
+
+    @staticmethod
+    def save(state):
+        return state.candidate, state.since, [(index, stop_id, index.stops.get(stop_id)) for index, stop_id in state.arrived]
+
+    def rollback(self, undo):
+        """
+        Eventos do lote não gravados: os veículos voltam à parada candidata e
+        às paradas em atendimento de antes dele (as atendidas voltam ao
+        índice da rota), e as próximas posições geram os eventos de novo.
+        """
+        with self._lock:
+            for vehicle_id, (candidate, since, arrived) in undo.items():
+                state = self.states.get(vehicle_id)
+                if state is None:
+                    continue
+                state.candidate, state.since = candidate, since
+                state.arrived = []
+                for index, stop_id, position in arrived:
+                    if position is None or self.routes.get(index.route_id) is not index:
+                        continue  # rota recarregada ou encerrada no meio tempo
+                    if stop_id not in index.stops:
+                        index.add(stop_id, *position)
+                    state.arrived.append((index, stop_id))
+
+    def visit(self, vehicle_id, routes, lat, lng, t, events, undo=None):
+        state = self.states.get(vehicle_id)
+        if state is None:
+            state = self.states[vehicle_id] = VisitState()
+        if t <= state.last_time:
+            return  # fora de ordem
+        state.last_time = t
+
+        if state.arrived:
+            index, stop_id = state.arrived[0]
+            stop_lat, stop_lng = index.stops[stop_id]
+            if distance_m(lat, lng, stop_lat, stop_lng) <= self.exit_radius:
+                return
+            if undo is not None and vehicle_id not in undo:
+                undo[vehicle_id] = self.save(state)
+            for index, stop_id in state.arrived:
+                index.discard(stop_id)
+                events.append(self.event('visited', index, stop_id, vehicle_id, t))
+            state.arrived = []
+
+        nearby = [(distance, stop_id, index) for index in routes for distance, stop_id in index.within(lat, lng, self.radius)]
+        if not nearby:
+            state.candidate = None
+            return
+        _, nearest, _ = min(nearby, key=lambda hit: hit[0])
+        if state.candidate != nearest:
+            state.candidate, state.since = nearest, t
+        if t - state.since >= self.dwell:
+            if undo is not None and vehicle_id not in undo:
+                undo[vehicle_id] = self.save(state)
+            state.arrived = [(index, stop_id) for _, stop_id, index in sorted(nearby, key=lambda hit: hit[0])]
+            for index, stop_id in state.arrived:
+                events.append(self.event('arrived', index, stop_id, vehicle_id, state.since))
+            state.candidate = None
+
+    @staticmethod
+    def event(kind, index, stop_id, vehicle_id, t):
+        return {
+            'event': kind,
+            'stop_id': stop_id,
+            'route_id': index.route_id,
+            'vehicle_id': vehicle_id,
+            'tenant_id': str(index.tenant_id),
+            'time': datetime.fromtimestamp(t, tz=dt_timezone.utc).isoformat(),
+        }
+
+
+def save_stop_events(events):
+    """
+    Grava os eventos do lote (um bulk_update por tipo), conclui as rotas
+    sem paradas pendentes e publica stop_events no grupo de cada tenant.
+    """
+    if not events:
+        return
+    from .ingestion import tenant_group_name
+
+    now = timezone.now()
+    arrived, visited = {}, {}
+    for event in events:
+        moment = datetime.fromisoformat(event['time'])
+        if event['event'] == 'arrived':
+            arrived[event['stop_id']] = RouteStop(id=event['stop_id'], arrival_time=moment, updated_at=now)
+        else:
+            visited[event['stop_id']] = RouteStop(id=event['stop_id'], status='VISITED', completion_time=moment, updated_at=now)
+    if arrived:
+        RouteStop.objects.bulk_update(arrived.values(), ['arrival_time', 'updated_at'])
+    if visited:
+        RouteStop.objects.bulk_update(visited.values(), ['status', 'completion_time', 'updated_at'])
+        DeliveryRoute.objects.filter(
+            id__in={event['route_id'] for event in events if event['event'] == 'visited'}, status='IN_PROGRESS',
+        ).exclude(stops__status='PENDING').update(status='COMPLETED', updated_at=now)
+
+    by_tenant = defaultdict(list)
+    for event in events:
+        by_tenant[event['tenant_id']].append(event)
+    channel_layer = get_channel_layer()
+    for tenant_id, tenant_events in by_tenant.items():
+        try:
+            async_to_sync(channel_layer.group_send)(
+                tenant_group_name(tenant_id), {"type": "stop_events", "events": tenant_events},
+            )
+        except Exception:
+            logger.warning("Não foi possível publicar os eventos de parada do tenant %s", tenant_id, exc_info=True)
@@ -0,0 +1,164 @@
+import logging
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta, timezone as dt_timezone
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from .history import PositionHistoryService, parse_fix_time, position_row
+from .models import Position, Vehicle
+from .services import ScoreService, TraccarService, chunked
+
+logger = logging.getLogger(__name__)
+
+
+class RouteBackfill:
+    """
+    Recupera posições perdidas (veículo offline, serviço fora do ar) pelo
+    /api/reports/route do Traccar.
+    A janela vira tarefas (grupo de devices x fatia de tempo) buscadas em
+    paralelo por um pool limitado, com a sessão HTTP compartilhada; só a
+    thread que chamou run() toca no banco: cada resposta é deduplicada contra
+    o histórico (veículo + fixTime) e inserida em lote (COPY no PostgreSQL).
+    No fim refaz o score dos dias com alarme e avança o hodômetro.
+    """
+
+    def __init__(self, workers=None, devices_per_request=25, slice_hours=6, service=None):
+        self.workers = workers or settings.TRACCAR_POOL_SIZE
+        self.devices_per_request = devices_per_request
+        self.slice = timedelta(hours=slice_hours)
+        self.service = service or TraccarService()
+
+    @staticmethod
+    def load_vehicles(tenant=None, device_ids=None):
+        """deviceId -> Vehicle parcial (id e tenant_id) dos veículos a recuperar"""
+        queryset = Vehicle.objects.all()
+        if tenant is not None:
+            queryset = queryset.filter(tenant=tenant)
+        if device_ids:
+            queryset = queryset.filter(traccar_device_id__in=device_ids)
+        return {
+            device_id: Vehicle(id=vehicle_id, tenant_id=tenant_id, traccar_device_id=device_id)
+            for device_id, vehicle_id, tenant_id in queryset.values_list('traccar_device_id', 'id', 'tenant_id')
+        }
+
+    def tasks(self, device_ids, start, end):
+        """(devices, início, fim) cobrindo a janela; fatias mais antigas primeiro"""
+        tasks = []
+        cursor = start
+        while cursor < end:
+            slice_end = min(cursor + self.slice, end)
+            tasks.extend((chunk, cursor, slice_end) for chunk in chunked(sorted(device_ids), self.devices_per_request))
+            cursor = slice_end
+        return tasks
+
+    def run(self, vehicles, start, end, progress=None, dry_run=False):
+        """
+        Busca e grava as posições de `vehicles` ({deviceId: Vehicle}) entre
+        start e end. progress(feitas, total) é chamado a cada tarefa concluída.
+        Com dry_run só conta o que seria inserido.
+        """
+        report = progress or (lambda done, total: None)
+        result = {
+            'requests': 0, 'failed': 0, 'fetched': 0, 'duplicates': 0, 'inserted': 0,
+            'scores': 0, 'odometers': 0,
+        }
+        alarm_days = defaultdict(set)  # dia (UTC) -> veículos com alarme na janela
+        odometers = {}  # vehicle_id -> maior hodômetro recuperado (km)
+
+        tasks = self.tasks(list(vehicles), start, end)
+        queue = iter(tasks)
+        report(0, len(tasks))
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='traccar-backfill') as pool:
+            # Poucas respostas em memória: uma nova tarefa entra quando outra termina
+            pending = {}
+            while True:
+                for task in queue:
+                    pending[pool.submit(self.service.fetch_route, *task)] = task
+                    if len(pending) >= self.workers * 2:
+                        break
+                if not pending:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    device_ids, slice_start, slice_end = pending.pop(future)
+                    result['requests'] += 1
+                    try:
+                        route = future.result()
+                    except requests.RequestException as e:
+                        result['failed'] += 1
+                        logger.error(
+                            "Backfill: falha ao buscar %d devices de %s a %s: %s",
+                            len(device_ids), slice_start, slice_end, e,
+                        )
+                    else:
+                        self.store(vehicles, route, slice_start, slice_end, result, alarm_days, odometers, dry_run)
+                    report(result['requests'], len(tasks))
+
+        if not dry_run:
+            result['scores'] = ScoreService.recompute(alarm_days)
+            result['odometers'] = self.advance_odometers(odometers)
+        logger.info("Backfill do Traccar de %s a %s: %s", start, end, result)
+        return result
+
+    @staticmethod
+    def store(vehicles, route, start, end, result, alarm_days, odometers, dry_run=False):
+        """Deduplica uma resposta do /api/reports/route contra o histórico e grava o que falta"""
+        fresh = {}  # (vehicle_id, fix_time) -> (vehicle, pos)
+        fetched = 0
+        for pos in route:
+            vehicle = vehicles.get(pos.get('deviceId'))
+            if vehicle is None or pos.get('latitude') is None or pos.get('longitude') is None:
+                continue
+            fix_time = parse_fix_time(pos)
+            # O "to" do Traccar é inclusivo: a fatia seguinte fica com a borda
+            if not start <= fix_time < end:
+                continue
+            fetched += 1
+            fresh.setdefault((vehicle.id, fix_time), (vehicle, pos))
+            # Mesmo já gravado: permite refazer o score se uma execução anterior parou no meio
+            if (pos.get('attributes') or {}).get('alarm') in ScoreService.ALARMS:
+                alarm_days[fix_time.astimezone(dt_timezone.utc).date()].add(vehicle.id)
+        result['fetched'] += fetched
+        if not fresh:
+            return
+
+        fix_times = [fix_time for _, fix_time in fresh]
+        existing = set(
+            Position.objects.filter(
+                vehicle_id__in={vehicle_id for vehicle_id, _ in fresh},
+                fix_time__gte=min(fix_times), fix_time__lte=max(fix_times),
+            ).values_list('vehicle_id', 'fix_time')
+        )
+        received_at = timezone.now()
+        rows = [
+            position_row(vehicle, pos, received_at, key[1])
+            for key, (vehicle, pos) in fresh.items()
+            if key not in existing
+        ]
+        result['duplicates'] += fetched - len(rows)
+        if dry_run:
+            result['inserted'] += len(rows)
+            return
+
+        result['inserted'] += PositionHistoryService.write(rows)
+        for row in rows:
+            vehicle_id, odometer_km = row[1], row[11]
+            if odometer_km is not None and odometer_km > odometers.get(vehicle_id, 0):
+                odometers[vehicle_id] = odometer_km
+
+    @staticmethod
+    def advance_odometers(odometers):
+        """O hodômetro só cresce: grava o maior valor recuperado quando passa do atual"""
+        if not odometers:
+            return 0
+        current = dict(Vehicle.objects.filter(id__in=list(odometers)).values_list('id', 'current_km'))
+        vehicles = [
+            Vehicle(id=vehicle_id, current_km=odometer_km)
+            for vehicle_id, odometer_km in odometers.items()
+            if vehicle_id in current and odometer_km > current[vehicle_id]
+        ]
+        Vehicle.objects.bulk_update(vehicles, ['current_km'], batch_size=1000)
+        return len(vehicles)
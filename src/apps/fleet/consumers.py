@@ -1,9 +1,51 @@
 import json
+import msgpack
+from redis.exceptions import RedisError
 from channels.generic.websocket import AsyncWebsocketConsumer
+from apps.tenants.membership import get_membership_cache
+from .ingestion import ADMIN_GROUP, tenant_group_name
+from .live_state import LiveStateStore
+from .protocol import SUBPROTOCOL, BinaryFrameEncoder
+
+
+class Subscription:
+    """
+    Filtro de uma conexão: bbox do mapa e/ou lista de veículos.
+    Um veículo passa se estiver dentro da bbox OU na lista; sem filtro, tudo passa.
+    """
+    __slots__ = ('south', 'west', 'north', 'east', 'vehicle_ids')
+
+    def __init__(self, bbox=None, vehicle_ids=None):
+        self.south = self.west = self.north = self.east = None
+        if bbox:
+            self.south, self.west = float(bbox['south']), float(bbox['west'])
+            self.north, self.east = float(bbox['north']), float(bbox['east'])
+        self.vehicle_ids = {str(vehicle_id) for vehicle_id in vehicle_ids or ()}
+
+    @property
+    def is_empty(self):
+        return self.south is None and not self.vehicle_ids
+
+    def contains(self, lat, lng):
+        if self.south is None or lat is None or lng is None:
+            return False
+        if not self.south <= lat <= self.north:
+            return False
+        if self.west <= self.east:
+            return self.west <= lng <= self.east
+        return lng >= self.west or lng <= self.east  # bbox cruzando o antimeridiano
+
+    def accepts(self, payload):
+        return payload['id'] in self.vehicle_ids or self.contains(payload.get('lat'), payload.get('lng'))
+
 
 class FleetConsumer(AsyncWebsocketConsumer):
+    room_group_name = None
+    subscription = None
+    encoder = None  # BinaryFrameEncoder quando o cliente negocia o subprotocolo MessagePack
+
     async def connect(self):
-        # Pega o usuário logado (o AuthMiddlewareStack popula o scope['user'])
+        # Pega o usuário logado (sessão via AuthMiddlewareStack ou JWT via JWTAuthMiddleware)
         self.user = self.scope["user"]
 
         if self.user.is_anonymous:
@@ -12,10 +54,8 @@ class FleetConsumer(AsyncWebsocketConsumer):
 
         # Define o grupo baseado no Tenant do usuário
         # Se for superuser sem tenant, entra num grupo global 'admin_global'
-        if hasattr(self.user, 'profile') and self.user.profile.tenant:
-            self.room_group_name = f"tenant_{self.user.profile.tenant.id}"
-        else:
-            self.room_group_name = "admin_global"
+        self.tenant_id = await self.resolve_tenant_id()
+        self.room_group_name = tenant_group_name(self.tenant_id) if self.tenant_id else ADMIN_GROUP
 
         # Entra no grupo (sala)
         await self.channel_layer.group_add(
@@ -23,21 +63,126 @@ class FleetConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        # JSON continua o padrão; MessagePack com deltas só se o cliente pedir
+        if SUBPROTOCOL in self.scope.get('subprotocols', []):
+            self.encoder = BinaryFrameEncoder()
+            await self.accept(subprotocol=SUBPROTOCOL)
+        else:
+            await self.accept()
+
+        # Snapshot da frota logo após o accept (Redis, sem passar pelo Postgres)
+        await self.send_snapshot(keyframe=True)
+
+    async def resolve_tenant_id(self):
+        """
+        Tenant do JWT (claim tenant_id) quando houver; senão o perfil do usuário,
+        lido fora do event loop e guardado no cache curto de membros.
+        """
+        claims = self.scope.get('token_claims')
+        if claims and claims.get('tenant_id'):
+            return claims['tenant_id']
+        return await get_membership_cache().tenant_id_for(self.user)
 
     async def disconnect(self, close_code):
+        # Conexão recusada no connect (anônimo) não chegou a entrar em grupo
+        if self.room_group_name is None:
+            return
         # Sai do grupo
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
+    # Mensagens do cliente: {"action": "subscribe", "bbox": {...}, "vehicles": [...]} / {"action": "unsubscribe"}
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = msgpack.unpackb(bytes_data) if bytes_data else json.loads(text_data or '{}')
+        except ValueError:
+            return
+        if not isinstance(message, dict):
+            return
+
+        action = message.get('action')
+        if action == 'subscribe':
+            try:
+                subscription = Subscription(message.get('bbox'), message.get('vehicles'))
+            except (KeyError, TypeError, ValueError):
+                await self.send_json_or_binary({'type': 'error', 'data': 'bbox inválida'})
+                return
+            self.subscription = None if subscription.is_empty else subscription
+            # Veículos que entraram na nova área aparecem sem esperar a próxima posição
+            await self.send_snapshot()
+        elif action == 'unsubscribe':
+            self.subscription = None
+
+    async def send_snapshot(self, keyframe=False):
+        try:
+            snapshot = self.visible(await LiveStateStore().snapshot(self.tenant_id))
+        except RedisError:
+            snapshot = []
+        if self.encoder is not None:
+            frame = self.encoder.encode(snapshot, keyframe=keyframe)
+            if frame is not None:
+                await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=json.dumps({'type': 'snapshot', 'data': snapshot}))
+
+    async def send_json_or_binary(self, content):
+        if self.encoder is not None:
+            await self.send(bytes_data=msgpack.packb(content, use_bin_type=True))
+        else:
+            await self.send(text_data=json.dumps(content))
+
+    async def send_binary_updates(self, payloads):
+        frame = self.encoder.encode(payloads)
+        if frame is not None:
+            await self.send(bytes_data=frame)
+
+    def visible(self, payloads):
+        if self.subscription is None:
+            return payloads
+        return [payload for payload in payloads if self.subscription.accepts(payload)]
+
     # Recebe mensagem do Redis (via webhook) e manda para o WebSocket (Frontend)
     async def vehicle_update(self, event):
         message = event['message']
+        if not self.visible([message]):
+            return
+        if self.encoder is not None:
+            await self.send_binary_updates([message])
+            return
 
         # Envia para o WebSocket
         await self.send(text_data=json.dumps({
             'type': 'vehicle_update',
             'data': message
-        }))
\ No newline at end of file
+        }))
+
+    # Lote de atualizações (um frame por tick do fan-out)
+    async def vehicle_updates(self, event):
+        messages = self.visible(event['messages'])
+        if not messages:
+            return
+        if self.encoder is not None:
+            await self.send_binary_updates(messages)
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'vehicle_updates',
+            'data': messages
+        }))
+
+    # Progresso/resultado de uma otimização de rota em background (route_jobs)
+    async def route_progress(self, event):
+        await self.send_json_or_binary({'type': 'route_progress', 'data': event['message']})
+
+    # Chegadas e atendimentos de paradas (ArrivalDetector), um lote por mensagem
+    async def stop_events(self, event):
+        await self.send_json_or_binary({'type': 'stop_events', 'data': event['events']})
+
+    # ETAs ao vivo das paradas pendentes (EtaEngine), as rotas do tenant que mudaram
+    async def route_etas(self, event):
+        await self.send_json_or_binary({'type': 'route_etas', 'data': event['routes']})
+
+    # Entradas e saídas de cercas virtuais (GeofenceMonitor), um lote por mensagem
+    async def geofence_events(self, event):
+        await self.send_json_or_binary({'type': 'geofence_events', 'data': event['events']})
@@ -0,0 +1,252 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from apps.tenants.models import Tenant
+from .history import parse_fix_time
+
+KNOTS_TO_MS = 0.514444
+
+# Colunas dos limites e dos cooldowns, na mesma ordem
+EVENTS = ('hardAcceleration', 'hardBraking', 'hardCornering', 'overspeed')
+LIMIT_FIELDS = ('harsh_acceleration_limit', 'harsh_braking_limit', 'harsh_cornering_limit', 'overspeed_limit')
+
+
+class TrackState:
+    """
+    Estado por device em arrays (um slot por device, crescendo em dobro):
+    última amostra (horário, velocidade, rumo), se estava acima do limite e
+    o horário do último evento de cada tipo (e se foi detectado aqui ou
+    mandado pelo rastreador). ~55 bytes por device fora o dict deviceId -> slot.
+    """
+
+    __slots__ = ('slots', 'size', 'time', 'speed', 'course', 'speeding', 'last_event', 'server_event')
+
+    ARRAYS = ('time', 'speed', 'course', 'speeding', 'last_event', 'server_event')
+
+    def __init__(self, capacity=1024):
+        self.slots = {}
+        self.size = 0
+        self.time = np.zeros(capacity)  # 0 = ainda sem amostra
+        self.speed = np.zeros(capacity, dtype=np.float32)
+        self.course = np.full(capacity, np.nan, dtype=np.float32)
+        self.speeding = np.zeros(capacity, dtype=bool)
+        self.last_event = np.full((capacity, len(EVENTS)), -np.inf)
+        self.server_event = np.zeros((capacity, len(EVENTS)), dtype=bool)
+
+    def lookup(self, device_ids):
+        rows = np.empty(len(device_ids), dtype=np.int64)
+        for index, device_id in enumerate(device_ids):
+            slot = self.slots.get(device_id)
+            if slot is None:
+                slot = self.slots[device_id] = self.size
+                self.size += 1
+            rows[index] = slot
+        if self.size > len(self.time):
+            self.grow(max(self.size, 2 * len(self.time)))
+        return rows
+
+    def grow(self, capacity):
+        for name, fill in (
+            ('time', 0), ('speed', 0), ('course', np.nan), ('speeding', False), ('last_event', -np.inf), ('server_event', False),
+        ):
+            current = getattr(self, name)
+            grown = np.full((capacity,) + current.shape[1:], fill, dtype=current.dtype)
+            grown[:len(current)] = current
+            setattr(self, name, grown)
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def save(self, rows):
+        return {name: getattr(self, name)[rows].copy() for name in self.ARRAYS}
+
+    def load(self, rows, saved):
+        for name in self.ARRAYS:
+            getattr(self, name)[rows] = saved[name]
+
+
+class TrackCheckpoint:
+    """Estado dos devices de um lote antes do detect (HarshEventDetector.checkpoint)"""
+
+    __slots__ = ('rows', 'saved', 'after')
+
+    def __init__(self, rows, saved):
+        self.rows = rows
+        self.saved = saved
+        self.after = None  # state.time dos devices logo depois do detect
+
+
+class HarshEventDetector:
+    """
+    Detecta na telemetria os alarmes de score que o rastreador não manda
+    (attributes.alarm): aceleração e freada pela variação de velocidade,
+    curva pela aceleração lateral (velocidade x taxa de mudança do rumo) e
+    excesso de velocidade ao cruzar o limite do tenant.
+    O lote inteiro é calculado de uma vez com NumPy, comparando cada posição
+    com a anterior do mesmo device (do próprio lote ou do TrackState).
+    Pares com mais de MAX_GAP segundos não geram evento de aceleração/curva
+    (a média de um intervalo longo não diz nada), e cada tipo respeita um
+    cooldown por device que vale nos dois sentidos entre a detecção daqui e
+    os alarmes do próprio rastreador: a detecção logo depois de um alarme
+    do rastreador não é gerada, e o alarme do rastreador logo depois de um
+    evento detectado aqui volta como suprimido. O mesmo evento não é
+    contado duas vezes.
+    Só detecta nos tenants com harsh_event_detection ligado (opt-in); nos
+    outros apenas acompanha os alarmes do rastreador.
+    O estado é do processo; com vários telemetry_worker cada um vê parte das
+    posições de um device, o que só reduz a detecção (nunca a infla).
+    """
+
+    MAX_GAP = 15.0  # segundos
+    MIN_CORNER_SPEED = 20 / 3.6  # m/s; abaixo disso o rumo do GPS é ruído
+    TENANT_TTL = 60  # segundos de cache dos limites do tenant
+
+    def __init__(self, cooldown=None):
+        self.cooldown = settings.HARSH_EVENT_COOLDOWN if cooldown is None else cooldown
+        self.state = TrackState()
+        self._tenants = {}  # tenant_id -> (expira em, limites)
+        self._lock = threading.Lock()
+
+    def tenant_limits(self, tenant_ids):
+        """
+        Limites [aceleração, freada, curva, velocidade] por tenant; 0 desliga
+        (vira infinito), assim como o tenant sem harsh_event_detection.
+        """
+        now = time.monotonic()
+        missing = [tenant_id for tenant_id in tenant_ids if self._tenants.get(tenant_id, (0,))[0] < now]
+        if missing:
+            for tenant_id, enabled, *limits in Tenant.objects.filter(id__in=missing).values_list(
+                'id', 'harsh_event_detection', *LIMIT_FIELDS,
+            ):
+                limits = np.array([limit if enabled and limit and limit > 0 else np.inf for limit in limits])
+                self._tenants[str(tenant_id)] = (now + self.TENANT_TTL, limits)
+        disabled = np.full(len(EVENTS), np.inf)
+        return {tenant_id: self._tenants.get(tenant_id, (0, disabled))[1] for tenant_id in tenant_ids}
+
+    def checkpoint(self, updates):
+        """
+        Guarda o estado dos devices do lote antes do detect. Se o lote falhar
+        antes de contar nos scores, restore() volta a ele: sem isso o
+        reprocessamento (telemetry_worker) veria as posições como já vistas
+        e perderia os eventos e os alarmes delas.
+        """
+        device_ids = list({vehicle.traccar_device_id for vehicle, pos, _ in updates if pos.get('speed') is not None})
+        with self._lock:
+            rows = self.state.lookup(device_ids)
+            return TrackCheckpoint(rows, self.state.save(rows))
+
+    def restore(self, checkpoint):
+        """
+        Volta os devices do checkpoint ao estado anterior ao detect, menos os
+        que outro lote já avançou depois dele.
+        """
+        with self._lock:
+            rows = checkpoint.rows
+            if checkpoint.after is not None:
+                unchanged = self.state.time[rows] == checkpoint.after
+                rows = rows[unchanged]
+                saved = {name: values[unchanged] for name, values in checkpoint.saved.items()}
+            else:
+                saved = checkpoint.saved
+            self.state.load(rows, saved)
+
+    def detect(self, updates, checkpoint=None):
+        """
+        updates: [(vehicle, pos, attributes)] do lote (vehicle.traccar_device_id
+        preenchido). Devolve (detectados, suprimidos), listas de (índice em
+        updates, alarme) na ordem do lote: suprimidos são alarmes do rastreador
+        dentro do cooldown de um evento já detectado aqui.
+        checkpoint: o de checkpoint(updates), marcado para o restore().
+        """
+        samples = [
+            (index, vehicle, pos, attributes)
+            for index, (vehicle, pos, attributes) in enumerate(updates)
+            if pos.get('speed') is not None
+        ]
+        if not samples:
+            return [], []
+        tenant_ids = [str(vehicle.tenant_id) for _, vehicle, _, _ in samples]
+        limits_by_tenant = self.tenant_limits(set(tenant_ids))
+        limits = np.array([limits_by_tenant[tenant_id] for tenant_id in tenant_ids])
+        with self._lock:
+            result = self._detect(samples, limits)
+            if checkpoint is not None:
+                checkpoint.after = self.state.time[checkpoint.rows].copy()
+            return result
+
+    def _detect(self, samples, limits):
+        state = self.state
+        index = np.array([sample[0] for sample in samples])
+        rows = state.lookup([vehicle.traccar_device_id for _, vehicle, _, _ in samples])
+        t = np.array([parse_fix_time(pos).timestamp() for _, _, pos, _ in samples])
+        v = np.array([pos['speed'] for _, _, pos, _ in samples], dtype=float) * KNOTS_TO_MS
+        c = np.array([pos.get('course', np.nan) for _, _, pos, _ in samples], dtype=float)
+        reported = np.array([
+            EVENTS.index(attributes['alarm']) if attributes.get('alarm') in EVENTS else -1
+            for _, _, _, attributes in samples
+        ])
+
+        # Por device e horário; o que é mais velho que a última amostra (ou repetido) fica de fora
+        order = np.lexsort((t, rows))
+        rows, t, v, c, index, limits, reported = (a[order] for a in (rows, t, v, c, index, limits, reported))
+        keep = t > state.time[rows]
+        keep[1:] &= (rows[1:] != rows[:-1]) | (t[1:] != t[:-1])
+        rows, t, v, c, index, limits, reported = (a[keep] for a in (rows, t, v, c, index, limits, reported))
+        if not len(rows):
+            return [], []
+
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = rows[1:] != rows[:-1]
+        prev_t, prev_v, prev_c = np.roll(t, 1), np.roll(v, 1), np.roll(c, 1)
+        prev_t[first], prev_v[first], prev_c[first] = state.time[rows[first]], state.speed[rows[first]], state.course[rows[first]]
+
+        dt = t - prev_t
+        paired = (prev_t > 0) & (dt <= self.MAX_GAP)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            accel = np.where(paired, (v - prev_v) / dt, 0.0)
+            turn = np.radians((c - prev_c + 180) % 360 - 180)
+            lateral = np.where(
+                paired & (np.minimum(v, prev_v) >= self.MIN_CORNER_SPEED), np.abs(turn) / dt * (v + prev_v) / 2, 0.0,
+            )
+        speeding = v * 3.6 > limits[:, 3]
+        was_speeding = np.roll(speeding, 1)
+        was_speeding[first] = state.speeding[rows[first]]
+
+        hits = np.column_stack([
+            accel >= limits[:, 0],
+            -accel >= limits[:, 1],
+            np.nan_to_num(lateral) >= limits[:, 2],
+            speeding & ~was_speeding,
+        ])
+        has_report = reported >= 0
+        hits[has_report, reported[has_report]] = True
+
+        # Cooldown em sequência (eventos são raros): por device e horário, nos dois sentidos
+        detected, suppressed = [], []
+        for position, column in np.argwhere(hits):
+            row = rows[position]
+            own = reported[position] == column
+            recent = t[position] - state.last_event[row, column] < self.cooldown
+            if own:
+                if recent and state.server_event[row, column]:
+                    suppressed.append((int(index[position]), EVENTS[column]))
+                    continue
+            elif recent:
+                continue
+            state.last_event[row, column] = t[position]
+            state.server_event[row, column] = not own
+            if not own:
+                detected.append((int(index[position]), EVENTS[column]))
+
+        last = np.ones(len(rows), dtype=bool)
+        last[:-1] = rows[:-1] != rows[1:]
+        state.time[rows[last]] = t[last]
+        state.speed[rows[last]] = v[last]
+        state.course[rows[last]] = c[last]
+        state.speeding[rows[last]] = speeding[last]
+        detected.sort()
+        suppressed.sort()
+        return detected, suppressed
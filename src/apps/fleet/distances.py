@@ -0,0 +1,226 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import requests
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from apps.core.redis_client import get_redis
+from .optimization import distance_matrix
+
+logger = logging.getLogger(__name__)
+
+COORDINATE_DECIMALS = 5  # ~1 m: o mesmo cliente geocodificado duas vezes cai na mesma chave
+
+
+class HaversineProvider:
+    """Distância em linha reta; calcular a matriz custa menos que buscá-la no Redis"""
+
+    key = 'haversine'
+    cacheable = False
+
+    def matrix(self, lats, lngs):
+        return distance_matrix(lats, lngs)
+
+
+class OsrmProvider:
+    """
+    Distância por ruas num servidor compatível com o serviço table do OSRM
+    (GET /table/v1/{perfil}/{lng,lat;...}?annotations=distance).
+    A matriz é pedida em blocos de no máximo table_size coordenadas (o
+    --max-table-size do osrm-routed). Os otimizadores (2-opt invertendo
+    trechos) supõem distâncias simétricas, então cada par recebe a média
+    das duas direções; pares sem rota ficam com a distância em linha reta.
+    """
+
+    cacheable = True
+
+    def __init__(self, base_url=None, profile=None, table_size=None, timeout=None, session=None):
+        self.base_url = (base_url or settings.OSRM_BASE_URL).rstrip('/')
+        self.profile = profile or settings.OSRM_PROFILE
+        self.table_size = max(table_size or settings.OSRM_TABLE_SIZE, 2)
+        self.timeout = timeout or settings.OSRM_TIMEOUT
+        self.session = session or requests.Session()
+        self.key = f"osrm:{self.base_url}:{self.profile}"
+        self.requests = 0
+
+    def matrix(self, lats, lngs):
+        lats, lngs = np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float)
+        n = len(lats)
+        result = np.empty((n, n))
+        block = self.table_size // 2 if n > self.table_size else n
+        for row in range(0, n, block):
+            sources = np.arange(row, min(row + block, n))
+            for column in range(0, n, block):
+                destinations = np.arange(column, min(column + block, n))
+                result[np.ix_(sources, destinations)] = self.table(lats, lngs, sources, destinations)
+        missing = ~np.isfinite(result)
+        if missing.any():
+            result[missing] = distance_matrix(lats, lngs)[missing]
+        np.fill_diagonal(result, 0.0)
+        return (result + result.T) / 2
+
+    def table(self, lats, lngs, sources, destinations):
+        """Bloco sources x destinations em km (NaN onde não há rota)"""
+        same = len(sources) == len(destinations) and (sources == destinations).all()
+        points = sources if same else np.concatenate([sources, destinations])
+        coordinates = ';'.join(f"{lngs[index]:.{COORDINATE_DECIMALS}f},{lats[index]:.{COORDINATE_DECIMALS}f}" for index in points)
+        params = {'annotations': 'distance'}
+        if not same:
+            params['sources'] = ';'.join(str(index) for index in range(len(sources)))
+            params['destinations'] = ';'.join(str(index) for index in range(len(sources), len(points)))
+        response = self.session.get(
+            f"{self.base_url}/table/v1/{self.profile}/{coordinates}", params=params, timeout=self.timeout,
+        )
+        response.raise_for_status()
+        data = response.json()
+        if data.get('code') != 'Ok':
+            raise requests.RequestException(f"OSRM respondeu {data.get('code')}: {data.get('message', '')}")
+        self.requests += 1
+        return np.array(data['distances'], dtype=float) / 1000  # None (sem rota) vira NaN
+
+
+class DistanceCache:
+    """
+    Matrizes de distância endereçadas pelo conteúdo: a chave é o hash do
+    provedor e das coordenadas (arredondadas) em ordem canônica, então o
+    mesmo conjunto de pontos em qualquer ordem reaproveita a matriz (a
+    rota otimizada de novo, o plano em dry_run e depois gravado).
+    Dois níveis: LRU local limitado em bytes e Redis (float32, expira em
+    ttl), com um sorted set de último acesso que limita o número de
+    matrizes e despeja as menos usadas. Falha de Redis ou do provedor não
+    derruba a otimização: cai para o nível seguinte ou para o haversine.
+    """
+
+    KEY = "fleet:distances:{digest}"
+    INDEX_KEY = "fleet:distances:lru"
+
+    def __init__(self, provider=None, local_bytes=None, max_entries=None, ttl=None, client=None):
+        self.provider = provider or get_distance_provider()
+        self.local_bytes = local_bytes if local_bytes is not None else settings.DISTANCE_CACHE_LOCAL_MB * 1024 * 1024
+        self.max_entries = max_entries if max_entries is not None else settings.DISTANCE_CACHE_MAX_ENTRIES
+        self.ttl = ttl if ttl is not None else settings.DISTANCE_CACHE_TTL
+        self._client = client
+        self._local = OrderedDict()  # digest -> matriz canônica (float32)
+        self._local_size = 0
+        self._lock = threading.Lock()
+        self.counters = {'local_hits': 0, 'redis_hits': 0, 'misses': 0, 'provider_errors': 0}
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def matrix(self, lats, lngs):
+        """Matriz n x n em km na ordem dos pontos recebidos"""
+        lats = np.round(np.asarray(lats, dtype=float), COORDINATE_DECIMALS)
+        lngs = np.round(np.asarray(lngs, dtype=float), COORDINATE_DECIMALS)
+        if len(lats) < 2:
+            return np.zeros((len(lats), len(lats)))
+        if not self.provider.cacheable:
+            return self.provider.matrix(lats, lngs)
+
+        order = np.lexsort((lngs, lats))
+        digest = hashlib.sha1(
+            self.provider.key.encode() + np.stack([lats[order], lngs[order]]).tobytes()
+        ).hexdigest()
+        canonical = self._get(digest, len(lats))
+        if canonical is None:
+            try:
+                canonical = self.provider.matrix(lats[order], lngs[order]).astype(np.float32)
+            except requests.RequestException as e:
+                self.counters['provider_errors'] += 1
+                logger.warning("Provedor de distâncias %s indisponível, usando haversine: %s", self.provider.key, e)
+                return distance_matrix(lats, lngs)
+            self._set(digest, canonical)
+
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        return canonical[np.ix_(rank, rank)].astype(float)
+
+    def _get(self, digest, n):
+        with self._lock:
+            canonical = self._local.get(digest)
+            if canonical is not None:
+                self._local.move_to_end(digest)
+                self.counters['local_hits'] += 1
+                return canonical
+        key = self.KEY.format(digest=digest)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.zadd(self.INDEX_KEY, {key: time.time()}, xx=True)
+            raw, _ = pipe.execute()
+        except RedisError:
+            logger.warning("Redis indisponível para o cache de distâncias")
+            raw = None
+        if raw is None or len(raw) != n * n * 4:
+            self.counters['misses'] += 1
+            return None
+        self.counters['redis_hits'] += 1
+        canonical = np.frombuffer(raw, dtype=np.float32).reshape(n, n)
+        self._remember(digest, canonical)
+        return canonical
+
+    def _set(self, digest, canonical):
+        self._remember(digest, canonical)
+        key = self.KEY.format(digest=digest)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.set(key, canonical.tobytes(), ex=self.ttl)
+            pipe.zadd(self.INDEX_KEY, {key: time.time()})
+            pipe.zcard(self.INDEX_KEY)
+            *_, size = pipe.execute()
+            if size > self.max_entries:
+                evicted = [member for member, _ in self.client.zpopmin(self.INDEX_KEY, size - self.max_entries)]
+                if evicted:
+                    self.client.delete(*evicted)
+        except RedisError:
+            logger.warning("Redis indisponível para o cache de distâncias")
+
+    def _remember(self, digest, canonical):
+        if canonical.nbytes > self.local_bytes:
+            return
+        with self._lock:
+            if digest in self._local:
+                return
+            self._local[digest] = canonical
+            self._local_size += canonical.nbytes
+            while self._local_size > self.local_bytes:
+                _, evicted = self._local.popitem(last=False)
+                self._local_size -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+            self._local_size = 0
+
+    def stats(self):
+        with self._lock:
+            data = dict(self.counters, local_entries=len(self._local), local_bytes=self._local_size)
+        lookups = data['local_hits'] + data['redis_hits'] + data['misses']
+        data['hit_rate'] = round((data['local_hits'] + data['redis_hits']) / lookups, 4) if lookups else None
+        return data
+
+
+PROVIDERS = {
+    'haversine': HaversineProvider,
+    'osrm': OsrmProvider,
+}
+
+
+def get_distance_provider():
+    return PROVIDERS[settings.DISTANCE_PROVIDER]()
+
+
+_cache = None
+
+
+def get_distance_cache():
+    global _cache
+    if _cache is None:
+        _cache = DistanceCache()
+    return _cache
@@ -0,0 +1,437 @@
+import json
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from apps.core.redis_client import get_redis
+from .arrivals import active_routes, distance_m
+from .distances import get_distance_cache
+from .history import parse_fix_time
+from .models import RouteStop
+
+logger = logging.getLogger(__name__)
+
+KNOTS_TO_KMH = 1.852
+MIN_SPEED_KMH = 5.0  # piso da velocidade suavizada: parado no trânsito não vira ETA infinito
+
+
+@lru_cache(maxsize=64)
+def day_prefix(day):
+    return datetime.fromtimestamp(day * 86400, tz=dt_timezone.utc).strftime('%Y-%m-%dT')
+
+
+def isoformat(t):
+    """Epoch -> ISO 8601 UTC ao segundo; formatado à mão porque é chamado uma vez por parada a cada publicação"""
+    day, second = divmod(round(t), 86400)
+    hour, second = divmod(second, 3600)
+    minute, second = divmod(second, 60)
+    return f"{day_prefix(day)}{hour:02d}:{minute:02d}:{second:02d}+00:00"
+
+
+def epoch(day, moment):
+    """Horário (TimeField) no dia da rota, no fuso do projeto, em segundos epoch"""
+    if moment is None:
+        return None
+    return timezone.make_aware(datetime.combine(day, moment)).timestamp()
+
+
+def pending_stops(route_ids):
+    """
+    {route_id: [(stop_id, lat, lng, serviço (s), início da janela, fim da
+    janela, chegada)]} das paradas PENDING na ordem da rota, numa query só;
+    horários em epoch (None quando vazios).
+    """
+    stops = defaultdict(list)
+    for stop_id, route_id, lat, lng, service, window_start, window_end, arrival, day in RouteStop.objects.filter(
+        route_id__in=route_ids, status='PENDING',
+    ).order_by('route_id', 'sequence').values_list(
+        'id', 'route_id', 'latitude', 'longitude', 'service_minutes', 'window_start', 'window_end',
+        'arrival_time', 'route__date',
+    ):
+        stops[str(route_id)].append((
+            str(stop_id), lat, lng, service * 60, epoch(day, window_start), epoch(day, window_end),
+            arrival.timestamp() if arrival else None,
+        ))
+    return stops
+
+
+class RouteEta:
+    """
+    Trechos restantes de uma rota em andamento. As distâncias entre paradas
+    consecutivas (legs, km) começam em linha reta e são trocadas pelas da
+    matriz do DistanceCache (apply_distances) quando ela chega, fora do
+    caminho da ingestão; a cada posição só o trecho do veículo até a próxima
+    parada muda, estimado em linha reta vezes o fator de desvio da própria
+    rota (km dos legs / km em linha reta entre as mesmas paradas).
+    """
+
+    __slots__ = (
+        'route_id', 'vehicle_id', 'tenant_id', 'version', 'stop_ids', 'coords', 'legs', 'service',
+        'window_start', 'window_end', 'arrived', 'detour', 'position', 'position_time', 'next_publish',
+    )
+
+    def __init__(self, route_id, vehicle_id, tenant_id, version, stops):
+        self.route_id = route_id
+        self.vehicle_id = vehicle_id
+        self.tenant_id = tenant_id
+        self.version = version
+        self.stop_ids = [stop[0] for stop in stops]
+        self.coords = [(stop[1], stop[2]) for stop in stops]
+        self.service = [stop[3] for stop in stops]
+        self.window_start = [stop[4] for stop in stops]
+        self.window_end = [stop[5] for stop in stops]
+        self.arrived = {stop[0]: stop[6] for stop in stops if stop[6] is not None}
+
+        self.legs = [distance_m(*a, *b) / 1000 for a, b in zip(self.coords, self.coords[1:])]
+        self.detour = 1.0
+        self.position = None
+        self.position_time = None
+        self.next_publish = 0.0
+
+    def apply_distances(self, stop_ids, matrix):
+        """
+        Legs e fator de desvio pela matriz das paradas stop_ids (as da rota
+        quando a matriz foi pedida). Paradas atendidas nesse meio tempo só
+        somem da lista; se a rota ganhou parada que a matriz não tem,
+        devolve False e os legs ficam como estão.
+        """
+        position = {stop_id: index for index, stop_id in enumerate(stop_ids)}
+        indexes = [position.get(stop_id) for stop_id in self.stop_ids]
+        if None in indexes:
+            return False
+        self.legs = [float(matrix[a, b]) for a, b in zip(indexes, indexes[1:])]
+        straight = sum(distance_m(*a, *b) / 1000 for a, b in zip(self.coords, self.coords[1:]))
+        self.detour = max(sum(self.legs) / straight, 1.0) if straight > 0 else 1.0
+        return True
+
+    def refresh(self, stops):
+        """
+        Aplica as paradas relidas do banco sem buscar distâncias de novo
+        quando elas são uma subsequência das atuais (paradas atendidas ou
+        com chegada gravada). Devolve False se a rota mudou de verdade
+        (parada nova, reordenada ou movida) e precisa ser remontada.
+        """
+        position = {stop_id: index for index, stop_id in enumerate(self.stop_ids)}
+        indexes = [position.get(stop[0]) for stop in stops]
+        if None in indexes or indexes != sorted(indexes):
+            return False
+        if any(self.coords[index] != (stop[1], stop[2]) for index, stop in zip(indexes, stops)):
+            return False
+        for stop_id in set(self.stop_ids) - {stop[0] for stop in stops}:
+            self.drop(stop_id)
+        self.service = [stop[3] for stop in stops]
+        self.window_start = [stop[4] for stop in stops]
+        self.window_end = [stop[5] for stop in stops]
+        self.arrived = {stop[0]: stop[6] for stop in stops if stop[6] is not None}
+        return True
+
+    def drop(self, stop_id):
+        try:
+            index = self.stop_ids.index(stop_id)
+        except ValueError:
+            return
+        if 0 < index < len(self.stop_ids) - 1:
+            # Parada do meio atendida fora de ordem: o trecho novo entre a anterior e a seguinte é estimado
+            previous, following = self.coords[index - 1], self.coords[index + 1]
+            self.legs[index - 1] = distance_m(*previous, *following) / 1000 * self.detour
+            del self.legs[index]
+        elif self.legs:
+            del self.legs[0 if index == 0 else -1]
+        for values in (self.stop_ids, self.coords, self.service, self.window_start, self.window_end):
+            del values[index]
+        self.arrived.pop(stop_id, None)
+
+    def snapshot(self, speed_kmh, average_kmh):
+        """
+        ETA de cada parada pendente. O trecho até a próxima parada usa a
+        velocidade suavizada do veículo; os seguintes, a velocidade média do
+        planejamento (ROUTE_AVERAGE_SPEED_KMH). Chegar antes da janela espera
+        o início dela; cada parada soma o tempo de serviço.
+        """
+        clock = self.position_time
+        head_km = distance_m(*self.position, *self.coords[0]) / 1000 * self.detour if self.stop_ids else 0.0
+        stops = []
+        for index, stop_id in enumerate(self.stop_ids):
+            arrival = self.arrived.get(stop_id)
+            if arrival is None:
+                if index == 0:
+                    arrival = clock + head_km / speed_kmh * 3600
+                else:
+                    arrival = clock + self.legs[index - 1] / average_kmh * 3600
+            window_start, window_end = self.window_start[index], self.window_end[index]
+            start = arrival if window_start is None else max(arrival, window_start)
+            # Ainda na parada depois do tempo de serviço previsto: só sai a partir de agora
+            clock = max(start + self.service[index], self.position_time)
+            stops.append({
+                'stop_id': stop_id,
+                'eta': isoformat(arrival),
+                'arrived': stop_id in self.arrived,
+                'late': window_end is not None and arrival > window_end,
+            })
+        return {
+            'route_id': self.route_id,
+            'vehicle_id': self.vehicle_id,
+            'position_time': isoformat(self.position_time),
+            'speed_kmh': round(speed_kmh, 1),
+            'remaining_km': round(head_km + sum(self.legs), 2),
+            'finish_eta': isoformat(clock),
+            'stops': stops,
+        }
+
+
+class EtaEngine:
+    """
+    ETA ao vivo das paradas pendentes das rotas IN_PROGRESS.
+    As rotas ficam em memória (RouteEta) e são recarregadas como no
+    ArrivalDetector: uma query a cada STOP_ARRIVAL_REFRESH_SECONDS compara as
+    versões e só as rotas alteradas são relidas; parada atendida só encurta
+    a lista, sem buscar distâncias de novo. Uma posição custa O(1): guarda a
+    posição nas rotas do veículo e atualiza a média móvel exponencial da
+    velocidade (janela LIVE_ETA_SPEED_SMOOTHING_SECONDS; parado numa entrega
+    não conta). Os ETAs só são materializados na publicação, no máximo a cada
+    LIVE_ETA_PUBLISH_INTERVAL segundos por rota (já na hora quando uma parada
+    chega ou é atendida): ficam no Redis para o endpoint routes/{id}/eta/ e
+    vão ao WebSocket do tenant como route_etas.
+    A matriz de distâncias de uma rota nova pode ir ao OSRM (até OSRM_TIMEOUT
+    por bloco): quem busca é uma thread própria, sem segurar o lock, e a
+    rota usa os trechos em linha reta até ela chegar.
+    """
+
+    KEY = "fleet:eta:{route_id}"
+    TTL = 15 * 60  # veículo sem posições: o ETA some em vez de ficar congelado
+
+    def __init__(self, smoothing=None, publish_interval=None, refresh=None, client=None):
+        self.average_speed = settings.ROUTE_AVERAGE_SPEED_KMH
+        self.smoothing = settings.LIVE_ETA_SPEED_SMOOTHING_SECONDS if smoothing is None else smoothing
+        self.publish_interval = settings.LIVE_ETA_PUBLISH_INTERVAL if publish_interval is None else publish_interval
+        self.refresh_interval = settings.STOP_ARRIVAL_REFRESH_SECONDS if refresh is None else refresh
+        self._client = client
+        self.routes = {}  # route_id -> RouteEta
+        self.by_vehicle = {}  # vehicle_id -> [RouteEta]
+        self.speeds = {}  # vehicle_id -> [horário do fix, km/h suavizado]
+        self.dirty = set()  # rotas com posição ou parada nova desde a última publicação
+        self.unmeasured = {}  # route_id -> RouteEta ainda com os trechos em linha reta
+        self.next_refresh = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    # --- rotas ---
+
+    def refresh(self):
+        active = active_routes()
+        changed = [
+            route_id for route_id, (vehicle_id, _, version) in active.items()
+            if route_id not in self.routes
+            or (self.routes[route_id].vehicle_id, self.routes[route_id].version) != (vehicle_id, version)
+        ]
+        self.load(active, pending_stops(changed) if changed else {})
+
+    def load(self, active, stops):
+        """active: {route_id: (vehicle_id, tenant_id, versão)}; stops: pending_stops() das rotas novas/alteradas"""
+        routes = {}
+        for route_id, (vehicle_id, tenant_id, version) in active.items():
+            route = self.routes.get(route_id)
+            if route is None or (route_id in stops and not route.refresh(stops[route_id])):
+                route = RouteEta(route_id, vehicle_id, tenant_id, version, stops.get(route_id, []))
+                self.dirty.add(route_id)
+                if len(route.stop_ids) >= 2:
+                    self.unmeasured[route_id] = route
+            elif route_id in stops:
+                self.dirty.add(route_id)
+            route.vehicle_id, route.version = vehicle_id, version
+            routes[route_id] = route
+        by_vehicle = defaultdict(list)
+        for route in routes.values():
+            by_vehicle[route.vehicle_id].append(route)
+
+        removed = [route_id for route_id in self.routes if route_id not in routes]
+        self.routes = routes
+        self.by_vehicle = dict(by_vehicle)
+        self.speeds = {vehicle_id: speed for vehicle_id, speed in self.speeds.items() if vehicle_id in by_vehicle}
+        self.dirty &= routes.keys()
+        self.unmeasured = {route_id: route for route_id, route in self.unmeasured.items() if routes.get(route_id) is route}
+        if removed:
+            try:
+                self.client.delete(*[self.KEY.format(route_id=route_id) for route_id in removed])
+            except RedisError:
+                logger.warning("Não foi possível remover o ETA de %d rotas encerradas", len(removed))
+
+    def apply_stop_events(self, events):
+        """Eventos do ArrivalDetector do mesmo lote: a rota muda sem esperar a próxima recarga"""
+        with self._lock:
+            for event in events:
+                route = self.routes.get(event['route_id'])
+                if route is None:
+                    continue
+                if event['event'] == 'arrived':
+                    route.arrived[event['stop_id']] = datetime.fromisoformat(event['time']).timestamp()
+                else:
+                    route.drop(event['stop_id'])
+                route.next_publish = 0.0
+                self.dirty.add(route.route_id)
+
+    # --- posições ---
+
+    def update(self, updates):
+        """updates: [(vehicle, pos, attributes)] do lote"""
+        with self._lock:
+            if time.monotonic() >= self.next_refresh:
+                self.refresh()
+                self.next_refresh = time.monotonic() + self.refresh_interval
+            if self.unmeasured and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="fleet-eta-distances", daemon=True)
+                self._thread.start()
+            if not self.by_vehicle:
+                return
+            for vehicle, pos, attributes in updates:
+                vehicle_id = str(vehicle.id)
+                routes = self.by_vehicle.get(vehicle_id)
+                lat, lng = pos.get('latitude'), pos.get('longitude')
+                if routes is None or lat is None or lng is None:
+                    continue
+                t = parse_fix_time(pos).timestamp()
+                speed = self.speeds.get(vehicle_id)
+                if speed is None:
+                    speed = self.speeds[vehicle_id] = [t, self.average_speed]
+                elif t <= speed[0]:
+                    continue  # fora de ordem
+                elif not any(route.arrived for route in routes):
+                    alpha = 1 - math.exp(-(t - speed[0]) / self.smoothing)
+                    speed[1] += alpha * ((pos.get('speed') or 0) * KNOTS_TO_KMH - speed[1])
+                speed[0] = t
+                for route in routes:
+                    route.position = (lat, lng)
+                    route.position_time = t
+                    self.dirty.add(route.route_id)
+
+    # --- distâncias ---
+
+    def measure(self):
+        """
+        Busca as matrizes das rotas em self.unmeasured (fora do lock) e troca
+        os legs das que continuam carregadas. Falha do DistanceCache deixa a
+        rota em linha reta. Devolve quantas rotas foram medidas.
+        """
+        with self._lock:
+            pending = [(route, list(route.stop_ids), list(route.coords)) for route in self.unmeasured.values()]
+            self.unmeasured = {}
+        measured = 0
+        for route, stop_ids, coords in pending:
+            try:
+                matrix = get_distance_cache().matrix([lat for lat, _ in coords], [lng for _, lng in coords])
+            except Exception:
+                logger.exception("Não foi possível buscar as distâncias da rota %s", route.route_id)
+                continue
+            with self._lock:
+                if self.routes.get(route.route_id) is route and route.apply_distances(stop_ids, matrix):
+                    route.next_publish = 0.0
+                    self.dirty.add(route.route_id)
+                    measured += 1
+        return measured
+
+    def _run(self):
+        while True:
+            try:
+                self.measure()
+            except Exception:
+                logger.exception("Falha ao buscar as distâncias das rotas")
+            with self._lock:
+                if not self.unmeasured:
+                    self._thread = None
+                    return
+
+    def snapshot(self, route):
+        speed = self.speeds.get(route.vehicle_id)
+        speed_kmh = max(speed[1], MIN_SPEED_KMH) if speed else self.average_speed
+        return dict(route.snapshot(speed_kmh, self.average_speed), computed_at=timezone.now().isoformat())
+
+    def publish(self):
+        """
+        Materializa os ETAs das rotas alteradas cujo intervalo venceu, grava no
+        Redis e envia route_etas ao grupo de cada tenant. Devolve quantas rotas.
+        """
+        from .ingestion import tenant_group_name
+
+        now = time.monotonic()
+        by_tenant = defaultdict(list)
+        with self._lock:
+            for route_id in list(self.dirty):
+                route = self.routes[route_id]
+                if route.position_time is None or now < route.next_publish:
+                    continue
+                route.next_publish = now + self.publish_interval
+                self.dirty.discard(route_id)
+                by_tenant[route.tenant_id].append(self.snapshot(route))
+        if not by_tenant:
+            return 0
+
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for snapshots in by_tenant.values():
+                for snapshot in snapshots:
+                    pipe.set(self.KEY.format(route_id=snapshot['route_id']), json.dumps(snapshot), ex=self.TTL)
+            pipe.execute()
+        except RedisError:
+            logger.warning("Não foi possível gravar os ETAs no Redis")
+        channel_layer = get_channel_layer()
+        for tenant_id, snapshots in by_tenant.items():
+            try:
+                async_to_sync(channel_layer.group_send)(
+                    tenant_group_name(tenant_id), {"type": "route_etas", "routes": snapshots},
+                )
+            except Exception:
+                logger.warning("Não foi possível publicar os ETAs do tenant %s", tenant_id, exc_info=True)
+        return sum(len(snapshots) for snapshots in by_tenant.values())
+
+    # --- leitura ---
+
+    def get(self, route_id):
+        """
+        ETA de uma rota: da memória, se este processo faz a ingestão dela, ou
+        do que a ingestão publicou no Redis; None se não houver. RedisError sobe.
+        """
+        with self._lock:
+            route = self.routes.get(str(route_id))
+            if route is not None and route.position_time is not None:
+                return self.snapshot(route)
+        raw = self.client.get(self.KEY.format(route_id=route_id))
+        return json.loads(raw) if raw else None
+
+    def estimate(self, route):
+        """Sem ETA ao vivo: a partir da última posição gravada do veículo, na velocidade média"""
+        vehicle = route.vehicle
+        if vehicle is None or vehicle.last_position_lat is None or vehicle.last_position_lng is None:
+            return None
+        stops = pending_stops([route.id]).get(str(route.id), [])
+        estimate = RouteEta(str(route.id), str(vehicle.id), route.tenant_id, None, stops)
+        if len(estimate.stop_ids) >= 2:
+            lats, lngs = zip(*estimate.coords)
+            estimate.apply_distances(estimate.stop_ids, get_distance_cache().matrix(lats, lngs))
+        estimate.position = (vehicle.last_position_lat, vehicle.last_position_lng)
+        estimate.position_time = time.time()
+        return dict(estimate.snapshot(self.average_speed, self.average_speed), computed_at=timezone.now().isoformat())
+
+
+_engine = None
+
+
+def get_eta_engine():
+    """Instância única por processo: a ingestão alimenta, o endpoint lê da memória quando pode"""
+    global _engine
+    if _engine is None:
+        _engine = EtaEngine()
+    return _engine
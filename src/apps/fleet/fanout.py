@@ -0,0 +1,123 @@
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def group_message(payloads):
+    # Posição única mantém o formato antigo (vehicle_update)
+    if len(payloads) == 1:
+        return {"type": "vehicle_update", "message": payloads[0]}
+    return {"type": "vehicle_updates", "messages": payloads}
+
+
+class FanoutBuffer:
+    """
+    Agrupa as atualizações de veículos por grupo do Channels e envia um único
+    frame por grupo a cada tick (FLEET_FANOUT_TICK_MS). Dentro do tick vale a
+    última posição de cada veículo. Com tick 0 envia na hora (um envio por lote).
+    """
+
+    def __init__(self, tick_ms=None):
+        self.tick = (settings.FLEET_FANOUT_TICK_MS if tick_ms is None else tick_ms) / 1000
+        self._pending = defaultdict(dict)  # grupo -> {vehicle_id: payload}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.counters = {'received': 0, 'coalesced': 0, 'frames_sent': 0}
+
+    def publish(self, group, payloads):
+        if not payloads:
+            return
+        if not self.tick:
+            with self._lock:
+                self.counters['received'] += len(payloads)
+                self.counters['frames_sent'] += 1
+            async_to_sync(get_channel_layer().group_send)(group, group_message(payloads))
+            return
+
+        with self._lock:
+            buffered = self._pending[group]
+            for payload in payloads:
+                previous = buffered.get(payload['id'])
+                if previous is not None:
+                    self.counters['coalesced'] += 1
+                    # Não perde o score de um alarme anterior dentro do mesmo tick
+                    if payload.get('score') is None and previous.get('score') is not None:
+                        payload = dict(payload, score=previous['score'])
+                buffered[payload['id']] = payload
+            self.counters['received'] += len(payloads)
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="fleet-fanout", daemon=True)
+                self._thread.start()
+
+    def _take(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(dict)
+        return {group: list(buffered.values()) for group, buffered in pending.items() if buffered}
+
+    async def _send(self, batches):
+        channel_layer = get_channel_layer()
+        await asyncio.gather(*[
+            channel_layer.group_send(group, {"type": "vehicle_updates", "messages": payloads})
+            for group, payloads in batches.items()
+        ])
+        with self._lock:
+            self.counters['frames_sent'] += len(batches)
+
+    def _run(self):
+        # Loop próprio e persistente: reaproveita as conexões do channel layer
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        while True:
+            time.sleep(self.tick)
+            batches = self._take()
+            if not batches:
+                continue
+            try:
+                loop.run_until_complete(self._send(batches))
+            except Exception:
+                logger.exception("Falha ao enviar %d frames de fan-out", len(batches))
+
+    def flush(self):
+        """Envia o que estiver pendente imediatamente (usado no encerramento)"""
+        batches = self._take()
+        if batches:
+            async_to_sync(self._send)(batches)
+
+    def stats(self):
+        with self._lock:
+            pending = sum(len(buffered) for buffered in self._pending.values())
+            counters = dict(self.counters)
+        return dict(counters, pending=pending, tick_ms=int(self.tick * 1000))
+
+
+_fanout = None
+
+
+def get_fanout():
+    global _fanout
+    if _fanout is None:
+        _fanout = FanoutBuffer()
+        atexit.register(_flush_at_exit)
+    return _fanout
+
+
+def _flush_at_exit():
+    try:
+        _fanout.flush()
+    except Exception:
+        logger.exception("Falha ao enviar o fan-out pendente no encerramento")
@@ -0,0 +1,292 @@
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .arrivals import METERS_PER_DEGREE, distance_m
+from .history import parse_fix_time
+from .models import Geofence, GeofenceEvent
+
+logger = logging.getLogger(__name__)
+
+
+def point_in_polygon(lat, lng, lats, lngs):
+    """Ray casting (par/ímpar) com lng como x e lat como y; o polígono fecha sozinho"""
+    inside = False
+    j = len(lats) - 1
+    for i in range(len(lats)):
+        lat_i, lat_j = lats[i], lats[j]
+        if (lat_i > lat) != (lat_j > lat):
+            if lng < (lngs[j] - lngs[i]) * (lat - lat_i) / (lat_j - lat_i) + lngs[i]:
+                inside = not inside
+        j = i
+    return inside
+
+
+class FenceShape:
+    """Uma cerca carregada: bbox para o pré-filtro e o teste exato (polígono ou círculo)"""
+
+    __slots__ = ('id', 'name', 'kind', 'lats', 'lngs', 'center', 'radius', 'min_lat', 'min_lng', 'max_lat', 'max_lng')
+
+    def __init__(self, fence_id, name, kind, shape, polygon, center_lat, center_lng, radius_m):
+        self.id = fence_id
+        self.name = name
+        self.kind = kind
+        self.lats = self.lngs = self.center = self.radius = None
+        if shape == 'CIRCLE':
+            self.center = (center_lat, center_lng)
+            self.radius = radius_m
+            d_lat = radius_m / METERS_PER_DEGREE
+            d_lng = d_lat / max(math.cos(math.radians(min(abs(center_lat) + d_lat, 89.9))), 0.01)
+            self.min_lat, self.max_lat = center_lat - d_lat, center_lat + d_lat
+            self.min_lng, self.max_lng = center_lng - d_lng, center_lng + d_lng
+        else:
+            self.lats = [float(lat) for lat, _ in polygon]
+            self.lngs = [float(lng) for _, lng in polygon]
+            self.min_lat, self.max_lat = min(self.lats), max(self.lats)
+            self.min_lng, self.max_lng = min(self.lngs), max(self.lngs)
+
+    def contains(self, lat, lng):
+        if not (self.min_lat <= lat <= self.max_lat and self.min_lng <= lng <= self.max_lng):
+            return False
+        if self.radius is not None:
+            return distance_m(lat, lng, *self.center) <= self.radius
+        return point_in_polygon(lat, lng, self.lats, self.lngs)
+
+
+class TenantFenceIndex:
+    """
+    Cercas ativas de um tenant num grid uniforme de GEOFENCE_GRID_DEGREES.
+    Cada cerca entra nas células que a sua bbox cobre; uma posição faz um
+    acesso ao dict e só testa as cercas daquela célula. Cercas que cobririam
+    mais de MAX_CELLS células (um estado, uma região metropolitana) ficam
+    numa lista à parte, testada pela bbox a cada posição.
+    """
+
+    MAX_CELLS = 400
+
+    __slots__ = ('version', 'fences', 'cells', 'large', 'cell_size')
+
+    def __init__(self, version, fences, cell_size):
+        self.version = version
+        self.fences = {fence.id: fence for fence in fences}
+        self.cells = defaultdict(list)
+        self.large = []
+        self.cell_size = cell_size
+        for fence in fences:
+            rows = range(math.floor(fence.min_lat / cell_size), math.floor(fence.max_lat / cell_size) + 1)
+            columns = range(math.floor(fence.min_lng / cell_size), math.floor(fence.max_lng / cell_size) + 1)
+            if len(rows) * len(columns) > self.MAX_CELLS:
+                self.large.append(fence)
+                continue
+            for row in rows:
+                for column in columns:
+                    self.cells[(row, column)].append(fence)
+
+    def query(self, lat, lng):
+        """frozenset dos ids das cercas que contêm o ponto"""
+        candidates = self.cells.get((math.floor(lat / self.cell_size), math.floor(lng / self.cell_size)), ())
+        if not candidates and not self.large:
+            return frozenset()
+        return frozenset(
+            fence.id for fences in (candidates, self.large) for fence in fences if fence.contains(lat, lng)
+        )
+
+
+class FenceState:
+    """Por veículo: última posição aceita e as cercas em que ele está"""
+
+    __slots__ = ('tenant_id', 'last_time', 'lat', 'lng', 'inside')
+
+    def __init__(self, tenant_id, t, lat, lng, inside):
+        self.tenant_id = tenant_id
+        self.last_time = t
+        self.lat = lat
+        self.lng = lng
+        self.inside = inside
+
+
+class GeofenceMonitor:
+    """
+    Entrada e saída dos veículos nas cercas do seu tenant.
+    As cercas ficam em memória (TenantFenceIndex por tenant) e são
+    recarregadas a cada REFRESH segundos por uma query só, que compara a
+    versão de cada tenant (último updated_at e número de cercas) e relê
+    apenas os tenants que mudaram: nenhuma query por posição.
+    A primeira posição de um veículo só registra onde ele está (sem evento),
+    e o mesmo vale para as cercas criadas, alteradas ou removidas numa
+    recarga: o estado dos veículos do tenant é recalculado na última posição
+    conhecida, sem gerar entradas/saídas que ninguém cruzou.
+    O estado é do processo, como no ArrivalDetector.
+    """
+
+    def __init__(self, refresh=None, cell_size=None):
+        self.refresh_interval = settings.GEOFENCE_REFRESH_SECONDS if refresh is None else refresh
+        self.cell_size = settings.GEOFENCE_GRID_DEGREES if cell_size is None else cell_size
+        self.indexes = {}  # tenant_id (str) -> TenantFenceIndex
+        self.states = {}  # vehicle_id -> FenceState
+        self.next_refresh = 0.0
+        self._lock = threading.Lock()
+
+    # --- cercas ---
+
+    def refresh(self):
+        versions = {
+            str(tenant_id): (version, count)
+            for tenant_id, version, count in Geofence.objects.values('tenant_id').annotate(
+                version=Max('updated_at'), count=Count('id'),
+            ).values_list('tenant_id', 'version', 'count')
+        }
+        changed = [
+            tenant_id for tenant_id, version in versions.items()
+            if tenant_id not in self.indexes or self.indexes[tenant_id].version != version
+        ]
+        fences = {tenant_id: [] for tenant_id in changed}  # um tenant com todas as cercas inativas fica vazio
+        if changed:
+            for row in Geofence.objects.filter(tenant_id__in=changed, active=True).values_list(
+                'tenant_id', 'id', 'name', 'kind', 'shape', 'polygon', 'center_lat', 'center_lng', 'radius_m',
+            ):
+                fences[str(row[0])].append(row[1:])
+        self.load(versions, fences)
+
+    def load(self, versions, fences):
+        """
+        versions: {tenant_id: versão} de todos os tenants com cercas;
+        fences: {tenant_id: [(id, name, kind, shape, polygon, center_lat,
+        center_lng, radius_m)]} das cercas ativas dos tenants que mudaram.
+        """
+        indexes = {}
+        for tenant_id, version in versions.items():
+            if tenant_id in fences or tenant_id not in self.indexes:
+                shapes = []
+                for fence_id, name, kind, *shape in fences.get(tenant_id, ()):
+                    try:
+                        shapes.append(FenceShape(str(fence_id), name, kind, *shape))
+                    except (TypeError, ValueError):
+                        logger.warning("Cerca %s com geometria inválida ignorada", fence_id)
+                indexes[tenant_id] = TenantFenceIndex(version, shapes, self.cell_size)
+            else:
+                indexes[tenant_id] = self.indexes[tenant_id]
+
+        reloaded = {tenant_id for tenant_id, index in indexes.items() if self.indexes.get(tenant_id) is not index}
+        reloaded.update(set(self.indexes) - set(indexes))
+        self.indexes = indexes
+        if reloaded:
+            for state in self.states.values():
+                if state.tenant_id in reloaded:
+                    index = indexes.get(state.tenant_id)
+                    state.inside = index.query(state.lat, state.lng) if index else frozenset()
+
+    # --- posições ---
+
+    def check(self, updates, undo=None):
+        """
+        updates: [(vehicle, pos, attributes)] do lote. Devolve os eventos
+        [{'event': 'ENTER'|'EXIT', 'geofence_id', 'name', 'kind',
+        'vehicle_id', 'tenant_id', 'time', 'lat', 'lng'}] na ordem das posições.
+        undo: dict preenchido com as cercas de cada veículo com evento antes
+        do lote, para o rollback() se a gravação dos eventos falhar.
+        """
+        with self._lock:
+            if time.monotonic() >= self.next_refresh:
+                self.refresh()
+                self.next_refresh = time.monotonic() + self.refresh_interval
+            if not self.indexes:
+                return []
+            events = []
+            for vehicle, pos, attributes in updates:
+                tenant_id = str(vehicle.tenant_id)
+                index = self.indexes.get(tenant_id)
+                lat, lng = pos.get('latitude'), pos.get('longitude')
+                if index is None or lat is None or lng is None:
+                    continue
+                self.visit(str(vehicle.id), tenant_id, index, lat, lng, parse_fix_time(pos).timestamp(), events, undo)
+            return events
+
+    def rollback(self, undo):
+        """
+        Eventos do lote não gravados: os veículos voltam às cercas de antes
+        dele, e a próxima posição gera as entradas/saídas de novo.
+        """
+        with self._lock:
+            for vehicle_id, inside in undo.items():
+                state = self.states.get(vehicle_id)
+                if state is not None:
+                    state.inside = inside
+
+    def visit(self, vehicle_id, tenant_id, index, lat, lng, t, events, undo=None):
+        state = self.states.get(vehicle_id)
+        if state is None:
+            self.states[vehicle_id] = FenceState(tenant_id, t, lat, lng, index.query(lat, lng))
+            return
+        if t <= state.last_time:
+            return  # fora de ordem
+        inside = index.query(lat, lng)
+        state.last_time, state.lat, state.lng = t, lat, lng
+        if inside == state.inside:
+            return
+        if undo is not None:
+            undo.setdefault(vehicle_id, state.inside)
+        for fence_id in state.inside - inside:
+            if fence_id in index.fences:
+                events.append(self.event('EXIT', index.fences[fence_id], vehicle_id, tenant_id, t, lat, lng))
+        for fence_id in inside - state.inside:
+            events.append(self.event('ENTER', index.fences[fence_id], vehicle_id, tenant_id, t, lat, lng))
+        state.inside = inside
+
+    @staticmethod
+    def event(kind, fence, vehicle_id, tenant_id, t, lat, lng):
+        return {
+            'event': kind,
+            'geofence_id': fence.id,
+            'name': fence.name,
+            'kind': fence.kind,
+            'vehicle_id': vehicle_id,
+            'tenant_id': tenant_id,
+            'time': datetime.fromtimestamp(t, tz=dt_timezone.utc).isoformat(),
+            'lat': lat,
+            'lng': lng,
+        }
+
+
+def save_geofence_events(events):
+    """
+    Grava os eventos do lote num bulk_create (só das cercas que ainda
+    existem) e publica geofence_events no grupo de cada tenant.
+    """
+    if not events:
+        return
+    from .ingestion import tenant_group_name
+
+    existing = {
+        str(fence_id) for fence_id in
+        Geofence.objects.filter(id__in={event['geofence_id'] for event in events}).values_list('id', flat=True)
+    }
+    events = [event for event in events if event['geofence_id'] in existing]
+    GeofenceEvent.objects.bulk_create([
+        GeofenceEvent(
+            tenant_id=event['tenant_id'], geofence_id=event['geofence_id'], vehicle_id=event['vehicle_id'],
+            event=event['event'], time=datetime.fromisoformat(event['time']),
+            latitude=event['lat'], longitude=event['lng'],
+        )
+        for event in events
+    ])
+
+    by_tenant = defaultdict(list)
+    for event in events:
+        by_tenant[event['tenant_id']].append(event)
+    channel_layer = get_channel_layer()
+    for tenant_id, tenant_events in by_tenant.items():
+        try:
+            async_to_sync(channel_layer.group_send)(
+                tenant_group_name(tenant_id), {"type": "geofence_events", "events": tenant_events},
+            )
+        except Exception:
+            logger.warning("Não foi possível publicar os eventos de cerca do tenant %s", tenant_id, exc_info=True)
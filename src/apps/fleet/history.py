@@ -0,0 +1,181 @@
+import csv
+import io
+import json
+import logging
+import threading
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Position
+
+logger = logging.getLogger(__name__)
+
+# Ordem das colunas usada no COPY
+COPY_COLUMNS = (
+    'tenant_id', 'vehicle_id', 'traccar_position_id', 'fix_time', 'server_time',
+    'latitude', 'longitude', 'speed', 'course', 'altitude', 'ignition',
+    'odometer_km', 'attributes',
+)
+
+
+def parse_fix_time(pos, default=None):
+    """Horário do GPS enviado pelo Traccar (fixTime > deviceTime > agora)"""
+    for key in ('fixTime', 'deviceTime', 'serverTime'):
+        value = pos.get(key)
+        if value:
+            parsed = parse_datetime(value) if isinstance(value, str) else value
+            if parsed is not None:
+                return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, dt_timezone.utc)
+    return default or timezone.now()
+
+
+def position_row(vehicle, pos, received_at, fix_time=None):
+    """Converte uma posição do Traccar numa linha do histórico (fix_time: já convertido)"""
+    attributes = pos.get('attributes') or {}
+    odometer = attributes.get('totalDistance')
+    return (
+        vehicle.tenant_id,
+        vehicle.id,
+        pos.get('id'),
+        fix_time or parse_fix_time(pos, received_at),
+        received_at,
+        pos.get('latitude'),
+        pos.get('longitude'),
+        (pos.get('speed') or 0) * 1.852,  # nós -> km/h
+        pos.get('course') or 0,
+        pos.get('altitude'),
+        attributes.get('ignition'),
+        odometer / 1000.0 if odometer is not None else None,
+        attributes,
+    )
+
+
+def copy_row(row):
+    """Formata uma linha (ordem de COPY_COLUMNS) para o COPY em CSV (vazio sem aspas = NULL)"""
+    (tenant_id, vehicle_id, position_id, fix_time, server_time, latitude, longitude,
+     speed, course, altitude, ignition, odometer_km, attributes) = row
+    return (
+        tenant_id, vehicle_id, position_id, fix_time.isoformat(), server_time.isoformat(),
+        latitude, longitude, speed, course, altitude,
+        None if ignition is None else ('t' if ignition else 'f'),
+        odometer_km, json.dumps(attributes),
+    )
+
+
+class PositionHistoryService:
+    """
+    Grava e consulta o histórico de posições.
+    No PostgreSQL usa COPY para inserir o lote e mantém uma partição por dia (UTC);
+    nos demais bancos cai para bulk_create.
+    O fixTime vem do rastreador: a gravação só cria as partições dos dias
+    próximos de hoje (auto_partition_days). Um relógio errado (rollover da
+    semana GPS, datas em 2000 ou 2099) vai para a partição DEFAULT em vez de
+    criar partições que a retenção não remove, cada uma com um lock pesado
+    em fleet_position no meio do lote. As demais são do manage_position_partitions.
+    """
+
+    _known_partitions = set()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def is_partitioned():
+        return connection.vendor == 'postgresql'
+
+    @staticmethod
+    def partition_name(day):
+        return f"fleet_position_p{day:%Y%m%d}"
+
+    @classmethod
+    def ensure_partitions(cls, days):
+        """Cria (se preciso) as partições diárias dos dias informados"""
+        if not cls.is_partitioned():
+            return
+        missing = sorted(set(days) - cls._known_partitions)
+        if not missing:
+            return
+        with cls._lock, connection.cursor() as cursor:
+            for day in missing:
+                start = datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc)
+                end = start + timedelta(days=1)
+                try:
+                    cursor.execute(
+                        f"CREATE TABLE IF NOT EXISTS {cls.partition_name(day)} "
+                        f"PARTITION OF fleet_position "
+                        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                    )
+                except DatabaseError as e:
+                    # Ex: a partição DEFAULT já tem linhas desse dia; elas continuam lá
+                    logger.warning("Não foi possível criar a partição de %s: %s", day, e)
+                    continue
+                cls._known_partitions.add(day)
+
+    @staticmethod
+    def auto_partition_days(days):
+        """Os dias de `days` para os quais a gravação de um lote pode criar partição"""
+        today = timezone.now().astimezone(dt_timezone.utc).date()
+        first = today - timedelta(days=settings.POSITION_AUTO_PARTITION_DAYS_BEHIND)
+        last = today + timedelta(days=settings.POSITION_AUTO_PARTITION_DAYS_AHEAD)
+        return {day for day in days if first <= day <= last}
+
+    @classmethod
+    def drop_partitions_before(cls, day):
+        """Remove as partições diárias anteriores a `day` (retenção)"""
+        if not cls.is_partitioned():
+            deleted, _ = Position.objects.filter(
+                fix_time__lt=datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc)
+            ).delete()
+            return deleted
+
+        dropped = 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = 'fleet_position' AND c.relname LIKE 'fleet_position_p%'"
+            )
+            for (name,) in cursor.fetchall():
+                partition_day = datetime.strptime(name[len('fleet_position_p'):], '%Y%m%d').date()
+                if partition_day < day:
+                    cursor.execute(f"DROP TABLE IF EXISTS {name}")
+                    cls._known_partitions.discard(partition_day)
+                    dropped += 1
+        return dropped
+
+    @classmethod
+    def write(cls, rows):
+        """Insere as linhas (tuplas na ordem de COPY_COLUMNS) e devolve a quantidade"""
+        if not rows:
+            return 0
+        if not cls.is_partitioned():
+            Position.objects.bulk_create(
+                [Position(**dict(zip(COPY_COLUMNS, row))) for row in rows],
+                batch_size=1000,
+            )
+            return len(rows)
+
+        cls.ensure_partitions(cls.auto_partition_days({row[3].astimezone(dt_timezone.utc).date() for row in rows}))
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows(copy_row(row) for row in rows)
+        buffer.seek(0)
+
+        sql = f"COPY fleet_position ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):  # psycopg2
+                raw.copy_expert(sql, buffer)
+            else:  # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+        return len(rows)
+
+    @staticmethod
+    def window(vehicle, start, end):
+        """Trajeto de um veículo entre `start` e `end` (partition pruning por fix_time)"""
+        return Position.objects.window(vehicle, start, end)
@@ -0,0 +1,386 @@
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from apps.tenants.models import Tenant
+from .models import Vehicle
+from .telemetry_queue import TelemetryQueue
+from .fanout import get_fanout
+from .live_state import LiveStateStore
+from .resolver import get_device_resolver
+from .services import ScoreService
+from .detection import HarshEventDetector
+from .arrivals import ArrivalDetector, save_stop_events
+from .eta import get_eta_engine
+from .geofences import GeofenceMonitor, save_geofence_events
+from .history import PositionHistoryService, position_row
+
+logger = logging.getLogger(__name__)
+
+ADMIN_GROUP = "admin_global"
+
+# Campos de telemetria que o webhook pode alterar no Vehicle
+TELEMETRY_FIELDS = ('last_position_lat', 'last_position_lng', 'last_speed', 'ignition', 'current_km')
+
+
+def tenant_group_name(tenant_id):
+    """Nome do grupo do Channels que recebe as atualizações de um Tenant"""
+    return f"tenant_{tenant_id}"
+
+
+class IngestionReport:
+    """Resumo de um lote processado (contagens + tempos por etapa em ms)"""
+
+    def __init__(self, received=0):
+        self.received = received
+        self.processed = 0
+        self.unknown_devices = 0
+        self.vehicles_updated = 0
+        self.messages_sent = 0
+        self.history_written = 0
+        self.events_detected = 0
+        self.stop_events = 0
+        self.etas_published = 0
+        self.geofence_events = 0
+        self.failed_stages = []
+        self.timings = {}
+
+    @contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.timings[stage] = round(self.timings.get(stage, 0) + elapsed, 3)
+
+    @contextmanager
+    def guarded(self, stage):
+        """
+        Etapa posterior aos scores: a falha é registrada e não derruba o lote.
+        O telemetry_worker reprocessa lotes que falham, e nesse ponto os
+        alarmes já foram aplicados: reprocessar contaria o score duas vezes.
+        """
+        with self.timed(stage):
+            try:
+                yield
+            except Exception:
+                logger.exception("Falha na etapa %s do lote (seguindo sem ela)", stage)
+                self.failed_stages.append(stage)
+
+    def as_dict(self):
+        return {
+            'received': self.received,
+            'processed': self.processed,
+            'unknown_devices': self.unknown_devices,
+            'vehicles_updated': self.vehicles_updated,
+            'messages_sent': self.messages_sent,
+            'history_written': self.history_written,
+            'events_detected': self.events_detected,
+            'stop_events': self.stop_events,
+            'etas_published': self.etas_published,
+            'geofence_events': self.geofence_events,
+            'failed_stages': list(self.failed_stages),
+            'timings_ms': dict(self.timings),
+        }
+
+
+class TelemetryIngestionService:
+    """
+    Processa lotes de posições do Traccar.
+    Resolve os deviceId pelo DeviceResolver (sem query no caso comum), grava a
+    telemetria com um bulk_update apenas dos campos recebidos e entrega as
+    mensagens de WebSocket ao FanoutBuffer, que envia um frame por grupo a cada tick.
+    """
+
+    def __init__(self):
+        self.live_state = LiveStateStore()
+        self.detector = HarshEventDetector()
+        self.arrivals = ArrivalDetector()
+        self.eta = get_eta_engine()
+        self.geofences = GeofenceMonitor()
+
+    def ingest(self, positions):
+        report = IngestionReport(received=len(positions))
+        with report.timed('total'):
+            positions = [pos for pos in positions if isinstance(pos, dict) and pos.get('deviceId')]
+            if not positions:
+                return report
+
+            with report.timed('resolve'):
+                vehicles = self.resolve_vehicles({pos['deviceId'] for pos in positions})
+
+            updates = []  # (vehicle, pos, attributes) na ordem recebida
+            changed = defaultdict(set)
+            with report.timed('telemetry'):
+                for pos in positions:
+                    vehicle = vehicles.get(pos['deviceId'])
+                    if vehicle is None:
+                        report.unknown_devices += 1
+                        continue
+                    attributes = pos.get('attributes') or {}
+                    changed[vehicle.id].update(self.apply_telemetry(vehicle, pos, attributes))
+                    updates.append((vehicle, pos, attributes))
+
+                report.vehicles_updated = self.write_telemetry(vehicles.values(), changed)
+            report.processed = len(updates)
+
+            detected, checkpoint = [], None
+            try:
+                if settings.HARSH_EVENT_DETECTION:
+                    with report.timed('detection'):
+                        checkpoint = self.detector.checkpoint(updates)
+                        detected = self.detect_events(updates, checkpoint)
+                    report.events_detected = len(detected)
+
+                with report.timed('scores'):
+                    scores = self.process_alarms(updates, detected)
+            except Exception:
+                # O lote não contou: o reprocessamento precisa ver as posições como novas
+                if checkpoint is not None:
+                    self.detector.restore(checkpoint)
+                raise
+
+            # Daqui em diante o lote já contou nos scores: as etapas não derrubam o lote
+            stop_events = []
+            if settings.STOP_ARRIVAL_DETECTION:
+                with report.guarded('arrivals'):
+                    stop_events = self.process_arrivals(updates)
+                report.stop_events = len(stop_events)
+
+            if settings.LIVE_ETA_ENABLED:
+                with report.guarded('eta'):
+                    report.etas_published = self.process_etas(updates, stop_events)
+
+            if settings.GEOFENCE_DETECTION:
+                with report.guarded('geofences'):
+                    report.geofence_events = self.process_geofences(updates)
+
+            payloads = [
+                self.build_payload(vehicle, pos, scores.get(index))
+                for index, (vehicle, pos, attributes) in enumerate(updates)
+            ]
+
+            # Estado ao vivo antes do fan-out: o snapshot nunca fica atrás do que foi enviado
+            with report.guarded('live_state'):
+                self.live_state.update([(vehicle.tenant_id, payload) for (vehicle, _, _), payload in zip(updates, payloads)])
+
+            with report.guarded('fanout'):
+                report.messages_sent = self.broadcast(updates, payloads)
+
+            # Histórico por último: o mapa ao vivo não espera pela gravação
+            if settings.POSITION_HISTORY_ENABLED:
+                with report.guarded('history'):
+                    report.history_written = self.write_history(updates)
+
+        logger.info("Lote Traccar processado: %s", report.as_dict())
+        return report
+
+    def resolve_vehicles(self, device_ids):
+        """
+        deviceId -> Vehicle parcial (id, tenant_id, name) montado a partir do
+        DeviceResolver; serve para o bulk_update sem carregar a linha do banco.
+        """
+        resolved = get_device_resolver().resolve_many(device_ids)
+        return {
+            device_id: Vehicle(id=device.vehicle_id, tenant_id=device.tenant_id, name=device.name, traccar_device_id=device_id)
+            for device_id, device in resolved.items()
+        }
+
+    @staticmethod
+    def apply_telemetry(vehicle, pos, attributes):
+        """Aplica a posição no objeto em memória e devolve os campos recebidos"""
+        values = {
+            'last_position_lat': pos.get('latitude'),
+            'last_position_lng': pos.get('longitude'),
+            'last_speed': (pos.get('speed') or 0) * 1.852,  # nós -> km/h
+            'ignition': attributes.get('ignition', False),
+        }
+        # Hodômetro (totalDistance vem em metros)
+        if 'totalDistance' in attributes:
+            values['current_km'] = attributes['totalDistance'] / 1000.0
+
+        for field, value in values.items():
+            setattr(vehicle, field, value)
+        return set(values)
+
+    @staticmethod
+    def write_telemetry(vehicles, changed):
+        """
+        Um bulk_update por conjunto de campos recebidos (na prática 1 ou 2),
+        para não sobrescrever campos que nenhuma posição trouxe.
+        """
+        now = timezone.now()
+        by_fields = defaultdict(list)
+        for vehicle in vehicles:
+            fields = changed.get(vehicle.id)
+            if fields:
+                vehicle.updated_at = now
+                by_fields[frozenset(fields)].append(vehicle)
+
+        for fields, group in by_fields.items():
+            ordered = [field for field in TELEMETRY_FIELDS if field in fields]
+            Vehicle.objects.bulk_update(group, ordered + ['updated_at'])
+        return sum(len(group) for group in by_fields.values())
+
+    def detect_events(self, updates, checkpoint=None):
+        """
+        Alarmes detectados pela telemetria [(índice, alarme)]. Todos vão para
+        a lista attributes.alarms da posição (ao lado do alarm do rastreador),
+        para o histórico (e um ScoreService.recompute) contarem o mesmo que o
+        score ao vivo; o alarme do rastreador que repete um evento já
+        detectado ganha alarmSuppressed e fica fora dos dois.
+        """
+        for vehicle, pos, attributes in updates:
+            # Reprocessamento de um lote que falhou: as marcas da tentativa anterior saem
+            attributes.pop('alarms', None)
+            attributes.pop('alarmSuppressed', None)
+        detected, suppressed = self.detector.detect(updates, checkpoint)
+        for index, alarm_type in detected:
+            vehicle, pos, attributes = updates[index]
+            attributes.setdefault('alarms', []).append(alarm_type)
+            pos['attributes'] = attributes
+        for index, alarm_type in suppressed:
+            vehicle, pos, attributes = updates[index]
+            attributes['alarmSuppressed'] = True
+            pos['attributes'] = attributes
+        return detected
+
+    @staticmethod
+    def process_alarms(updates, detected=()):
+        """
+        Processa os alarmes de Score (overspeed, hardAcceleration, hardBraking, hardCornering).
+        O Traccar envia alarmes no campo 'attributes': {'alarm': 'overspeed'};
+        detected traz os que o HarshEventDetector achou na telemetria.
+        """
+        alarms = [
+            (index, vehicle, attributes['alarm'])
+            for index, (vehicle, pos, attributes) in enumerate(updates)
+            if attributes.get('alarm') and not attributes.get('alarmSuppressed')
+        ]
+        alarms += [(index, updates[index][0], alarm_type) for index, alarm_type in detected]
+        alarms.sort(key=lambda alarm: alarm[0])  # o score de cada posição é o que valia depois dela
+        if not alarms:
+            return {}
+
+        # Pesos do Score vêm do Tenant: uma query só para os lotes com alarme
+        tenants = {
+            str(tenant.id): tenant
+            for tenant in Tenant.objects.filter(id__in={vehicle.tenant_id for _, vehicle, _ in alarms})
+        }
+        events = []
+        for index, vehicle, alarm_type in alarms:
+            tenant = tenants.get(str(vehicle.tenant_id))
+            if tenant is None:
+                continue
+            vehicle.tenant = tenant
+            events.append((index, vehicle, alarm_type))
+        # Um lote só: contadores no Redis (write-behind) ou uma transação no banco
+        results = ScoreService.process_events([(vehicle, alarm_type) for _, vehicle, alarm_type in events])
+        return {index: score for (index, _, _), score in zip(events, results)}
+
+    def process_arrivals(self, updates):
+        """Chegadas/atendimentos das paradas das rotas em andamento; falhas não derrubam o lote"""
+        undo = {}
+        events = self.arrivals.check(updates, undo)
+        try:
+            save_stop_events(events)
+        except DatabaseError:
+            logger.exception("Falha ao gravar %d eventos de parada", len(events))
+            # Não gravados: as próximas posições geram os eventos de novo
+            self.arrivals.rollback(undo)
+            return []
+        return events
+
+    def process_etas(self, updates, stop_events):
+        """Posições e eventos de parada do lote no EtaEngine; publica os ETAs vencidos"""
+        try:
+            self.eta.apply_stop_events(stop_events)
+            self.eta.update(updates)
+        except DatabaseError:
+            logger.exception("Falha ao recarregar as rotas em andamento para o ETA")
+        return self.eta.publish()
+
+    def process_geofences(self, updates):
+        """Entradas/saídas das cercas do tenant; falhas não derrubam o lote"""
+        undo = {}
+        try:
+            events = self.geofences.check(updates, undo)
+            save_geofence_events(events)
+        except DatabaseError:
+            logger.exception("Falha ao processar as cercas virtuais do lote")
+            # Não gravados: a próxima posição gera as entradas/saídas de novo
+            self.geofences.rollback(undo)
+            return 0
+        return len(events)
+
+    @staticmethod
+    def write_history(updates):
+        """Grava o lote no histórico (COPY); falhas não derrubam o webhook"""
+        received_at = timezone.now()
+        rows = [
+            position_row(vehicle, pos, received_at)
+            for vehicle, pos, attributes in updates
+            if pos.get('latitude') is not None and pos.get('longitude') is not None
+        ]
+        try:
+            return PositionHistoryService.write(rows)
+        except DatabaseError:
+            logger.exception("Falha ao gravar o histórico de posições")
+            return 0
+
+    @staticmethod
+    def build_payload(vehicle, pos, score):
+        return {
+            'id': str(vehicle.id),
+            'name': vehicle.name,
+            'lat': pos.get('latitude'),
+            'lng': pos.get('longitude'),
+            'speed': round((pos.get('speed') or 0) * 1.852, 1),
+            'ignition': (pos.get('attributes') or {}).get('ignition', False),
+            'score': score,
+        }
+
+    def broadcast(self, updates, payloads):
+        """Entrega as atualizações ao fan-out agrupadas por grupo (tenant + admin global)"""
+        by_group = defaultdict(list)
+        for (vehicle, pos, attributes), payload in zip(updates, payloads):
+            by_group[tenant_group_name(vehicle.tenant_id)].append(payload)
+            by_group[ADMIN_GROUP].append(payload)
+
+        fanout = get_fanout()
+        for group, payloads in by_group.items():
+            fanout.publish(group, payloads)
+        return len(by_group)
+
+
+_service = None
+
+
+def get_ingestion_service():
+    """Instância única por processo (estágios futuros guardam estado em memória)"""
+    global _service
+    if _service is None:
+        _service = TelemetryIngestionService()
+    return _service
+
+
+def submit_positions(positions):
+    """
+    Entrada comum do webhook e do traccar_stream. Com TELEMETRY_QUEUE_ENABLED
+    só enfileira (os workers do telemetry_worker processam); sem fila, ou com o
+    Redis fora, processa o lote na hora.
+    """
+    if settings.TELEMETRY_QUEUE_ENABLED:
+        try:
+            TelemetryQueue().enqueue(positions)
+            return None
+        except RedisError:
+            logger.exception("Redis indisponível, processando o lote no próprio processo")
+    return get_ingestion_service().ingest(positions)
@@ -0,0 +1,104 @@
+import json
+import logging
+import threading
+import uuid
+
+from django.db import connections
+from django.utils import timezone
+
+from apps.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class JobStore:
+    """
+    Estado de jobs em background no Redis (um hash por job, valores em JSON),
+    visível para qualquer processo do Daphne. Um lock por nome evita dois jobs
+    iguais rodando ao mesmo tempo.
+    """
+
+    KEY = "fleet:jobs:{job_id}"
+    LOCK_KEY = "fleet:jobs:lock:{name}"
+    EXPIRE = 24 * 3600
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def create(self, kind, **fields):
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'status': 'pending',
+            'created_at': timezone.now().isoformat(),
+            **fields,
+        }
+        self.update(job['id'], **job)
+        return job
+
+    def update(self, job_id, **fields):
+        key = self.KEY.format(job_id=job_id)
+        pipe = self.client.pipeline()
+        pipe.hset(key, mapping={name: json.dumps(value, default=str) for name, value in fields.items()})
+        pipe.expire(key, self.EXPIRE)
+        pipe.execute()
+
+    def get(self, job_id):
+        data = self.client.hgetall(self.KEY.format(job_id=job_id))
+        if not data:
+            return None
+        return {name.decode(): json.loads(value) for name, value in data.items()}
+
+    def delete(self, job_id):
+        self.client.delete(self.KEY.format(job_id=job_id))
+
+    def acquire(self, name, job_id, ttl):
+        """True se o lock ficou com este job; senão devolve o id do job que o detém"""
+        key = self.LOCK_KEY.format(name=name)
+        if self.client.set(key, job_id, nx=True, ex=ttl):
+            return True
+        holder = self.client.get(key)
+        return holder.decode() if holder else False
+
+    def release(self, name, job_id):
+        key = self.LOCK_KEY.format(name=name)
+        holder = self.client.get(key)
+        if holder is not None and holder.decode() == job_id:
+            self.client.delete(key)
+
+
+def execute_job(store, job, target, lock=None, **kwargs):
+    """
+    Executa target(progress=..., **kwargs) no processo/thread atual,
+    gravando status, progresso e resultado (ou erro) do job no JobStore.
+    """
+
+    def progress(done, total, stage=None, **fields):
+        store.update(job['id'], done=done, total=total, stage=stage, **fields)
+
+    store.update(job['id'], status='running', started_at=timezone.now().isoformat())
+    try:
+        result = target(progress=progress, **kwargs)
+    except Exception as e:
+        logger.exception("Job %s (%s) falhou", job['id'], job['kind'])
+        store.update(job['id'], status='failed', error=str(e), finished_at=timezone.now().isoformat())
+    else:
+        store.update(job['id'], status='done', result=result, finished_at=timezone.now().isoformat())
+    finally:
+        if lock:
+            store.release(lock, job['id'])
+        connections.close_all()  # conexões desta thread
+
+
+def run_in_background(store, job, target, lock=None, **kwargs):
+    """execute_job numa thread"""
+    thread = threading.Thread(
+        target=execute_job, args=(store, job, target, lock), kwargs=kwargs,
+        name=f"job-{job['kind']}-{job['id'][:8]}", daemon=True,
+    )
+    thread.start()
+    return thread
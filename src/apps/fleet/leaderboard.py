@@ -0,0 +1,269 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Sum, Value
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from apps.core.redis_client import get_redis
+from .jobs import JobStore, run_in_background
+from .models import DriverScore, Vehicle
+
+logger = logging.getLogger(__name__)
+
+# Período do ranking -> dias na janela (terminando no dia pedido)
+PERIODS = {'day': 1, '7d': 7, '30d': 30}
+
+REBUILD_LOCK = "leaderboard_rebuild:{tenant_id}"
+REBUILD_LOCK_TTL = 600
+
+
+class LeaderboardNotBuilt(Exception):
+    """O ranking do tenant não está no Redis (reconstrução já agendada)"""
+
+
+class ScoreLeaderboard:
+    """
+    Ranking de motoristas em sorted sets do Redis, um por tenant e dia, com a
+    penalidade do dia (100 - score) como valor: ZRANK dá a posição em
+    O(log n) e ZRANGE o top-N ou a vizinhança de um veículo.
+    As janelas de 7 e 30 dias somam as penalidades diárias (ZUNIONSTORE,
+    guardado por WINDOW_TTL segundos); dia sem DriverScore conta como 100, e
+    o score da janela é a média 100 - soma / dias.
+    Só quem teve alarme tem DriverScore: todos os veículos do tenant ficam
+    num sorted set à parte (VEHICLES_KEY, penalidade 0), que entra no dia na
+    primeira leitura dele e em toda janela, para quem tem 100 aparecer (em
+    primeiro) no ranking.
+    O DriverScore continua sendo a fonte da verdade: o ranking de um tenant é
+    reconstruído do banco pelo comando rebuild_leaderboard, ou num job em
+    background quando uma leitura não o encontra no Redis; a leitura não
+    espera por ele (LeaderboardNotBuilt).
+    """
+
+    DAY_KEY = "fleet:leaderboard:{tenant_id}:{day}"
+    WINDOW_KEY = "fleet:leaderboard:{tenant_id}:{period}:{day}"
+    BUILT_KEY = "fleet:leaderboard:{tenant_id}:built"
+    VEHICLES_KEY = "fleet:leaderboard:{tenant_id}:vehicles"
+    SEEDED_KEY = "fleet:leaderboard:{tenant_id}:seeded:{day}"
+    RETENTION_DAYS = 35  # cobre a janela de 30 dias
+    WINDOW_TTL = 30
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def day_key(self, tenant_id, day):
+        return self.DAY_KEY.format(tenant_id=tenant_id, day=day.isoformat())
+
+    def ttl(self, day):
+        # O sorted set do dia vive enquanto alguma janela ainda pode usá-lo
+        remaining = day + timedelta(days=self.RETENTION_DAYS) - DriverScore.today()
+        return max(int(remaining.total_seconds()), 3600)
+
+    # --- escrita ---
+
+    def record(self, events, scores, day):
+        """
+        Depois de um lote de alarmes (ScoreService.process_events): grava o
+        último score de cada veículo. Com ZADD GT a penalidade só sobe, então
+        lotes concorrentes de processos diferentes podem chegar em qualquer
+        ordem.
+        """
+        penalties = defaultdict(dict)
+        for (vehicle, _), score in zip(events, scores):
+            penalties[vehicle.tenant_id][str(vehicle.id)] = 100 - score
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for tenant_id, mapping in penalties.items():
+                key = self.day_key(tenant_id, day)
+                pipe.zadd(key, mapping, gt=True)
+                pipe.expire(key, self.ttl(day))
+            pipe.execute()
+        except RedisError:
+            logger.warning("Não foi possível atualizar o ranking de %d veículos", len(events))
+
+    def store(self, rows):
+        """
+        Regrava valores exatos vindos do banco (recálculos, que podem baixar a
+        penalidade). rows: [(tenant_id, vehicle_id, dia, score)].
+        """
+        if not rows:
+            return
+        penalties = defaultdict(dict)
+        for tenant_id, vehicle_id, day, score in rows:
+            penalties[(tenant_id, day)][str(vehicle_id)] = 100 - score
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for (tenant_id, day), mapping in penalties.items():
+                key = self.day_key(tenant_id, day)
+                pipe.zadd(key, mapping)
+                pipe.expire(key, self.ttl(day))
+            pipe.execute()
+        except RedisError:
+            logger.warning("Não foi possível atualizar o ranking de %d scores recalculados", len(rows))
+
+    def add(self, vehicles):
+        """
+        Veículos novos entram no ranking com 100 (penalidade 0), hoje e nas
+        janelas. vehicles: [(tenant_id, vehicle_id)].
+        """
+        if not vehicles:
+            return
+        today = DriverScore.today()
+        by_tenant = defaultdict(dict)
+        for tenant_id, vehicle_id in vehicles:
+            by_tenant[tenant_id][str(vehicle_id)] = 0
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for tenant_id, mapping in by_tenant.items():
+                pipe.zadd(self.VEHICLES_KEY.format(tenant_id=tenant_id), mapping)
+                key = self.day_key(tenant_id, today)
+                pipe.zadd(key, mapping, nx=True)
+                pipe.expire(key, self.ttl(today))
+            pipe.execute()
+        except RedisError:
+            logger.warning("Não foi possível incluir %d veículos no ranking", len(vehicles))
+
+    def remove(self, tenant_id, vehicle_id):
+        """Tira o veículo de todos os dias do ranking do tenant"""
+        today = DriverScore.today()
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.zrem(self.VEHICLES_KEY.format(tenant_id=tenant_id), str(vehicle_id))
+            for offset in range(self.RETENTION_DAYS):
+                pipe.zrem(self.day_key(tenant_id, today - timedelta(days=offset)), str(vehicle_id))
+            pipe.execute()
+        except RedisError:
+            logger.warning("Não foi possível remover o veículo %s do ranking", vehicle_id)
+
+    def rebuild(self, tenant_id, days=None):
+        """
+        Refaz o ranking do tenant a partir do DriverScore (últimos
+        RETENTION_DAYS dias) e a lista de veículos. Os scores ainda no Redis
+        (write-behind) são gravados antes, para o banco estar em dia: roda
+        em comando ou job, nunca numa request.
+        """
+        if settings.SCORE_WRITE_BEHIND:
+            from .scores import get_score_buffer
+            get_score_buffer().flush()
+        today = DriverScore.today()
+        first = today - timedelta(days=(days or self.RETENTION_DAYS) - 1)
+        penalties = defaultdict(dict)
+        for vehicle_id, day, score in DriverScore.objects.filter(tenant_id=tenant_id, date__gte=first).values_list(
+            'vehicle_id', 'date', 'score'
+        ).iterator(chunk_size=5000):
+            penalties[day][str(vehicle_id)] = 100 - score
+        vehicles = {str(vehicle_id): 0 for vehicle_id in Vehicle.objects.filter(tenant_id=tenant_id).values_list('id', flat=True)}
+
+        pipe = self.client.pipeline(transaction=True)
+        vehicles_key = self.VEHICLES_KEY.format(tenant_id=tenant_id)
+        pipe.delete(vehicles_key)
+        if vehicles:
+            pipe.zadd(vehicles_key, vehicles)
+        for offset in range((today - first).days + 1):
+            day = today - timedelta(days=offset)
+            key = self.day_key(tenant_id, day)
+            pipe.delete(key, self.SEEDED_KEY.format(tenant_id=tenant_id, day=day.isoformat()))
+            if penalties.get(day):
+                pipe.zadd(key, penalties[day])
+                pipe.expire(key, self.ttl(day))
+        for period in PERIODS:
+            pipe.delete(self.WINDOW_KEY.format(tenant_id=tenant_id, period=period, day=today.isoformat()))
+        pipe.set(self.BUILT_KEY.format(tenant_id=tenant_id), timezone.now().isoformat())
+        pipe.execute()
+        return sum(len(mapping) for mapping in penalties.values())
+
+    # --- leitura ---
+
+    def ranking_key(self, tenant_id, period, day):
+        """
+        Chave do sorted set do período. Sem o ranking do tenant no Redis,
+        agenda a reconstrução e levanta LeaderboardNotBuilt.
+        """
+        client = self.client
+        if not client.exists(self.BUILT_KEY.format(tenant_id=tenant_id)):
+            schedule_leaderboard_rebuild(tenant_id)
+            raise LeaderboardNotBuilt(tenant_id)
+        vehicles_key = self.VEHICLES_KEY.format(tenant_id=tenant_id)
+        if period == 'day':
+            key = self.day_key(tenant_id, day)
+            if client.set(self.SEEDED_KEY.format(tenant_id=tenant_id, day=day.isoformat()), 1, nx=True, ex=self.ttl(day)):
+                # Primeira leitura do dia: quem não teve alarme entra com 0 (MAX mantém as penalidades)
+                pipe = client.pipeline(transaction=True)
+                pipe.zunionstore(key, [key, vehicles_key], aggregate='MAX')
+                pipe.expire(key, self.ttl(day))
+                pipe.execute()
+            return key
+        key = self.WINDOW_KEY.format(tenant_id=tenant_id, period=period, day=day.isoformat())
+        if not client.exists(key):
+            days = {self.day_key(tenant_id, day - timedelta(days=offset)): 1 for offset in range(PERIODS[period])}
+            pipe = client.pipeline(transaction=True)
+            pipe.zunionstore(key, {vehicles_key: 0, **days}, aggregate='SUM')
+            pipe.expire(key, self.WINDOW_TTL)
+            pipe.execute()
+        return key
+
+    @staticmethod
+    def entry(rank, vehicle_id, penalty, period):
+        score = 100 - penalty / PERIODS[period]
+        return {'rank': rank, 'vehicle_id': vehicle_id, 'score': round(max(score, 0), 1)}
+
+    def top(self, tenant_id, period='day', day=None, offset=0, limit=20):
+        """Página do ranking (melhores primeiro) e o total de veículos"""
+        day = day or DriverScore.today()
+        key = self.ranking_key(tenant_id, period, day)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zrange(key, offset, offset + limit - 1, withscores=True)
+        pipe.zcard(key)
+        members, total = pipe.execute()
+        return [
+            self.entry(offset + index + 1, member.decode(), penalty, period)
+            for index, (member, penalty) in enumerate(members)
+        ], total
+
+    def around(self, tenant_id, vehicle_id, period='day', day=None, radius=5):
+        """
+        Posição do veículo e os radius vizinhos de cada lado.
+        Devolve (entrada do veículo ou None, vizinhos, total).
+        """
+        day = day or DriverScore.today()
+        key = self.ranking_key(tenant_id, period, day)
+        rank = self.client.zrank(key, str(vehicle_id))
+        if rank is None:
+            return None, [], self.client.zcard(key)
+        entries, total = self.top(tenant_id, period, day, offset=max(rank - radius, 0), limit=2 * radius + 1)
+        me = next((entry for entry in entries if entry['vehicle_id'] == str(vehicle_id)), None)
+        return me, entries, total
+
+    @classmethod
+    def from_database(cls, tenant_id, period='day', day=None):
+        """Ranking completo calculado no banco (Redis fora do ar ou ranking ainda não montado)"""
+        day = day or DriverScore.today()
+        penalties = {
+            str(row['vehicle_id']): row['penalty']
+            for row in DriverScore.objects
+            .filter(tenant_id=tenant_id, date__lte=day, date__gt=day - timedelta(days=PERIODS[period]))
+            .values('vehicle_id')
+            .annotate(penalty=Sum(Value(100) - F('score')))
+        }
+        vehicle_ids = [str(vehicle_id) for vehicle_id in Vehicle.objects.filter(tenant_id=tenant_id).values_list('id', flat=True)]
+        # Mesma ordem do Redis: penalidade e, no empate, o id
+        rows = sorted((penalties.get(vehicle_id, 0), vehicle_id) for vehicle_id in vehicle_ids)
+        return [cls.entry(index + 1, vehicle_id, penalty, period) for index, (penalty, vehicle_id) in enumerate(rows)]
+
+
+def schedule_leaderboard_rebuild(tenant_id):
+    """Refaz o ranking do tenant num job em background (um por tenant de cada vez)"""
+    store = JobStore()
+    lock = REBUILD_LOCK.format(tenant_id=tenant_id)
+    job = store.create('leaderboard_rebuild', tenant_id=str(tenant_id))
+    if store.acquire(lock, job['id'], ttl=REBUILD_LOCK_TTL) is not True:
+        store.delete(job['id'])
+        return None
+    run_in_background(store, job, lambda progress: ScoreLeaderboard().rebuild(tenant_id), lock=lock)
+    return job
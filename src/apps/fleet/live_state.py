@@ -0,0 +1,243 @@
+import json
+import logging
+import math
+from collections import defaultdict
+
+from redis.exceptions import RedisError
+
+from apps.core.redis_client import get_async_redis, get_redis
+from .models import DriverScore
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6372.797560856  # o mesmo raio que o Redis usa nas distâncias GEO
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+class LiveStateStore:
+    """
+    Estado ao vivo da frota no Redis, atualizado pela ingestão.
+    Um hash por tenant (vehicle_id -> último payload do mapa) e outro com o
+    score do dia, para que o snapshot enviado na conexão do WebSocket não
+    dependa do Postgres nem dos serializers. A última posição de cada
+    veículo também vai para um índice GEO (geohash num sorted set) por
+    tenant, que responde às buscas por raio, k mais próximos e bbox.
+    """
+
+    KEY = "fleet:live:{tenant_id}"
+    SCORE_KEY = "fleet:live:{tenant_id}:scores"
+    GEO_KEY = "fleet:geo:{tenant_id}"  # fora de fleet:live:* para não entrar no scan do snapshot
+    MAX_RESULTS = 500
+    MAX_RADIUS_KM = 20040.0  # meia volta na Terra: cobre qualquer ponto
+    MAX_LATITUDE = 85.05112878  # limite do GEOADD (projeção de Mercator)
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def update(self, items):
+        """items: [(tenant_id, payload)] na ordem recebida (o último de cada veículo vence)"""
+        positions = defaultdict(dict)
+        scores = defaultdict(dict)
+        locations = defaultdict(dict)
+        today = DriverScore.today().isoformat()
+        for tenant_id, payload in items:
+            positions[tenant_id][payload['id']] = json.dumps(dict(payload, score=None))
+            if payload.get('score') is not None:
+                scores[tenant_id][payload['id']] = f"{today}|{payload['score']}"
+            if self.valid_position(payload.get('lat'), payload.get('lng')):
+                locations[tenant_id][payload['id']] = (payload['lng'], payload['lat'])
+
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for tenant_id, mapping in positions.items():
+                pipe.hset(self.KEY.format(tenant_id=tenant_id), mapping=mapping)
+            for tenant_id, mapping in scores.items():
+                pipe.hset(self.SCORE_KEY.format(tenant_id=tenant_id), mapping=mapping)
+            for tenant_id, mapping in locations.items():
+                # Um GEOADD por tenant com o lote todo; o veículo que já estava só muda de posição
+                pipe.geoadd(self.GEO_KEY.format(tenant_id=tenant_id), [
+                    value for vehicle_id, (lng, lat) in mapping.items() for value in (lng, lat, vehicle_id)
+                ])
+            pipe.execute()
+        except RedisError:
+            logger.warning("Não foi possível atualizar o estado ao vivo no Redis")
+
+    def remove(self, tenant_id, vehicle_id):
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hdel(self.KEY.format(tenant_id=tenant_id), str(vehicle_id))
+            pipe.hdel(self.SCORE_KEY.format(tenant_id=tenant_id), str(vehicle_id))
+            pipe.zrem(self.GEO_KEY.format(tenant_id=tenant_id), str(vehicle_id))
+            pipe.execute()
+        except RedisError:
+            logger.warning("Não foi possível remover o veículo %s do estado ao vivo", vehicle_id)
+
+    @classmethod
+    def valid_position(cls, lat, lng):
+        return lat is not None and lng is not None and -cls.MAX_LATITUDE <= lat <= cls.MAX_LATITUDE and -180 <= lng <= 180
+
+    @staticmethod
+    def decode(raw, score, today):
+        payload = json.loads(raw)
+        day, _, score = (score or b'').decode().partition('|')
+        if day == today:
+            payload['score'] = int(score)
+        return payload
+
+    @classmethod
+    def merge(cls, positions, scores):
+        today = DriverScore.today().isoformat()
+        return [cls.decode(raw, scores.get(vehicle_id), today) for vehicle_id, raw in positions.items()]
+
+    # --- busca espacial ---
+
+    def nearby(self, tenant_id, lat, lng, radius_km=None, k=None):
+        """
+        Veículos do tenant por distância a (lat, lng): os k mais próximos a
+        até radius_km. Sem raio, o raio cresce (x4 a partir de 1 km) até achar
+        k veículos: no k-vizinhos o GEOSEARCH só ordena os pontos do raio.
+        """
+        k = min(k or self.MAX_RESULTS, self.MAX_RESULTS)
+        key = self.GEO_KEY.format(tenant_id=tenant_id)
+        if radius_km is not None:
+            hits = self.search(key, lng, lat, radius=radius_km, count=k)
+        else:
+            radius_km = 1.0
+            while True:
+                hits = self.search(key, lng, lat, radius=radius_km, count=k)
+                if len(hits) >= k or radius_km >= self.MAX_RADIUS_KM:
+                    break
+                radius_km = min(radius_km * 4, self.MAX_RADIUS_KM)
+        return self.payloads(tenant_id, [(vehicle_id, distance) for vehicle_id, distance, _ in hits])
+
+    def in_bbox(self, tenant_id, south, west, north, east, limit=None):
+        """
+        Veículos dentro da bbox (west > east cruza o antimeridiano), os mais
+        perto do centro primeiro. O GEOSEARCH BYBOX mede largura e altura em
+        km a partir de um centro: a caixa pedida é a menor que contém a bbox
+        (largura no paralelo mais perto do equador) e o excesso sai no filtro
+        pelas coordenadas.
+        """
+        limit = min(limit or self.MAX_RESULTS, self.MAX_RESULTS)
+        key = self.GEO_KEY.format(tenant_id=tenant_id)
+        spans = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+        center_lat, center_lng = self.bbox_center(south, west, north, east)
+        equator_lat = 0.0 if south <= 0 <= north else min(abs(south), abs(north))
+        height = 2 * math.pi * EARTH_RADIUS_KM * (north - south) / 360
+        hits = []
+        for span_west, span_east in spans:
+            width = 2 * math.pi * EARTH_RADIUS_KM * math.cos(math.radians(equator_lat)) * (span_east - span_west) / 360
+            count = limit
+            while True:
+                found = self.search(
+                    key, (span_west + span_east) / 2, center_lat, count=count,
+                    width=width * 1.001 + 0.01, height=height * 1.001 + 0.01,
+                )
+                inside = [
+                    (vehicle_id, haversine_km(center_lat, center_lng, lat, lng))
+                    for vehicle_id, _, (lng, lat) in found
+                    if south <= lat <= north and span_west <= lng <= span_east
+                ]
+                # Os cantos da caixa que ficam fora da bbox podem ter tomado vagas do limite
+                if len(inside) >= limit or len(found) < count:
+                    break
+                count *= 2
+            hits += inside
+        hits.sort(key=lambda hit: hit[1])
+        return self.payloads(tenant_id, hits[:limit])
+
+    @staticmethod
+    def bbox_center(south, west, north, east):
+        if west > east:
+            east += 360
+        center_lng = (west + east) / 2
+        return (south + north) / 2, center_lng - 360 if center_lng > 180 else center_lng
+
+    def search(self, key, lng, lat, count, radius=None, width=None, height=None):
+        """GEOSEARCH em km: [(vehicle_id, distância ao centro, (lng, lat))] do mais perto ao mais longe"""
+        return [
+            (member.decode(), distance, coordinates)
+            for member, distance, coordinates in self.client.geosearch(
+                key, longitude=lng, latitude=lat, radius=radius, width=width, height=height, unit='km',
+                sort='ASC', count=count, withdist=True, withcoord=True,
+            )
+        ]
+
+    def payloads(self, tenant_id, hits):
+        """[(vehicle_id, distância)] -> payloads do estado ao vivo com distance_km, na mesma ordem"""
+        if not hits:
+            return []
+        vehicle_ids = [vehicle_id for vehicle_id, _ in hits]
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hmget(self.KEY.format(tenant_id=tenant_id), vehicle_ids)
+        pipe.hmget(self.SCORE_KEY.format(tenant_id=tenant_id), vehicle_ids)
+        positions, scores = pipe.execute()
+        today = DriverScore.today().isoformat()
+        return [
+            dict(self.decode(raw, score, today), distance_km=round(distance, 3))
+            for (_, distance), raw, score in zip(hits, positions, scores)
+            if raw is not None  # removido entre o GEOSEARCH e o HMGET
+        ]
+
+    @classmethod
+    def from_database(cls, vehicles, lat=None, lng=None, radius_km=None, k=None, bbox=None):
+        """
+        A mesma busca sobre Vehicle.last_position_* (Redis fora do ar):
+        raio/k mais próximos a partir de (lat, lng) ou bbox (south, west,
+        north, east), os mais perto do centro primeiro.
+        """
+        vehicles = vehicles.filter(last_position_lat__isnull=False, last_position_lng__isnull=False)
+        if bbox is not None:
+            south, west, north, east = bbox
+            lat, lng = cls.bbox_center(*bbox)
+            vehicles = vehicles.filter(last_position_lat__range=(south, north))
+            vehicles = vehicles.filter(last_position_lng__range=(west, east)) if west <= east else vehicles.exclude(
+                last_position_lng__gt=east, last_position_lng__lt=west,
+            )
+        elif radius_km is not None:
+            delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+            vehicles = vehicles.filter(last_position_lat__range=(lat - delta, lat + delta))
+
+        found = []
+        for vehicle_id, name, vehicle_lat, vehicle_lng, speed, ignition in vehicles.values_list(
+            'id', 'name', 'last_position_lat', 'last_position_lng', 'last_speed', 'ignition',
+        ):
+            distance = haversine_km(lat, lng, vehicle_lat, vehicle_lng)
+            if radius_km is None or distance <= radius_km:
+                found.append({
+                    'id': str(vehicle_id), 'name': name, 'lat': vehicle_lat, 'lng': vehicle_lng,
+                    'speed': round(speed or 0, 1), 'ignition': bool(ignition), 'score': None,
+                    'distance_km': round(distance, 3),
+                })
+        found.sort(key=lambda payload: payload['distance_km'])
+        return found[:min(k or cls.MAX_RESULTS, cls.MAX_RESULTS)]
+
+    async def snapshot(self, tenant_id=None):
+        """Estado atual de um tenant (ou de todos, para o admin global)"""
+        client = get_async_redis()
+        if tenant_id is not None:
+            tenant_ids = [tenant_id]
+        else:
+            tenant_ids = [
+                key.decode().split(':')[2]
+                async for key in client.scan_iter(match=self.KEY.format(tenant_id='*'), count=500)
+                if not key.decode().endswith(':scores')
+            ]
+
+        snapshot = []
+        for tenant in tenant_ids:
+            pipe = client.pipeline(transaction=False)
+            pipe.hgetall(self.KEY.format(tenant_id=tenant))
+            pipe.hgetall(self.SCORE_KEY.format(tenant_id=tenant))
+            positions, scores = await pipe.execute()
+            snapshot.extend(self.merge(positions, scores))
+        return snapshot
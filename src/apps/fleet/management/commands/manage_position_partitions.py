@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.fleet.history import PositionHistoryService
+
+
+class Command(BaseCommand):
+    help = "Cria as partições diárias do histórico de posições e remove as que passaram da retenção"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days-ahead', type=int, default=settings.POSITION_PARTITIONS_AHEAD)
+        parser.add_argument('--retention-days', type=int, default=settings.POSITION_RETENTION_DAYS)
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        days = [today + timedelta(days=offset) for offset in range(-1, options['days_ahead'] + 1)]
+        PositionHistoryService.ensure_partitions(days)
+        self.stdout.write(f"Partições garantidas até {days[-1]}")
+
+        if options['retention_days'] > 0:
+            cutoff = today - timedelta(days=options['retention_days'])
+            dropped = PositionHistoryService.drop_partitions_before(cutoff)
+            self.stdout.write(f"Removidas {dropped} partições/linhas anteriores a {cutoff}")
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.fleet.leaderboard import ScoreLeaderboard
+from apps.tenants.models import Tenant
+
+
+class Command(BaseCommand):
+    help = "Refaz o ranking de scores no Redis a partir do DriverScore"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', help="Subdomínio do tenant (padrão: todos)")
+        parser.add_argument(
+            '--days', type=int, default=ScoreLeaderboard.RETENTION_DAYS,
+            help=f"Dias a refazer, terminando hoje (máximo {ScoreLeaderboard.RETENTION_DAYS})",
+        )
+
+    def handle(self, *args, **options):
+        tenants = Tenant.objects.all()
+        if options['tenant']:
+            tenants = tenants.filter(subdomain=options['tenant'])
+            if not tenants.exists():
+                raise CommandError(f"Tenant não encontrado: {options['tenant']}")
+        days = min(max(options['days'], 1), ScoreLeaderboard.RETENTION_DAYS)
+
+        leaderboard = ScoreLeaderboard()
+        started = time.monotonic()
+        for tenant in tenants:
+            entries = leaderboard.rebuild(tenant.pk, days=days)
+            self.stdout.write(f"  {tenant.subdomain}: {entries} scores")
+        self.stdout.write(self.style.SUCCESS(f"Ranking refeito em {time.monotonic() - started:.1f}s"))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from apps.fleet.scores import TenantScoreRecompute
+from apps.tenants.models import Tenant
+
+
+class Command(BaseCommand):
+    help = "Recalcula os DriverScore de um tenant com os pesos atuais (weight_*)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('tenant', help="Subdomínio do tenant")
+        parser.add_argument('--from', dest='start', help="Primeiro dia (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='end', help="Último dia (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        tenant = Tenant.objects.filter(subdomain=options['tenant']).first()
+        if tenant is None:
+            raise CommandError(f"Tenant não encontrado: {options['tenant']}")
+        start = parse_date(options['start']) if options['start'] else None
+        end = parse_date(options['end']) if options['end'] else None
+
+        started = time.monotonic()
+        result = TenantScoreRecompute(tenant).run(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['rows']} scores lidos, {result['updated']} alterados em {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,109 @@
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.fleet.fanout import get_fanout
+from apps.fleet.ingestion import get_ingestion_service
+from apps.fleet.telemetry_queue import TelemetryQueue
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Consome o stream de telemetria (Redis Streams) com N consumidores em paralelo"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumers', type=int, default=4, help="Número de consumidores (threads)")
+        parser.add_argument('--batch-size', type=int, default=50, help="Entradas do stream por leitura")
+        parser.add_argument('--block-ms', type=int, default=1000)
+        parser.add_argument('--claim-idle-ms', type=int, default=30000, help="Reprocessa pendentes parados há mais que isso")
+        parser.add_argument('--metrics-interval', type=int, default=30, help="Segundos entre logs de métricas (0 desliga)")
+        parser.add_argument('--stats', action='store_true', help="Mostra as métricas da fila e sai")
+
+    def handle(self, *args, **options):
+        queue = TelemetryQueue()
+        queue.ensure_group()
+
+        if options['stats']:
+            for key, value in queue.metrics().items():
+                self.stdout.write(f"{key}: {value}")
+            return
+
+        self.stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: self.stop.set())
+        signal.signal(signal.SIGINT, lambda *_: self.stop.set())
+
+        prefix = f"{socket.gethostname()}-{os.getpid()}"
+        threads = [
+            threading.Thread(
+                target=self.consume, args=(f"{prefix}-{index}", options), name=f"telemetry-{index}", daemon=True
+            )
+            for index in range(options['consumers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"{len(threads)} consumidores iniciados no stream {queue.stream}")
+
+        last_metrics = time.monotonic()
+        while not self.stop.wait(1):
+            if options['metrics_interval'] and time.monotonic() - last_metrics >= options['metrics_interval']:
+                logger.info("Fila de telemetria: %s", queue.metrics())
+                last_metrics = time.monotonic()
+
+        for thread in threads:
+            thread.join(timeout=options['block_ms'] / 1000 + 5)
+        get_fanout().flush()
+        self.stdout.write("Consumidores finalizados")
+
+    def consume(self, consumer, options):
+        queue = TelemetryQueue()
+        service = get_ingestion_service()
+        last_claim = 0
+
+        while not self.stop.is_set():
+            close_old_connections()
+            try:
+                entries = []
+                if time.monotonic() - last_claim >= options['claim_idle_ms'] / 1000:
+                    entries = queue.claim_stale(consumer, options['claim_idle_ms'], options['batch_size'])
+                    last_claim = time.monotonic()
+                if not entries:
+                    entries = queue.read(consumer, options['batch_size'], options['block_ms'])
+                if entries:
+                    queue.ack(self.process(service, entries))
+            except Exception:
+                logger.exception("Erro no consumidor %s", consumer)
+                self.stop.wait(1)
+        close_old_connections()
+
+    @staticmethod
+    def process(service, entries):
+        """
+        Processa todas as entradas num único lote; se falhar, tenta uma a uma
+        para isolar a entrada problemática. Devolve os ids que podem ser confirmados.
+        Só falhas até a etapa de scores chegam aqui (as etapas seguintes são
+        IngestionReport.guarded), então reprocessar não aplica alarmes duas vezes;
+        e o lote que falha devolve o HarshEventDetector ao estado de antes
+        dele, para as posições serem detectadas de novo.
+        """
+        try:
+            service.ingest([pos for _, positions in entries for pos in positions])
+            return [entry_id for entry_id, _ in entries]
+        except Exception:
+            logger.exception("Falha no lote de %d entradas, reprocessando individualmente", len(entries))
+
+        done = []
+        for entry_id, positions in entries:
+            try:
+                service.ingest(positions)
+                done.append(entry_id)
+            except Exception:
+                # Fica pendente; volta via claim_stale até estourar as tentativas
+                logger.exception("Falha ao processar a entrada %s", entry_id)
+        return done
@@ -0,0 +1,75 @@
+import time
+from datetime import datetime, time as dt_time, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from apps.fleet.backfill import RouteBackfill
+from apps.tenants.models import Tenant
+
+
+def parse_moment(value):
+    """Data (meia-noite UTC) ou data/hora ISO; sem fuso é UTC"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Data inválida: {value}")
+        parsed = datetime.combine(day, dt_time.min)
+    return parsed if timezone.is_aware(parsed) else parsed.replace(tzinfo=dt_timezone.utc)
+
+
+class Command(BaseCommand):
+    help = "Recupera posições perdidas pelo /api/reports/route do Traccar e refaz scores e hodômetro"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', required=True, help="Início (YYYY-MM-DD ou ISO 8601, UTC)")
+        parser.add_argument('--to', dest='end', help="Fim, exclusivo (padrão: agora)")
+        parser.add_argument('--tenant', help="Subdomínio do tenant (padrão: todos)")
+        parser.add_argument('--device', type=int, action='append', dest='devices', help="deviceId do Traccar (repetível)")
+        parser.add_argument('--workers', type=int, help="Requisições simultâneas (padrão: TRACCAR_POOL_SIZE)")
+        parser.add_argument('--devices-per-request', type=int, default=25)
+        parser.add_argument('--slice-hours', type=int, default=6, help="Tamanho da janela de cada requisição")
+        parser.add_argument('--dry-run', action='store_true', help="Só busca e conta, sem gravar")
+
+    def handle(self, *args, **options):
+        start = parse_moment(options['start'])
+        end = parse_moment(options['end']) if options['end'] else timezone.now()
+        if start >= end:
+            raise CommandError("--from precisa ser anterior a --to")
+
+        tenant = None
+        if options['tenant']:
+            tenant = Tenant.objects.filter(subdomain=options['tenant']).first()
+            if tenant is None:
+                raise CommandError(f"Tenant não encontrado: {options['tenant']}")
+
+        backfill = RouteBackfill(
+            workers=options['workers'],
+            devices_per_request=options['devices_per_request'],
+            slice_hours=options['slice_hours'],
+        )
+        vehicles = backfill.load_vehicles(tenant, options['devices'])
+        if not vehicles:
+            raise CommandError("Nenhum veículo para recuperar")
+        self.stdout.write(f"Recuperando {len(vehicles)} veículos de {start} a {end}")
+
+        started = time.monotonic()
+        step = {'last': 0}
+
+        def progress(done, total):
+            # Uma linha a cada ~5% (e na última tarefa)
+            if done == total or done - step['last'] >= max(total // 20, 1):
+                step['last'] = done
+                self.stdout.write(f"  {done}/{total} requisições ({time.monotonic() - started:.0f}s)")
+
+        result = backfill.run(vehicles, start, end, progress=progress, dry_run=options['dry_run'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['inserted']} posições {'a inserir' if options['dry_run'] else 'inseridas'} "
+            f"({result['duplicates']} já existiam) em {elapsed:.1f}s; "
+            f"{result['scores']} scores refeitos, {result['odometers']} hodômetros atualizados"
+        ))
+        if result['failed']:
+            self.stderr.write(f"{result['failed']} requisições falharam (veja o log); rode de novo para completar")
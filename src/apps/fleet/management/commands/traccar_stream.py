@@ -0,0 +1,59 @@
+import asyncio
+import logging
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.fleet.fanout import get_fanout
+from apps.fleet.traccar_stream import TraccarStream
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Ingestão contínua pelo WebSocket do Traccar (/api/socket), com reconexão e retomada"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Máximo de posições por lote")
+        parser.add_argument('--batch-ms', type=int, default=200, help="Espera máxima para fechar um lote")
+        parser.add_argument('--max-backoff', type=int, default=60, help="Segundos máximos entre reconexões")
+        parser.add_argument(
+            '--resume-max-gap', type=int, default=3600,
+            help="Janela máxima (s) reprocessada via /api/reports/route após uma queda (0 desliga)",
+        )
+        parser.add_argument('--metrics-interval', type=int, default=30, help="Segundos entre logs de métricas (0 desliga)")
+
+    def handle(self, *args, **options):
+        if settings.TRACCAR_INGESTION != 'stream':
+            raise CommandError(
+                "TRACCAR_INGESTION precisa ser 'stream' (e o forward do webhook no Traccar desligado): "
+                "com o webhook ativo cada posição seria ingerida duas vezes"
+            )
+        stream = TraccarStream(
+            batch_size=options['batch_size'],
+            batch_ms=options['batch_ms'],
+            max_backoff=options['max_backoff'],
+            resume_max_gap=options['resume_max_gap'],
+        )
+        self.stdout.write(f"Conectando em {stream.service.socket_url}")
+        asyncio.run(self.run(stream, options['metrics_interval']))
+        get_fanout().flush()
+        self.stdout.write(f"Stream encerrado: {stream.counters}")
+
+    @staticmethod
+    async def run(stream, metrics_interval):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+
+        async def report():
+            while metrics_interval:
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=metrics_interval)
+                    return
+                except asyncio.TimeoutError:
+                    logger.info("Traccar stream: %s", stream.counters)
+
+        await asyncio.gather(stream.run(stop), report())
@@ -0,0 +1,84 @@
+# Generated by Django 5.0.2 on 2026-10-18 09:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# No PostgreSQL a tabela é particionada por dia (RANGE em fix_time).
+# A PK precisa conter a chave de partição, por isso é (id, fix_time).
+POSTGRES_CREATE = """
+CREATE TABLE fleet_position (
+    id bigint GENERATED BY DEFAULT AS IDENTITY,
+    tenant_id uuid NOT NULL,
+    vehicle_id uuid NOT NULL,
+    traccar_position_id bigint NULL,
+    fix_time timestamp with time zone NOT NULL,
+    server_time timestamp with time zone NOT NULL,
+    latitude double precision NOT NULL,
+    longitude double precision NOT NULL,
+    speed double precision NOT NULL,
+    course double precision NOT NULL,
+    altitude double precision NULL,
+    ignition boolean NULL,
+    odometer_km double precision NULL,
+    attributes jsonb NOT NULL,
+    PRIMARY KEY (id, fix_time)
+) PARTITION BY RANGE (fix_time);
+CREATE TABLE fleet_position_default PARTITION OF fleet_position DEFAULT;
+CREATE INDEX fleet_pos_vehicle_time_idx ON fleet_position (vehicle_id, fix_time);
+"""
+
+
+def create_position_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_CREATE)
+    else:
+        schema_editor.create_model(apps.get_model('fleet', 'Position'))
+
+
+def drop_position_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS fleet_position CASCADE;")
+    else:
+        schema_editor.delete_model(apps.get_model('fleet', 'Position'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fleet', '0006_contract_expense_fine'),
+        ('tenants', '0003_tenant_weight_harsh_acceleration_and_more'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Position',
+                    fields=[
+                        ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                        ('traccar_position_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID no Traccar')),
+                        ('fix_time', models.DateTimeField(verbose_name='Horário do GPS')),
+                        ('server_time', models.DateTimeField(verbose_name='Recebido em')),
+                        ('latitude', models.FloatField()),
+                        ('longitude', models.FloatField()),
+                        ('speed', models.FloatField(default=0, verbose_name='Velocidade (km/h)')),
+                        ('course', models.FloatField(default=0, verbose_name='Direção')),
+                        ('altitude', models.FloatField(blank=True, null=True)),
+                        ('ignition', models.BooleanField(blank=True, null=True, verbose_name='Ignição')),
+                        ('odometer_km', models.FloatField(blank=True, null=True, verbose_name='Hodômetro (Km)')),
+                        ('attributes', models.JSONField(blank=True, default=dict)),
+                        ('tenant', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='tenants.tenant')),
+                        ('vehicle', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='positions', to='fleet.vehicle')),
+                    ],
+                    options={
+                        'verbose_name': 'Posição',
+                        'verbose_name_plural': 'Posições',
+                        'indexes': [models.Index(fields=['vehicle', 'fix_time'], name='fleet_pos_vehicle_time_idx')],
+                    },
+                ),
+            ],
+        ),
+        # Roda depois do estado para que apps.get_model('fleet', 'Position') exista
+        migrations.RunPython(create_position_table, drop_position_table),
+    ]
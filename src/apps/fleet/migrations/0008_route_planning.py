@@ -0,0 +1,43 @@
+# Generated by Django 5.0.2 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fleet', '0007_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routestop',
+            name='demand',
+            field=models.FloatField(default=0, verbose_name='Carga/Volume'),
+        ),
+        migrations.AddField(
+            model_name='routestop',
+            name='planned_arrival',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Chegada Prevista'),
+        ),
+        migrations.AddField(
+            model_name='routestop',
+            name='service_minutes',
+            field=models.IntegerField(default=5, verbose_name='Tempo no Local (min)'),
+        ),
+        migrations.AddField(
+            model_name='routestop',
+            name='window_end',
+            field=models.TimeField(blank=True, null=True, verbose_name='Atender até'),
+        ),
+        migrations.AddField(
+            model_name='routestop',
+            name='window_start',
+            field=models.TimeField(blank=True, null=True, verbose_name='Atender a partir de'),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='capacity',
+            field=models.FloatField(blank=True, null=True, verbose_name='Capacidade de Carga'),
+        ),
+    ]
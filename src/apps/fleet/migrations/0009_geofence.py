@@ -0,0 +1,57 @@
+# Generated by Django 5.0.2 on 2026-10-18 11:30
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fleet', '0008_route_planning'),
+        ('tenants', '0004_tenant_detection_limits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Geofence',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('name', models.CharField(max_length=100, verbose_name='Nome')),
+                ('kind', models.CharField(choices=[('CUSTOMER', 'Cliente'), ('DEPOT', 'Base/Depósito'), ('RESTRICTED', 'Área Restrita')], default='CUSTOMER', max_length=20, verbose_name='Tipo')),
+                ('shape', models.CharField(choices=[('POLYGON', 'Polígono'), ('CIRCLE', 'Círculo')], default='POLYGON', max_length=10, verbose_name='Formato')),
+                ('polygon', models.JSONField(blank=True, default=list, verbose_name='Vértices [[lat, lng], ...]')),
+                ('center_lat', models.FloatField(blank=True, null=True)),
+                ('center_lng', models.FloatField(blank=True, null=True)),
+                ('radius_m', models.FloatField(blank=True, null=True, verbose_name='Raio (m)')),
+                ('active', models.BooleanField(default=True, verbose_name='Ativa')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='geofences', to='tenants.tenant')),
+            ],
+            options={
+                'verbose_name': 'Cerca Virtual',
+                'verbose_name_plural': 'Cercas Virtuais',
+            },
+        ),
+        migrations.CreateModel(
+            name='GeofenceEvent',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('event', models.CharField(choices=[('ENTER', 'Entrada'), ('EXIT', 'Saída')], max_length=10, verbose_name='Evento')),
+                ('time', models.DateTimeField(verbose_name='Horário do GPS')),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('geofence', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='fleet.geofence')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tenants.tenant')),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='geofence_events', to='fleet.vehicle')),
+            ],
+            options={
+                'verbose_name': 'Evento de Cerca',
+                'verbose_name_plural': 'Eventos de Cerca',
+                'indexes': [models.Index(fields=['tenant', 'time'], name='fleet_geoevt_tenant_time_idx'), models.Index(fields=['vehicle', 'time'], name='fleet_geoevt_vehicle_time_idx')],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from apps.core.models import TimeStampedModel
 from apps.tenants.models import Tenant
 
@@ -11,6 +12,7 @@ class Vehicle(TimeStampedModel):
     model = models.CharField(max_length=50, blank=True, null=True, verbose_name="Modelo")
     year = models.IntegerField(null=True, blank=True, verbose_name="Ano")
     fuel_type = models.CharField(max_length=20, default='diesel', verbose_name="Combustível")
+    capacity = models.FloatField(null=True, blank=True, verbose_name="Capacidade de Carga")  # vazio = sem limite
     
     # Hodômetro (Importante para manutenção)
     current_km = models.FloatField(default=0, verbose_name="Km Atual")
@@ -110,6 +112,11 @@ class DriverScore(TimeStampedModel):
 
     def __str__(self):
         return f"{self.vehicle.name} - {self.date} - Score: {self.score}"
+
+    @staticmethod
+    def today():
+        """Dia dos scores ao vivo (UTC): o mesmo no banco, no Redis, no ranking e no mapa"""
+        return timezone.now().date()
     
 # ... (Mantenha todo o código anterior) ...
 
@@ -218,6 +225,13 @@ class RouteStop(TimeStampedModel):
     customer_name = models.CharField(max_length=100, blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     
+    # Planejamento (RoutePlanner): carga, janela de atendimento e tempo no local
+    demand = models.FloatField(default=0, verbose_name="Carga/Volume")
+    window_start = models.TimeField(null=True, blank=True, verbose_name="Atender a partir de")
+    window_end = models.TimeField(null=True, blank=True, verbose_name="Atender até")
+    service_minutes = models.IntegerField(default=5, verbose_name="Tempo no Local (min)")
+    planned_arrival = models.DateTimeField(null=True, blank=True, verbose_name="Chegada Prevista")
+
     # Validação da entrega (Geofence virtual)
     arrival_time = models.DateTimeField(null=True, blank=True)
     completion_time = models.DateTimeField(null=True, blank=True)
@@ -302,4 +316,103 @@ class Fine(TimeStampedModel):
         verbose_name = "Multa"
 
     def __str__(self):
-        return f"Multa {self.vehicle.plate} - {self.amount}"
\ No newline at end of file
+        return f"Multa {self.vehicle.plate} - {self.amount}"
+
+class PositionQuerySet(models.QuerySet):
+    def window(self, vehicle, start, end):
+        """Posições de um veículo numa janela de tempo (usa o índice vehicle + fix_time)"""
+        return self.filter(vehicle=vehicle, fix_time__gte=start, fix_time__lt=end).order_by('fix_time')
+
+class Position(models.Model):
+    """
+    Histórico de posições (append-only), gravado em lote pelo webhook.
+    No PostgreSQL a tabela é particionada por dia em fix_time (ver history.py),
+    por isso não herda TimeStampedModel: chave sequencial e sem updated_at.
+    """
+    id = models.BigAutoField(primary_key=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+')
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, db_constraint=False, db_index=False, related_name='positions')
+    traccar_position_id = models.BigIntegerField(null=True, blank=True, verbose_name="ID no Traccar")
+
+    fix_time = models.DateTimeField(verbose_name="Horário do GPS")
+    server_time = models.DateTimeField(verbose_name="Recebido em")
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    speed = models.FloatField(default=0, verbose_name="Velocidade (km/h)")
+    course = models.FloatField(default=0, verbose_name="Direção")
+    altitude = models.FloatField(null=True, blank=True)
+    ignition = models.BooleanField(null=True, blank=True, verbose_name="Ignição")
+    odometer_km = models.FloatField(null=True, blank=True, verbose_name="Hodômetro (Km)")
+    attributes = models.JSONField(default=dict, blank=True)
+
+    objects = PositionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Posição"
+        verbose_name_plural = "Posições"
+        indexes = [
+            models.Index(fields=['vehicle', 'fix_time'], name='fleet_pos_vehicle_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.vehicle_id} @ {self.fix_time}"
+
+
+class Geofence(TimeStampedModel):
+    """
+    Cerca virtual: polígono (vértices [[lat, lng], ...]) ou círculo (centro
+    + raio em metros). A ingestão gera GeofenceEvent quando um veículo do
+    tenant entra ou sai de uma cerca ativa.
+    """
+    KIND_CHOICES = (
+        ('CUSTOMER', 'Cliente'),
+        ('DEPOT', 'Base/Depósito'),
+        ('RESTRICTED', 'Área Restrita'),
+    )
+    SHAPE_CHOICES = (
+        ('POLYGON', 'Polígono'),
+        ('CIRCLE', 'Círculo'),
+    )
+
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='geofences')
+    name = models.CharField(max_length=100, verbose_name="Nome")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='CUSTOMER', verbose_name="Tipo")
+    shape = models.CharField(max_length=10, choices=SHAPE_CHOICES, default='POLYGON', verbose_name="Formato")
+    polygon = models.JSONField(default=list, blank=True, verbose_name="Vértices [[lat, lng], ...]")
+    center_lat = models.FloatField(null=True, blank=True)
+    center_lng = models.FloatField(null=True, blank=True)
+    radius_m = models.FloatField(null=True, blank=True, verbose_name="Raio (m)")
+    active = models.BooleanField(default=True, verbose_name="Ativa")
+
+    class Meta:
+        verbose_name = "Cerca Virtual"
+        verbose_name_plural = "Cercas Virtuais"
+
+    def __str__(self):
+        return f"{self.name} ({self.get_kind_display()})"
+
+class GeofenceEvent(TimeStampedModel):
+    """Entrada/saída de um veículo numa cerca, no horário do GPS da posição que cruzou"""
+    EVENT_CHOICES = (
+        ('ENTER', 'Entrada'),
+        ('EXIT', 'Saída'),
+    )
+
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='+')
+    geofence = models.ForeignKey(Geofence, on_delete=models.CASCADE, related_name='events')
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='geofence_events')
+    event = models.CharField(max_length=10, choices=EVENT_CHOICES, verbose_name="Evento")
+    time = models.DateTimeField(verbose_name="Horário do GPS")
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    class Meta:
+        verbose_name = "Evento de Cerca"
+        verbose_name_plural = "Eventos de Cerca"
+        indexes = [
+            models.Index(fields=['tenant', 'time'], name='fleet_geoevt_tenant_time_idx'),
+            models.Index(fields=['vehicle', 'time'], name='fleet_geoevt_vehicle_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.vehicle_id} {self.get_event_display()} {self.geofence_id} @ {self.time}"
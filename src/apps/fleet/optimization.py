@@ -0,0 +1,147 @@
+import time
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+EPSILON = 1e-9
+
+
+def distance_matrix(lats, lngs):
+    """Matriz n x n de distâncias em km (haversine), calculada de uma vez"""
+    phi = np.radians(np.asarray(lats, dtype=float))
+    lam = np.radians(np.asarray(lngs, dtype=float))
+    dphi = phi[:, None] - phi[None, :]
+    dlam = lam[:, None] - lam[None, :]
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi)[:, None] * np.cos(phi)[None, :] * np.sin(dlam / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def path_length(matrix, order):
+    """Comprimento do caminho aberto (sem volta ao início)"""
+    order = np.asarray(order)
+    return float(matrix[order[:-1], order[1:]].sum()) if len(order) > 1 else 0.0
+
+
+def nearest_neighbor(matrix, start=0):
+    """Vizinho mais próximo a partir de start: uma linha da matriz por passo"""
+    n = len(matrix)
+    order = np.empty(n, dtype=np.int64)
+    visited = np.zeros(n, dtype=bool)
+    current = order[0] = start
+    visited[start] = True
+    for step in range(1, n):
+        distances = np.where(visited, np.inf, matrix[current])
+        current = order[step] = int(np.argmin(distances))
+        visited[current] = True
+    return order
+
+
+class PathImprover:
+    """
+    Busca local 2-opt + Or-opt num caminho aberto com o início fixo.
+    Um nó fictício de custo zero fecha o caminho num ciclo
+    (último -> fictício -> início): a aresta fictício -> início nunca é
+    mexida e trocar a aresta do último nó é uma troca como qualquer outra,
+    então as fórmulas de ganho são as do caixeiro viajante fechado.
+    Cada passo avalia todos os candidatos de uma posição com NumPy e aplica o
+    melhor; as passadas se repetem até não haver melhora ou acabar o tempo.
+    on_pass(ordem), se informado, recebe o melhor caminho ao fim de cada passada.
+    """
+
+    OR_OPT_SEGMENTS = (1, 2, 3)
+
+    def __init__(self, matrix, time_budget=2.0, on_pass=None):
+        n = len(matrix)
+        self.matrix = np.zeros((n + 1, n + 1))
+        self.matrix[:n, :n] = matrix
+        self.dummy = n
+        self.deadline = time.monotonic() + time_budget
+        self.on_pass = on_pass
+        self.stats = {'two_opt': 0, 'or_opt': 0, 'passes': 0, 'timed_out': False}
+
+    def expired(self):
+        if time.monotonic() >= self.deadline:
+            self.stats['timed_out'] = True
+            return True
+        return False
+
+    def improve(self, order):
+        tour = np.append(np.asarray(order, dtype=np.int64), self.dummy)
+        improved = True
+        while improved and not self.expired():
+            self.stats['passes'] += 1
+            improved = self.two_opt(tour)
+            improved = self.or_opt(tour) or improved
+            if self.on_pass is not None:
+                self.on_pass(tour[:-1].copy())
+        return tour[:-1]
+
+    def two_opt(self, tour):
+        """Inverte tour[i..j] quando (a,b)+(c,d) -> (a,c)+(b,d) encurta; 1 <= i < j <= n - 1"""
+        matrix = self.matrix
+        last = len(tour) - 2  # posição do último nó real (o fictício vem depois)
+        improved = False
+        for i in range(1, last):
+            if self.expired():
+                break
+            a, b = tour[i - 1], tour[i]
+            c, d = tour[i + 1:last + 1], tour[i + 2:last + 2]
+            delta = matrix[a, c] + matrix[b, d] - matrix[a, b] - matrix[c, d]
+            best = int(np.argmin(delta))
+            if delta[best] < -EPSILON:
+                j = i + 1 + best
+                tour[i:j + 1] = tour[i:j + 1][::-1].copy()
+                self.stats['two_opt'] += 1
+                improved = True
+        return improved
+
+    def or_opt(self, tour):
+        """Move um trecho de 1 a 3 nós (direto ou invertido) para a melhor outra aresta"""
+        matrix = self.matrix
+        last = len(tour) - 2
+        improved = False
+        for length in self.OR_OPT_SEGMENTS:
+            i = 1
+            while i + length - 1 <= last:
+                if self.expired():
+                    return improved
+                first, end = tour[i], tour[i + length - 1]
+                p, q = tour[i - 1], tour[i + length]
+                removal = matrix[p, first] + matrix[end, q] - matrix[p, q]
+
+                # Arestas (tour[k], tour[k+1]) fora do trecho, sem a fictício -> início
+                rest = np.concatenate([tour[:i], tour[i + length:]])
+                u, v = rest[:-1], rest[1:]
+                forward = matrix[u, first] + matrix[end, v] - matrix[u, v]
+                backward = matrix[u, end] + matrix[first, v] - matrix[u, v]
+                forward[i - 1] = backward[i - 1] = np.inf  # a aresta (p, q) é o lugar de onde saiu
+                k_forward, k_backward = int(np.argmin(forward)), int(np.argmin(backward))
+                reverse = backward[k_backward] < forward[k_forward]
+                k = k_backward if reverse else k_forward
+                gain = removal - (backward[k] if reverse else forward[k])
+                if gain > EPSILON:
+                    segment = tour[i:i + length].copy()
+                    if reverse:
+                        segment = segment[::-1]
+                    tour[:] = np.concatenate([rest[:k + 1], segment, rest[k + 1:]])
+                    self.stats['or_opt'] += 1
+                    improved = True
+                else:
+                    i += 1
+        return improved
+
+
+def optimize_path(matrix, start=0, time_budget=2.0, on_pass=None):
+    """
+    Caminho aberto curto a partir de start: vizinho mais próximo como
+    solução inicial e 2-opt/Or-opt até acabar o tempo.
+    Devolve (ordem, estatísticas).
+    """
+    seed = nearest_neighbor(matrix, start)
+    if len(seed) < 3:
+        return seed, {'nearest_neighbor_km': path_length(matrix, seed)}
+    if on_pass is not None:
+        on_pass(seed.copy())
+    improver = PathImprover(matrix, time_budget, on_pass=on_pass)
+    order = improver.improve(seed)
+    return order, dict(improver.stats, nearest_neighbor_km=path_length(matrix, seed))
@@ -0,0 +1,385 @@
+import logging
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import DeliveryRoute, RouteStop, Vehicle
+from .distances import get_distance_cache
+from .optimization import PathImprover, path_length
+
+logger = logging.getLogger(__name__)
+
+EPSILON = 1e-6
+
+
+class VrpSolver:
+    """
+    Distribui e ordena paradas entre veículos (rotas abertas: cada veículo
+    sai do seu nó de partida e termina na última parada), respeitando
+    capacidade e janelas de atendimento.
+
+    Construção por inserção mais barata: as paradas entram da mais distante
+    para a mais próxima da partida e cada uma vai para a posição viável de
+    menor custo entre todas as arestas de todas as rotas, avaliadas de uma
+    vez com NumPy. A viabilidade de janela é O(1) por aresta com o
+    "max shift" de cada parada (quanto o início do atendimento pode atrasar
+    sem estourar nenhuma janela dali em diante).
+    Depois, até acabar o tempo: realocação (tira uma parada e reinsere no
+    melhor lugar, em qualquer rota) e 2-opt/Or-opt (PathImprover) nas rotas
+    sem janelas. Tudo sobre a mesma matriz de distâncias.
+
+    Nós da matriz: partidas dos veículos primeiro, depois as paradas.
+    Tempos em minutos desde a meia-noite.
+    """
+
+    def __init__(self, matrix, starts, demand, window_start, window_end, service, capacity,
+                 start_minute, speed_kmh, time_budget):
+        self.matrix = matrix
+        self.minutes_per_km = 60.0 / speed_kmh
+        self.starts = np.asarray(starts, dtype=np.int64)  # nó de partida de cada veículo
+        nodes = len(matrix)
+        first_stop = nodes - len(demand)
+        self.stop_nodes = np.arange(first_stop, nodes)
+        self.demand = np.zeros(nodes)
+        self.demand[first_stop:] = demand
+        self.earliest = np.full(nodes, float(start_minute))
+        self.earliest[first_stop:] = np.maximum(window_start, start_minute)
+        self.latest = np.full(nodes, np.inf)
+        self.latest[first_stop:] = window_end
+        self.service = np.zeros(nodes)
+        self.service[first_stop:] = service
+        self.capacity = np.asarray(capacity, dtype=float)
+        self.start_minute = float(start_minute)
+        self.deadline = time.monotonic() + time_budget
+        self.has_windows = np.isfinite(self.latest) | (self.earliest > self.start_minute)
+
+        self.routes = [[int(start)] for start in self.starts]
+        self.load = np.zeros(len(self.routes))
+        self.schedules = [None] * len(self.routes)
+        self.route_edges = [None] * len(self.routes)
+        self.edges = None
+        self.stats = {'inserted': 0, 'relocated': 0, 'two_opt': 0, 'or_opt': 0, 'timed_out': False}
+        for route in range(len(self.routes)):
+            self.reschedule(route)
+
+    # --- horários ---
+
+    def reschedule(self, route):
+        """Início de atendimento e max shift de cada posição da rota"""
+        nodes = self.routes[route]
+        size = len(nodes)
+        start = np.empty(size)
+        wait = np.zeros(size)
+        start[0] = self.start_minute
+        for position in range(1, size):
+            previous, node = nodes[position - 1], nodes[position]
+            arrival = start[position - 1] + self.service[previous] + self.matrix[previous, node] * self.minutes_per_km
+            start[position] = max(arrival, self.earliest[node])
+            wait[position] = start[position] - arrival
+        shift = np.empty(size)
+        shift[-1] = self.latest[nodes[-1]] - start[-1]
+        for position in range(size - 2, -1, -1):
+            shift[position] = min(self.latest[nodes[position]] - start[position], wait[position + 1] + shift[position + 1])
+        self.schedules[route] = (start, shift)
+
+        # Arestas da rota (u -> v, a última com v = -1) com o que a inserção precisa
+        nodes = np.asarray(nodes)
+        following = np.empty(size, dtype=np.int64)
+        following[:-1], following[-1] = nodes[1:], -1
+        start_next = np.empty(size)
+        start_next[:-1], start_next[-1] = start[1:], np.inf
+        shift_next = np.empty(size)
+        shift_next[:-1], shift_next[-1] = shift[1:], np.inf
+        self.route_edges[route] = (
+            nodes, following, start + self.service[nodes], start_next, shift_next,
+            np.full(size, route), np.arange(size),
+        )
+        self.edges = None
+
+    def edge_arrays(self):
+        """Todas as arestas de todas as rotas, concatenadas (refeito só quando alguma rota muda)"""
+        if self.edges is None:
+            self.edges = tuple(np.concatenate(arrays) for arrays in zip(*self.route_edges))
+        return self.edges
+
+    # --- inserção ---
+
+    def best_insertion(self, node):
+        """(custo, rota, posição) da inserção viável mais barata, ou None"""
+        u, v, depart, start_v, shift_v, route_of, position = self.edge_arrays()
+        has_next = v >= 0
+        v_safe = np.where(has_next, v, 0)
+        to_node = self.matrix[u, node]
+        from_node = self.matrix[node, v_safe]
+
+        start_node = np.maximum(depart + to_node * self.minutes_per_km, self.earliest[node])
+        feasible = start_node <= self.latest[node] + EPSILON
+        arrival_next = start_node + self.service[node] + from_node * self.minutes_per_km
+        push = np.maximum(arrival_next, self.earliest[v_safe]) - start_v
+        feasible &= ~has_next | (push <= shift_v + EPSILON)
+        feasible &= self.load[route_of] + self.demand[node] <= self.capacity[route_of] + EPSILON
+
+        cost = to_node + np.where(has_next, from_node - self.matrix[u, v_safe], 0.0)
+        cost = np.where(feasible, cost, np.inf)
+        best = int(np.argmin(cost))
+        if not np.isfinite(cost[best]):
+            return None
+        return float(cost[best]), int(route_of[best]), int(position[best]) + 1
+
+    def insert(self, node, route, position):
+        self.routes[route].insert(position, node)
+        self.load[route] += self.demand[node]
+        self.reschedule(route)
+
+    def remove(self, route, position):
+        node = self.routes[route].pop(position)
+        self.load[route] -= self.demand[node]
+        self.reschedule(route)
+        return node
+
+    def removal_gain(self, route, position):
+        nodes = self.routes[route]
+        previous, node = nodes[position - 1], nodes[position]
+        if position + 1 == len(nodes):
+            return self.matrix[previous, node]
+        following = nodes[position + 1]
+        return self.matrix[previous, node] + self.matrix[node, following] - self.matrix[previous, following]
+
+    # --- busca ---
+
+    def expired(self):
+        if time.monotonic() >= self.deadline:
+            self.stats['timed_out'] = True
+            return True
+        return False
+
+    def construct(self):
+        """Inserção mais barata, da parada mais distante para a mais próxima de uma partida"""
+        nearest_start = self.matrix[np.ix_(self.starts, self.stop_nodes)].min(axis=0)
+        unassigned = []
+        for node in self.stop_nodes[np.argsort(-nearest_start, kind='stable')]:
+            best = self.best_insertion(int(node))
+            if best is None:
+                unassigned.append(int(node))
+                continue
+            _, route, position = best
+            self.insert(int(node), route, position)
+            self.stats['inserted'] += 1
+        return unassigned
+
+    def relocate(self, rng):
+        """Uma passada de realocação; devolve se alguma parada mudou de lugar"""
+        improved = False
+        located = [(route, node) for route, nodes in enumerate(self.routes) for node in nodes[1:]]
+        for index in rng.permutation(len(located)):
+            if self.expired():
+                break
+            route, node = located[index]
+            position = self.routes[route].index(node)
+            gain = self.removal_gain(route, position)
+            self.remove(route, position)
+            best = self.best_insertion(node)  # a posição original continua viável: tirar só adianta os horários
+            if best is not None and best[0] < gain - EPSILON:
+                _, route, position = best
+                self.stats['relocated'] += 1
+                improved = True
+            self.insert(node, route, position)
+        return improved
+
+    def improve_paths(self):
+        """2-opt/Or-opt nas rotas cujas paradas não têm janela (a ordem não afeta carga)"""
+        for route, nodes in enumerate(self.routes):
+            if len(nodes) < 4 or self.has_windows[nodes[1:]].any():
+                continue
+            if self.expired():
+                break
+            nodes = np.asarray(nodes)
+            improver = PathImprover(self.matrix[np.ix_(nodes, nodes)], max(self.deadline - time.monotonic(), 0))
+            order = improver.improve(np.arange(len(nodes)))
+            self.stats['two_opt'] += improver.stats['two_opt']
+            self.stats['or_opt'] += improver.stats['or_opt']
+            self.routes[route] = [int(node) for node in nodes[order]]
+            self.reschedule(route)
+
+    def solve(self, seed=0):
+        unassigned = self.construct()
+        rng = np.random.default_rng(seed)
+        while not self.expired():
+            self.improve_paths()
+            if not self.relocate(rng):
+                break
+        # Com rotas mais curtas pode sobrar espaço para quem ficou de fora
+        still_unassigned = []
+        for node in unassigned:
+            best = self.best_insertion(node)
+            if best is None:
+                still_unassigned.append(node)
+            else:
+                self.insert(node, best[1], best[2])
+                self.stats['inserted'] += 1
+        return still_unassigned
+
+    def result(self, unassigned):
+        first_stop = self.stop_nodes[0]
+        routes = []
+        for route, nodes in enumerate(self.routes):
+            start, _ = self.schedules[route]
+            routes.append({
+                'stops': [node - first_stop for node in nodes[1:]],
+                'arrivals': [float(minute) for minute in start[1:]],
+                'km': path_length(self.matrix, nodes),
+                'load': float(self.load[route]),
+            })
+        return {'routes': routes, 'unassigned': [node - first_stop for node in unassigned], 'stats': dict(self.stats)}
+
+
+def solve_plan(problem, time_budget):
+    """
+    Resolve um problema montado pelo RoutePlanner.build_problem (só
+    arrays/números: pode rodar em outro processo).
+    """
+    started = time.perf_counter()
+    matrix = get_distance_cache().matrix(problem['lats'], problem['lngs'])
+    solver = VrpSolver(
+        matrix, problem['starts'], problem['demand'], problem['window_start'], problem['window_end'],
+        problem['service'], problem['capacity'], problem['start_minute'], problem['speed_kmh'],
+        max(time_budget - (time.perf_counter() - started), 0),
+    )
+    result = solver.result(solver.solve())
+    result['stats']['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def minutes(value, default):
+    return value.hour * 60 + value.minute if value is not None else default
+
+
+def clock(minute):
+    """Minutos desde a meia-noite -> "HH:MM" """
+    minute = int(round(minute))
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+class RoutePlanner:
+    """
+    Planejamento do dia de um tenant: junta as paradas pendentes das rotas
+    em rascunho (DRAFT) da data, distribui entre os veículos disponíveis
+    (VrpSolver) e grava uma DeliveryRoute otimizada por veículo usado.
+    Cada veículo sai do depósito informado ou, sem ele, da última posição
+    conhecida (ou do centro das paradas). Paradas que não couberem em
+    nenhum veículo ficam juntas numa rota DRAFT da data.
+    """
+
+    def __init__(self, tenant, day, vehicles=None, depot=None, start_time=None, speed_kmh=None):
+        self.tenant = tenant
+        self.day = day
+        self.vehicles = list(vehicles if vehicles is not None else Vehicle.objects.filter(tenant=tenant))
+        self.depot = depot  # (lat, lng) ou None
+        self.start_time = start_time or dt_time(8, 0)
+        self.speed_kmh = speed_kmh or settings.ROUTE_AVERAGE_SPEED_KMH
+        self.stops = list(
+            RouteStop.objects.filter(
+                route__tenant=tenant, route__date=day, route__status='DRAFT', status='PENDING'
+            ).select_related('route').order_by('route_id', 'sequence')
+        )
+
+    def build_problem(self):
+        lats = [stop.latitude for stop in self.stops]
+        lngs = [stop.longitude for stop in self.stops]
+        center = (float(np.mean(lats)), float(np.mean(lngs))) if self.stops else (0.0, 0.0)
+        if self.depot is not None:
+            # Depósito único: um nó só, partida de todos os veículos
+            start_lats, start_lngs, starts = [self.depot[0]], [self.depot[1]], [0] * len(self.vehicles)
+        else:
+            start_lats, start_lngs, starts = [], [], []
+            for vehicle in self.vehicles:
+                if vehicle.last_position_lat is not None and vehicle.last_position_lng is not None:
+                    position = (vehicle.last_position_lat, vehicle.last_position_lng)
+                else:
+                    position = center
+                starts.append(len(start_lats))
+                start_lats.append(position[0])
+                start_lngs.append(position[1])
+        return {
+            'lats': start_lats + lats,
+            'lngs': start_lngs + lngs,
+            'starts': starts,
+            'demand': [stop.demand for stop in self.stops],
+            'window_start': [minutes(stop.window_start, 0) for stop in self.stops],
+            'window_end': [minutes(stop.window_end, np.inf) for stop in self.stops],
+            'service': [stop.service_minutes for stop in self.stops],
+            'capacity': [vehicle.capacity if vehicle.capacity is not None else np.inf for vehicle in self.vehicles],
+            'start_minute': minutes(self.start_time, 0),
+            'speed_kmh': self.speed_kmh,
+        }
+
+    def plan(self, time_budget=None):
+        if not self.stops or not self.vehicles:
+            return {'routes': [], 'unassigned': list(range(len(self.stops))), 'stats': {}}
+        budget = settings.ROUTE_PLAN_TIME_BUDGET if time_budget is None else time_budget
+        return solve_plan(self.build_problem(), budget)
+
+    @transaction.atomic
+    def save(self, result):
+        """
+        Grava o plano: reaproveita as rotas DRAFT da data (a do próprio
+        veículo, senão uma sem veículo), cria as que faltarem, junta as
+        paradas não alocadas numa rota que continua DRAFT e apaga as que
+        ficaram sem nenhuma parada.
+        """
+        drafts = list(DeliveryRoute.objects.filter(tenant=self.tenant, date=self.day, status='DRAFT'))
+        by_vehicle = {route.vehicle_id: route for route in drafts if route.vehicle_id}
+        spare = [route for route in drafts if not route.vehicle_id]
+        midnight = timezone.make_aware(datetime.combine(self.day, dt_time.min))
+
+        routes, new_routes, stops = [], [], []
+        for vehicle, planned in zip(self.vehicles, result['routes']):
+            if not planned['stops']:
+                continue
+            route = by_vehicle.pop(vehicle.id, None) or (spare.pop(0) if spare else None)
+            if route is None:
+                route = DeliveryRoute(tenant=self.tenant, date=self.day, name=f"{vehicle.name} - {self.day:%d/%m}")
+                new_routes.append(route)
+            route.vehicle = vehicle
+            route.status = 'OPTIMIZED'
+            route.total_km_predicted = round(planned['km'], 2)
+            routes.append(route)
+            for sequence, (index, arrival) in enumerate(zip(planned['stops'], planned['arrivals']), start=1):
+                stop = self.stops[index]
+                stop.route = route
+                stop.sequence = sequence
+                stop.planned_arrival = midnight + timedelta(minutes=arrival)
+                stops.append(stop)
+
+        if result['unassigned']:
+            # Uma rascunho que sobrou (de preferência sem veículo) ou uma nova
+            leftover = (spare or list(by_vehicle.values()) or [None])[0]
+            if leftover is None:
+                leftover = DeliveryRoute(tenant=self.tenant, date=self.day, name=f"Paradas não alocadas - {self.day:%d/%m}")
+                new_routes.append(leftover)
+            for sequence, index in enumerate(result['unassigned'], start=1):
+                stop = self.stops[index]
+                stop.route = leftover
+                stop.sequence = sequence
+                stop.planned_arrival = None
+                stops.append(stop)
+
+        DeliveryRoute.objects.bulk_create(new_routes)
+        created = {route.id for route in new_routes}
+        now = timezone.now()
+        for route in routes:
+            route.updated_at = now
+        DeliveryRoute.objects.bulk_update(
+            [route for route in routes if route.id not in created],
+            ['vehicle', 'status', 'total_km_predicted', 'updated_at'],
+        )
+        for stop in stops:
+            stop.updated_at = now
+        RouteStop.objects.bulk_update(stops, ['route', 'sequence', 'planned_arrival', 'updated_at'], batch_size=1000)
+        DeliveryRoute.objects.filter(id__in=[route.id for route in drafts], status='DRAFT', stops__isnull=True).delete()
+        logger.info("Plano de %s para %s: %d rotas, %d paradas", self.tenant.pk, self.day, len(routes), len(stops))
+        return routes
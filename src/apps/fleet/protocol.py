@@ -0,0 +1,75 @@
+"""
+Protocolo binário do mapa ao vivo (subprotocolo "fleetvision.msgpack.v1").
+
+O cliente pede o subprotocolo no handshake do WebSocket; sem ele a conexão
+continua em JSON. Cada frame binário é um mapa MessagePack:
+
+    {"t": "k" | "d", "v": [[<uuid 16 bytes>, {<campo>: <valor>, ...}], ...]}
+
+"k" (keyframe) traz o estado completo dos veículos; "d" (delta) traz apenas
+os campos que mudaram desde o último frame enviado naquela conexão. Um
+veículo sempre aparece completo na primeira vez. Campos:
+
+    a = latitude  * 1e5 (int)     o = longitude * 1e5 (int)
+    s = velocidade km/h * 10 (int) i = ignição (bool)
+    c = score do dia (int)         n = nome
+
+Mensagens do cliente (subscribe/unsubscribe) podem ir em JSON ou MessagePack;
+erros voltam como {"type": "error", "data": <mensagem>}.
+"""
+import uuid
+
+import msgpack
+
+SUBPROTOCOL = "fleetvision.msgpack.v1"
+
+COORD_SCALE = 100000  # 1e-5 grau ~ 1,1 m
+SPEED_SCALE = 10
+
+
+def quantise(payload):
+    """Payload do fan-out -> campos curtos e inteiros (None = não informado)"""
+    fields = {
+        'a': round(payload['lat'] * COORD_SCALE) if payload.get('lat') is not None else None,
+        'o': round(payload['lng'] * COORD_SCALE) if payload.get('lng') is not None else None,
+        's': round((payload.get('speed') or 0) * SPEED_SCALE),
+        'i': bool(payload.get('ignition')),
+        'c': payload.get('score'),
+        'n': payload.get('name'),
+    }
+    return {key: value for key, value in fields.items() if value is not None}
+
+
+def vehicle_key(vehicle_id):
+    try:
+        return uuid.UUID(str(vehicle_id)).bytes
+    except ValueError:
+        return str(vehicle_id)
+
+
+class BinaryFrameEncoder:
+    """Estado por conexão: último valor enviado de cada campo, por veículo"""
+    __slots__ = ('_sent',)
+
+    def __init__(self):
+        self._sent = {}
+
+    def encode(self, payloads, keyframe=False):
+        """Monta o frame (bytes) ou None se nada mudou"""
+        entries = []
+        for payload in payloads:
+            fields = quantise(payload)
+            last = self._sent.get(payload['id'])
+            if keyframe or last is None:
+                changes = fields
+                self._sent[payload['id']] = fields
+            else:
+                changes = {key: value for key, value in fields.items() if last.get(key) != value}
+                if not changes:
+                    continue
+                last.update(changes)
+            entries.append([vehicle_key(payload['id']), changes])
+
+        if not entries and not keyframe:
+            return None
+        return msgpack.packb({'t': 'k' if keyframe else 'd', 'v': entries}, use_bin_type=True)
@@ -0,0 +1,211 @@
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from redis.exceptions import RedisError, WatchError
+
+from apps.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+ResolvedDevice = namedtuple('ResolvedDevice', 'vehicle_id tenant_id name')
+
+UNKNOWN_GENERATION = object()  # Redis fora: não dá para comparar, então não grava
+
+
+class DeviceResolver:
+    """
+    Cache de traccar_device_id -> (vehicle_id, tenant_id, name).
+    Três níveis: dicionário local com TTL, hash no Redis compartilhado entre os
+    processos do Daphne/workers e, por último, o banco (uma query por lote).
+    Os signals de Vehicle invalidam o local e o Redis; os outros processos
+    enxergam a mudança quando o TTL local expira.
+    Cada invalidação incrementa uma geração (no Redis e no processo). Uma
+    leitura do banco só entra nos caches se a geração não mudou desde antes
+    da query (compare-and-set com WATCH), senão um mapeamento lido antes de
+    um save poderia ser gravado depois da invalidação e durar REDIS_EXPIRE.
+    """
+
+    REDIS_KEY = "fleet:devices"
+    REDIS_VEHICLE_KEY = "fleet:devices:by_vehicle"
+    GENERATION_KEY = "fleet:devices:generation"
+    REDIS_EXPIRE = 24 * 3600
+
+    def __init__(self, ttl=None, negative_ttl=None, client=None):
+        self.ttl = ttl if ttl is not None else settings.DEVICE_RESOLVER_TTL
+        self.negative_ttl = negative_ttl if negative_ttl is not None else settings.DEVICE_RESOLVER_NEGATIVE_TTL
+        self._client = client
+        self._local = {}  # device_id -> (expira_em, ResolvedDevice ou None)
+        self._local_generation = 0
+        self._lock = threading.Lock()
+        self.counters = {'local_hits': 0, 'redis_hits': 0, 'misses': 0, 'unknown': 0}
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def resolve(self, device_id):
+        return self.resolve_many([device_id]).get(device_id)
+
+    def resolve_many(self, device_ids):
+        """Devolve {device_id: ResolvedDevice}; ids desconhecidos ficam de fora"""
+        now = time.monotonic()
+        found, pending = {}, []
+        with self._lock:
+            for device_id in set(device_ids):
+                entry = self._local.get(device_id)
+                if entry and entry[0] > now:
+                    self.counters['local_hits'] += 1
+                    if entry[1] is not None:
+                        found[device_id] = entry[1]
+                else:
+                    pending.append(device_id)
+        if not pending:
+            return found
+
+        pending = self._from_redis(pending, found)
+        if pending:
+            self._from_database(pending, found)
+        return found
+
+    def _from_redis(self, device_ids, found):
+        try:
+            values = self.client.hmget(self.REDIS_KEY, device_ids)
+        except RedisError:
+            logger.warning("Redis indisponível no DeviceResolver, consultando o banco")
+            return device_ids
+
+        missing = []
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for device_id, value in zip(device_ids, values):
+                if value is None:
+                    missing.append(device_id)
+                    continue
+                resolved = ResolvedDevice(*json.loads(value))
+                self._local[device_id] = (expires, resolved)
+                found[device_id] = resolved
+                self.counters['redis_hits'] += 1
+        return missing
+
+    def _generation(self):
+        try:
+            return self.client.get(self.GENERATION_KEY)
+        except RedisError:
+            return UNKNOWN_GENERATION
+
+    def _from_database(self, device_ids, found):
+        from .models import Vehicle
+
+        with self._lock:
+            local_generation = self._local_generation
+        generation = self._generation()
+        rows = Vehicle.objects.filter(traccar_device_id__in=device_ids).values_list(
+            'traccar_device_id', 'id', 'tenant_id', 'name'
+        )
+        loaded = {
+            device_id: ResolvedDevice(str(vehicle_id), str(tenant_id), name)
+            for device_id, vehicle_id, tenant_id, name in rows
+        }
+        now = time.monotonic()
+        with self._lock:
+            self.counters['misses'] += len(device_ids)
+            if self._local_generation != local_generation:
+                device_ids = ()  # invalidado durante a query: não guarda o que foi lido
+            for device_id in device_ids:
+                resolved = loaded.get(device_id)
+                if resolved is None:
+                    self.counters['unknown'] += 1
+                    self._local[device_id] = (now + self.negative_ttl, None)
+                else:
+                    self._local[device_id] = (now + self.ttl, resolved)
+        found.update(loaded)
+        self._store(loaded, generation)
+
+    def _store(self, resolved, generation):
+        """Grava no Redis se ninguém invalidou desde `generation` (lida antes da query)"""
+        if not resolved or generation is UNKNOWN_GENERATION:
+            return
+        try:
+            with self.client.pipeline() as pipe:
+                pipe.watch(self.GENERATION_KEY)
+                if pipe.get(self.GENERATION_KEY) != generation:
+                    return
+                pipe.multi()
+                pipe.hset(self.REDIS_KEY, mapping={
+                    device_id: json.dumps(list(device)) for device_id, device in resolved.items()
+                })
+                pipe.hset(self.REDIS_VEHICLE_KEY, mapping={
+                    device.vehicle_id: device_id for device_id, device in resolved.items()
+                })
+                pipe.expire(self.REDIS_KEY, self.REDIS_EXPIRE)
+                pipe.expire(self.REDIS_VEHICLE_KEY, self.REDIS_EXPIRE)
+                pipe.execute()
+        except WatchError:
+            pass  # invalidado entre o GET e o EXEC: a próxima consulta relê do banco
+        except RedisError:
+            logger.warning("Não foi possível gravar o DeviceResolver no Redis")
+
+    def prime(self, vehicles):
+        """Carrega veículos já em memória no cache (ex: após sincronizar com o Traccar)"""
+        generation = self._generation()
+        resolved = {
+            vehicle.traccar_device_id: ResolvedDevice(str(vehicle.id), str(vehicle.tenant_id), vehicle.name)
+            for vehicle in vehicles
+        }
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for device_id, device in resolved.items():
+                self._local[device_id] = (expires, device)
+        self._store(resolved, generation)
+
+    def invalidate(self, device_ids=(), vehicle_ids=()):
+        """Remove entradas por deviceId e/ou por veículo (pega o deviceId antigo se mudou)"""
+        device_ids = set(device_ids)
+        vehicle_ids = {str(vehicle_id) for vehicle_id in vehicle_ids}
+        try:
+            if vehicle_ids:
+                previous = self.client.hmget(self.REDIS_VEHICLE_KEY, list(vehicle_ids))
+                device_ids.update(int(device_id) for device_id in previous if device_id is not None)
+            pipe = self.client.pipeline()
+            pipe.incr(self.GENERATION_KEY)
+            if device_ids:
+                pipe.hdel(self.REDIS_KEY, *device_ids)
+            if vehicle_ids:
+                pipe.hdel(self.REDIS_VEHICLE_KEY, *vehicle_ids)
+            pipe.execute()
+        except RedisError:
+            logger.warning("Não foi possível invalidar o DeviceResolver no Redis")
+
+        with self._lock:
+            self._local_generation += 1
+            for device_id in device_ids:
+                self._local.pop(device_id, None)
+            if vehicle_ids:
+                for device_id, (_, device) in list(self._local.items()):
+                    if device is not None and device.vehicle_id in vehicle_ids:
+                        del self._local[device_id]
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self.counters, local_size=len(self._local))
+        lookups = data['local_hits'] + data['redis_hits'] + data['misses']
+        data['hit_rate'] = round((data['local_hits'] + data['redis_hits']) / lookups, 4) if lookups else None
+        return data
+
+
+_resolver = None
+
+
+def get_device_resolver():
+    global _resolver
+    if _resolver is None:
+        _resolver = DeviceResolver()
+    return _resolver
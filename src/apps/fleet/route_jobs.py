@@ -0,0 +1,137 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+from .ingestion import tenant_group_name
+from .jobs import JobStore, execute_job
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND = 'route_optimize'
+LOCK = 'route_optimize:{route_id}'
+LOCK_TTL = 10 * 60  # segundos; libera a rota se o worker morrer no meio
+
+
+def init_worker():
+    # spawn: o worker começa do zero (nada de fork de um Daphne com threads e event loop)
+    import django
+    django.setup()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_route_pool(reset=False):
+    """
+    Pool de processos das otimizações (ROUTE_OPTIMIZATION_WORKERS, padrão um
+    por núcleo): a busca local é CPU pura e não pode disputar o GIL com o
+    event loop do Daphne.
+    """
+    global _pool
+    with _pool_lock:
+        if reset and _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.ROUTE_OPTIMIZATION_WORKERS or os.cpu_count(),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+            )
+        return _pool
+
+
+def publish_progress(tenant_id, message):
+    """Mensagem route_progress no grupo do tenant; falha aqui não derruba o job"""
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            tenant_group_name(tenant_id), {"type": "route_progress", "message": message},
+        )
+    except Exception:
+        logger.warning("Não foi possível publicar o progresso da otimização %s", message.get('job_id'), exc_info=True)
+
+
+def optimize_route(progress, job_id, route_id, time_budget):
+    """Alvo do job: otimiza, grava a rota e transmite a melhor ordem parcial"""
+    from .models import DeliveryRoute
+    from .services import RouteOptimizer
+
+    route = DeliveryRoute.objects.get(pk=route_id)
+    started = time.monotonic()
+    last_sent = 0.0
+
+    def on_pass(stop_ids, km):
+        nonlocal last_sent
+        now = time.monotonic()
+        if now - last_sent < settings.ROUTE_OPTIMIZATION_PROGRESS_INTERVAL:
+            return
+        last_sent = now
+        elapsed = round(now - started, 2)
+        progress(elapsed, time_budget, stage='local_search', km=km)
+        publish_progress(route.tenant_id, {
+            'job_id': job_id, 'route_id': str(route_id), 'status': 'running',
+            'elapsed': elapsed, 'time_budget': time_budget, 'km': km, 'stops': [str(stop_id) for stop_id in stop_ids],
+        })
+
+    result = RouteOptimizer.optimize_route(route, time_budget=time_budget, progress=on_pass)
+    route.status = 'OPTIMIZED'
+    route.total_km_predicted = result['total_km']
+    route.save(update_fields=['status', 'total_km_predicted', 'updated_at'])
+    return result
+
+
+def run_route_job(job, route_id, tenant_id, time_budget):
+    """Roda no worker do pool: executa o job e avisa o tenant do resultado"""
+    store = JobStore()
+    execute_job(
+        store, job, optimize_route, lock=LOCK.format(route_id=route_id),
+        job_id=job['id'], route_id=route_id, time_budget=time_budget,
+    )
+    final = store.get(job['id']) or {}
+    publish_progress(tenant_id, {
+        'job_id': job['id'], 'route_id': str(route_id), 'status': final.get('status'),
+        'result': final.get('result'), 'error': final.get('error'),
+    })
+
+
+def submit_route_optimization(route, time_budget):
+    """
+    Cria o job e manda para o pool. Devolve (job, None) ou, se a rota já
+    estiver sendo otimizada, (None, id desse job). RedisError sobe.
+    """
+    store = JobStore()
+    job = store.create(JOB_KIND, tenant_id=str(route.tenant_id), route_id=str(route.id), time_budget=time_budget)
+    lock = LOCK.format(route_id=route.id)
+    holder = store.acquire(lock, job['id'], ttl=LOCK_TTL)
+    if holder is not True:
+        store.delete(job['id'])
+        return None, holder
+
+    args = (job, route.id, route.tenant_id, time_budget)
+    try:
+        future = get_route_pool().submit(run_route_job, *args)
+    except BrokenProcessPool:
+        # Um worker morreu (OOM, kill): o pool inteiro fica inutilizável
+        logger.warning("Pool de otimização quebrado, recriando")
+        future = get_route_pool(reset=True).submit(run_route_job, *args)
+
+    def check(future):
+        # O worker morreu antes de gravar o resultado: o job não fica "running" para sempre
+        if future.cancelled() or future.exception() is not None:
+            error = 'cancelado' if future.cancelled() else str(future.exception())
+            logger.error("Job de otimização %s morreu no pool: %s", job['id'], error)
+            store.update(job['id'], status='failed', error=error, finished_at=timezone.now().isoformat())
+            store.release(lock, job['id'])
+
+    future.add_done_callback(check)
+    return job, None
@@ -0,0 +1,412 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from redis.exceptions import RedisError, WatchError
+
+from apps.core.redis_client import get_redis
+from apps.tenants.models import Tenant
+from .jobs import JobStore, run_in_background
+from .leaderboard import ScoreLeaderboard
+from .models import DriverScore, Vehicle
+from .services import ScoreService, chunked
+
+logger = logging.getLogger(__name__)
+
+COUNT_FIELDS = [count_field for count_field, _ in ScoreService.ALARMS.values()]
+
+
+class ScoreWriteBehind:
+    """
+    Score do dia acumulado no Redis e gravado no DriverScore em lote.
+    Cada (veículo, dia) tem um hash com os contadores e a penalidade total,
+    semeado do DriverScore no primeiro alarme do dia; depois disso os alarmes
+    só fazem HINCRBY (atômico entre processos) e o score ao vivo é
+    100 - penalidade (mínimo 0), sem tocar no banco.
+    A cada SCORE_FLUSH_INTERVAL segundos os hashes alterados são gravados com
+    um único upsert dos valores absolutos: regravar é idempotente e um flush
+    que falha devolve as chaves para o próximo.
+    """
+
+    KEY = "fleet:scores:{day}:{vehicle_id}"
+    DIRTY_KEY = "fleet:scores:dirty"
+    LOCK_KEY = "fleet:scores:flush-lock"
+    TTL = 2 * 24 * 3600  # o hash de ontem ainda serve ao flush atrasado
+    FLUSH_CHUNK = 1000
+    REWEIGH_CHUNK = 100
+    REWEIGH_ATTEMPTS = 5
+
+    def __init__(self, interval=None, client=None):
+        self.interval = settings.SCORE_FLUSH_INTERVAL if interval is None else interval
+        self._client = client
+        self._thread = None
+        self._lock = threading.Lock()
+        self.counters = {'events': 0, 'flushes': 0, 'flushed': 0}
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def key(self, day, vehicle_id):
+        return self.KEY.format(day=day.isoformat(), vehicle_id=vehicle_id)
+
+    def apply(self, events, day):
+        """
+        events: [(vehicle, tipo)] com vehicle.tenant carregado.
+        Devolve o score após cada evento, na ordem (RedisError sobe).
+        """
+        client = self.client
+        keys = {str(vehicle.id): self.key(day, vehicle.id) for vehicle, _ in events}  # id pode vir como str ou UUID
+
+        pipe = client.pipeline(transaction=False)
+        for key in keys.values():
+            pipe.exists(key)
+        missing = [vehicle_id for vehicle_id, exists in zip(keys, pipe.execute()) if not exists]
+
+        pipe = client.pipeline(transaction=True)
+        if missing:
+            # Primeiro alarme do dia neste Redis: parte do que já está no banco
+            stored = {
+                str(row['vehicle_id']): row
+                for row in DriverScore.objects.filter(date=day, vehicle_id__in=missing).values(
+                    'vehicle_id', 'score', *COUNT_FIELDS
+                )
+            }
+            for vehicle_id in missing:
+                row = stored.get(vehicle_id) or dict(dict.fromkeys(COUNT_FIELDS, 0), score=100)
+                seed = {field: row[field] for field in COUNT_FIELDS}
+                seed['penalty'] = 100 - row['score']
+                # HSETNX: se outro processo semeou antes, vale o dele (mesma origem)
+                for field, value in seed.items():
+                    pipe.hsetnx(keys[vehicle_id], field, value)
+
+        first_event = len(pipe)
+        for vehicle, event_type in events:
+            count_field, weight_field = ScoreService.ALARMS.get(event_type, (None, None))
+            if count_field:
+                pipe.hincrby(keys[str(vehicle.id)], count_field, 1)
+            pipe.hincrby(keys[str(vehicle.id)], 'penalty', getattr(vehicle.tenant, weight_field) if weight_field else 0)
+        for key in keys.values():
+            pipe.expire(key, self.TTL)
+        pipe.sadd(self.DIRTY_KEY, *keys.values())
+        results = pipe.execute()
+
+        # A penalidade acumulada é a última resposta de cada evento
+        scores = []
+        index = first_event
+        for vehicle, event_type in events:
+            index += 2 if event_type in ScoreService.ALARMS else 1
+            scores.append(max(0, 100 - results[index - 1]))
+        self.counters['events'] += len(events)
+        self._ensure_thread()
+        return scores
+
+    def flush(self):
+        """Grava no DriverScore os hashes alterados desde o último flush"""
+        client = self.client
+        if not client.set(self.LOCK_KEY, '1', nx=True, ex=max(int(self.interval) * 10, 60)):
+            return 0  # outro processo está gravando
+        flushed = 0
+        try:
+            while True:
+                keys = client.spop(self.DIRTY_KEY, self.FLUSH_CHUNK)
+                if not keys:
+                    break
+                try:
+                    flushed += self._flush_keys(client, keys)
+                except Exception:
+                    # Qualquer falha devolve as chaves já retiradas do conjunto para o próximo flush
+                    client.sadd(self.DIRTY_KEY, *keys)
+                    raise
+        finally:
+            client.delete(self.LOCK_KEY)
+        self.counters['flushes'] += 1
+        self.counters['flushed'] += flushed
+        return flushed
+
+    def _flush_keys(self, client, keys):
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+        pending, partial = {}, {}
+        for key, values in zip(keys, pipe.execute()):
+            if not values:  # vazio = expirou ou foi invalidado
+                continue
+            _, _, day, vehicle_id = key.decode().split(':')
+            values = {field.decode(): int(value) for field, value in values.items()}
+            if 'penalty' in values and all(field in values for field in COUNT_FIELDS):
+                pending[(vehicle_id, day)] = values
+            else:
+                partial[(vehicle_id, day)] = key
+        if partial:
+            pending.update(self._seed_partial(client, partial))
+
+        # Veículo removido antes do flush: o score dele é descartado
+        tenants = {
+            str(vehicle_id): tenant_id
+            for vehicle_id, tenant_id in Vehicle.objects.filter(
+                id__in={vehicle_id for vehicle_id, _ in pending}
+            ).values_list('id', 'tenant_id')
+        }
+        scores = []
+        for (vehicle_id, day), values in pending.items():
+            if vehicle_id not in tenants:
+                continue
+            score = DriverScore(
+                vehicle_id=vehicle_id, tenant_id=tenants[vehicle_id], date=day,
+                score=max(0, 100 - values.get('penalty', 0)),
+            )
+            for field in COUNT_FIELDS:
+                setattr(score, field, values.get(field, 0))
+            scores.append(score)
+        DriverScore.objects.bulk_create(
+            scores, update_conflicts=True, unique_fields=['vehicle', 'date'],
+            update_fields=COUNT_FIELDS + ['score', 'updated_at'],
+        )
+        return len(scores)
+
+    def _seed_partial(self, client, partial):
+        """
+        Hash sem a semente do banco: o HINCRBY recriou a chave depois de um
+        invalidate() ou de expirar entre o EXISTS e o MULTI do apply(). O que
+        ele tem são só os alarmes posteriores, então soma o DriverScore por
+        HINCRBY (atômico com os alarmes que chegarem no meio) e o hash volta
+        a ter os valores absolutos.
+        """
+        logger.warning("%d scores ao vivo sem a semente do banco; somando ao DriverScore", len(partial))
+        stored = {
+            (str(row['vehicle_id']), row['date'].isoformat()): row
+            for row in DriverScore.objects.filter(
+                vehicle_id__in={vehicle_id for vehicle_id, _ in partial},
+                date__in={day for _, day in partial},
+            ).values('vehicle_id', 'date', 'score', *COUNT_FIELDS)
+        }
+        pipe = client.pipeline(transaction=True)
+        for pair, key in partial.items():
+            row = stored.get(pair) or dict(dict.fromkeys(COUNT_FIELDS, 0), score=100)
+            for field in COUNT_FIELDS:
+                pipe.hincrby(key, field, row[field])
+            pipe.hincrby(key, 'penalty', 100 - row['score'])
+        results = iter(pipe.execute())
+        return {pair: {field: next(results) for field in COUNT_FIELDS + ['penalty']} for pair in partial}
+
+    def invalidate(self, pairs):
+        """Descarta o score ao vivo de [(vehicle_id, dia)] (ex: depois de um recálculo no banco)"""
+        keys = [self.key(day, vehicle_id) for vehicle_id, day in pairs]
+        if not keys:
+            return
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(*keys)
+        pipe.srem(self.DIRTY_KEY, *keys)
+        pipe.execute()
+
+    def reweigh(self, pairs, weights):
+        """
+        Refaz no lugar a penalidade dos hashes de [(vehicle_id, dia)] com os
+        pesos novos (weights na ordem de COUNT_FIELDS), a partir dos
+        contadores do próprio hash. Ao contrário de descartar o hash, não
+        perde os alarmes aplicados depois do último flush: o WATCH refaz o
+        bloco se um alarme chegar entre a leitura e a escrita, e o hash volta
+        ao conjunto de alterados para o próximo flush gravar o score novo.
+        Devolve quantos hashes foram reescritos.
+        """
+        client = self.client
+        keys = [self.key(day, vehicle_id) for vehicle_id, day in pairs]
+        rewritten = 0
+        for chunk in chunked(keys, self.REWEIGH_CHUNK):
+            for _ in range(self.REWEIGH_ATTEMPTS):
+                try:
+                    with client.pipeline(transaction=True) as pipe:
+                        pipe.watch(*chunk)
+                        reader = client.pipeline(transaction=False)
+                        for key in chunk:
+                            reader.hgetall(key)
+                        current = reader.execute()
+                        pipe.multi()
+                        changed = 0
+                        for key, values in zip(chunk, current):
+                            if not values:
+                                continue  # sem score ao vivo: o banco já está certo
+                            counts = {field.decode(): int(value) for field, value in values.items()}
+                            # Hash sem semente também serve: a penalidade dos deltas é a soma dos deltas
+                            penalty = sum(counts.get(field, 0) * int(weight) for field, weight in zip(COUNT_FIELDS, weights))
+                            pipe.hset(key, 'penalty', penalty)
+                            changed += 1
+                        if changed:
+                            pipe.sadd(self.DIRTY_KEY, *chunk)
+                            pipe.execute()
+                    rewritten += changed
+                    break
+                except WatchError:
+                    continue
+            else:
+                logger.warning("Alarmes concorrentes: %d scores ao vivo ficaram com os pesos antigos", len(chunk))
+        return rewritten
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="fleet-score-flush", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                # A thread não pode morrer: as chaves voltaram para o conjunto e o próximo ciclo tenta de novo
+                logger.exception("Falha ao gravar no banco os scores acumulados no Redis")
+
+
+_score_buffer = None
+
+
+def get_score_buffer():
+    global _score_buffer
+    if _score_buffer is None:
+        _score_buffer = ScoreWriteBehind()
+        atexit.register(_flush_at_exit)
+    return _score_buffer
+
+
+def _flush_at_exit():
+    try:
+        _score_buffer.flush()
+    except Exception:
+        logger.exception("Falha ao gravar os scores pendentes no encerramento")
+
+
+class TenantScoreRecompute:
+    """
+    Refaz os scores de um tenant com os pesos atuais (o admin mudou um
+    weight_*). Os contadores do período são lidos em blocos (keyset por id)
+    como uma matriz linhas x alarmes; o score novo sai de uma vez,
+    max(0, 100 - contadores @ pesos), o mesmo que o process_event acumula
+    evento a evento. Só as linhas que mudaram são gravadas, agrupadas pelo
+    score novo.
+    """
+
+    BLOCK = 50000
+
+    def __init__(self, tenant, chunk_size=2000):
+        self.tenant = tenant
+        self.chunk_size = chunk_size
+
+    def weights(self):
+        return np.array([getattr(self.tenant, weight_field) for _, weight_field in ScoreService.ALARMS.values()], dtype=np.int64)
+
+    def run(self, start=None, end=None, progress=None):
+        report = progress or (lambda done, total, stage=None: None)
+        buffer = get_score_buffer() if settings.SCORE_WRITE_BEHIND else None
+        if buffer is not None:
+            try:
+                buffer.flush()  # o banco precisa ter os alarmes que ainda estão no Redis
+            except RedisError:
+                logger.warning("Redis indisponível: scores ainda não gravados ficam com os pesos antigos")
+                buffer = None
+
+        queryset = DriverScore.objects.filter(tenant=self.tenant)
+        if start:
+            queryset = queryset.filter(date__gte=start)
+        if end:
+            queryset = queryset.filter(date__lte=end)
+        total = queryset.count()
+        weights = self.weights()
+        result = {'rows': 0, 'updated': 0}
+        report(0, total, 'recompute')
+
+        last_id = None
+        while True:
+            block = queryset.order_by('id')
+            if last_id is not None:
+                block = block.filter(id__gt=last_id)
+            rows = list(block.values_list('id', 'score', *COUNT_FIELDS)[:self.BLOCK])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            values = np.array([row[1:] for row in rows], dtype=np.int64)
+            scores = np.maximum(0, 100 - values[:, 1:] @ weights)
+            changed = np.flatnonzero(scores != values[:, 0])
+            # Score é 0..100: um UPDATE por valor (em lotes de ids) em vez do CASE do bulk_update
+            now = timezone.now()
+            new_scores = scores[changed]
+            with transaction.atomic():
+                for value in np.unique(new_scores):
+                    ids = [rows[index][0] for index in changed[new_scores == value]]
+                    for chunk in chunked(ids, self.chunk_size):
+                        DriverScore.objects.filter(id__in=chunk).update(score=int(value), updated_at=now)
+            result['rows'] += len(rows)
+            result['updated'] += len(changed)
+            report(result['rows'], total, 'recompute')
+
+        if buffer is not None:
+            # O score ao vivo de hoje (e de ontem, ainda no Redis) passa para os pesos novos sem
+            # descartar os alarmes que chegaram depois do flush do início
+            today = DriverScore.today()
+            vehicle_ids = Vehicle.objects.filter(tenant=self.tenant).values_list('id', flat=True)
+            try:
+                buffer.reweigh(
+                    [(vehicle_id, day) for vehicle_id in vehicle_ids for day in (today, today - timedelta(days=1))], weights,
+                )
+            except RedisError:
+                logger.warning("Não foi possível atualizar os scores ao vivo do tenant %s", self.tenant.pk)
+        try:
+            ScoreLeaderboard().rebuild(self.tenant.pk)
+        except RedisError:
+            logger.warning("Não foi possível refazer o ranking do tenant %s", self.tenant.pk)
+        logger.info("Scores do tenant %s recalculados: %s", self.tenant.pk, result)
+        return result
+
+
+RECOMPUTE_LOCK = "score_recompute:{tenant_id}"
+RECOMPUTE_PENDING_KEY = "fleet:scores:recompute-pending:{tenant_id}"
+RECOMPUTE_LOCK_TTL = 3600
+
+
+def recompute_tenant_scores(tenant_id, progress=None, store=None):
+    """
+    Recalcula enquanto houver pedido pendente: uma mudança de peso durante o
+    cálculo marca o pedido de novo e a próxima volta relê os pesos.
+    """
+    if store is None:
+        return TenantScoreRecompute(Tenant.objects.get(pk=tenant_id)).run(progress=progress)
+    result = None
+    pending_key = RECOMPUTE_PENDING_KEY.format(tenant_id=tenant_id)
+    while store.client.delete(pending_key):
+        result = TenantScoreRecompute(Tenant.objects.get(pk=tenant_id)).run(progress=progress)
+    return result
+
+
+def schedule_tenant_recompute(tenant_id):
+    """
+    Dispara o recálculo do tenant em background (job no JobStore). Se já
+    houver um rodando, ele mesmo refaz a conta com os pesos novos.
+    Sem Redis, recalcula na hora.
+    """
+    store = JobStore()
+    lock = RECOMPUTE_LOCK.format(tenant_id=tenant_id)
+    try:
+        store.client.set(RECOMPUTE_PENDING_KEY.format(tenant_id=tenant_id), 1, ex=RECOMPUTE_LOCK_TTL)
+        job = store.create('score_recompute', tenant_id=str(tenant_id))
+        holder = store.acquire(lock, job['id'], ttl=RECOMPUTE_LOCK_TTL)
+    except RedisError:
+        logger.warning("Redis indisponível, recalculando os scores do tenant %s na hora", tenant_id)
+        return recompute_tenant_scores(tenant_id)
+    if holder is not True:
+        store.delete(job['id'])
+        return None
+    run_in_background(
+        store, job, lambda progress: recompute_tenant_scores(tenant_id, progress=progress, store=store), lock=lock,
+    )
+    return job
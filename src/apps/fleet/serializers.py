@@ -3,7 +3,8 @@ from .models import (
     Vehicle, Tire, MaintenancePlan, WorkOrder, 
     DriverScore, WorkShift, ShiftEvent, 
     DeliveryRoute, RouteStop,
-    Contract, Expense, Fine # Novos
+    Contract, Expense, Fine, # Novos
+    Position, Geofence, GeofenceEvent
 )
 # ... (Mantenha VehicleSerializer, TireSerializer, etc) ...
 class TireSerializer(serializers.ModelSerializer):
@@ -44,8 +45,7 @@ class VehicleSerializer(serializers.ModelSerializer):
         return obj.work_orders.filter(status='PENDING').count()
     
     def get_today_score(self, obj):
-        from django.utils import timezone
-        score = obj.scores.filter(date=timezone.now().date()).first()
+        score = obj.scores.filter(date=DriverScore.today()).first()
         return score.score if score else 100
     
 class ShiftEventSerializer(serializers.ModelSerializer):
@@ -91,4 +91,46 @@ class FineSerializer(serializers.ModelSerializer):
     driver_name = serializers.CharField(source='driver.user.get_full_name', read_only=True)
     class Meta:
         model = Fine
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class PositionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Position
+        fields = ['fix_time', 'latitude', 'longitude', 'speed', 'course', 'altitude', 'ignition', 'odometer_km', 'attributes']
+
+class GeofenceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Geofence
+        fields = '__all__'
+        read_only_fields = ('tenant',)
+
+    def validate(self, attrs):
+        data = {**{field: getattr(self.instance, field) for field in ('shape', 'polygon', 'center_lat', 'center_lng', 'radius_m')}, **attrs} \
+            if self.instance else attrs
+        if data.get('shape', 'POLYGON') == 'CIRCLE':
+            lat, lng, radius = data.get('center_lat'), data.get('center_lng'), data.get('radius_m')
+            if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                raise serializers.ValidationError({'center_lat': "Informe um centro válido para a cerca circular."})
+            if not radius or radius <= 0:
+                raise serializers.ValidationError({'radius_m': "O raio deve ser maior que zero."})
+            return attrs
+        polygon = data.get('polygon') or []
+        try:
+            vertices = [(float(lat), float(lng)) for lat, lng in polygon]
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({'polygon': "Os vértices devem ser pares [lat, lng]."})
+        if len(vertices) < 3:
+            raise serializers.ValidationError({'polygon': "O polígono precisa de pelo menos 3 vértices."})
+        if not all(-90 <= lat <= 90 and -180 <= lng <= 180 for lat, lng in vertices):
+            raise serializers.ValidationError({'polygon': "Vértice com coordenadas fora do intervalo."})
+        if 'polygon' in attrs:
+            attrs['polygon'] = [list(vertex) for vertex in vertices]
+        return attrs
+
+class GeofenceEventSerializer(serializers.ModelSerializer):
+    geofence_name = serializers.CharField(source='geofence.name', read_only=True)
+    vehicle_name = serializers.CharField(source='vehicle.name', read_only=True)
+
+    class Meta:
+        model = GeofenceEvent
+        fields = '__all__'
@@ -1,85 +1,319 @@
-import requests
+import logging
 import math
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+import requests
+from redis.exceptions import RedisError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.fields.json import KT
 from django.utils import timezone
-from .models import Vehicle, DriverScore
+from django.utils.dateparse import parse_datetime
+from apps.tenants.models import Tenant
+from .leaderboard import ScoreLeaderboard
+from .models import Vehicle, DriverScore, Position, RouteStop
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_traccar_session():
+    """Sessão HTTP compartilhada com o Traccar (keep-alive, pool de conexões e retry em GET)"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.auth = (settings.TRACCAR_USER, settings.TRACCAR_PASSWORD)
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.TRACCAR_POOL_SIZE,
+                    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=('GET',)),
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
 
 class TraccarService:
-    # ... (Mantenha o código existente da Fase 3 aqui: __init__, get_devices, sync_devices) ...
     def __init__(self):
         self.base_url = settings.TRACCAR_BASE_URL
-        self.auth = (settings.TRACCAR_USER, settings.TRACCAR_PASSWORD)
+        self.session = get_traccar_session()
+        self.timeout = settings.TRACCAR_TIMEOUT
+
+    def fetch_devices(self):
+        """Lista de devices do Traccar; erros de rede/HTTP sobem (requests.RequestException)"""
+        response = self.session.get(f"{self.base_url}/api/devices", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
 
     def get_devices(self):
         try:
-            response = requests.get(f"{self.base_url}/api/devices", auth=self.auth)
-            response.raise_for_status()
-            return response.json()
+            return self.fetch_devices()
         except requests.exceptions.RequestException as e:
-            print(f"Erro ao conectar no Traccar: {e}")
+            logger.error("Erro ao conectar no Traccar: %s", e)
             return []
 
-    def sync_devices(self, default_tenant=None):
-        devices = self.get_devices()
-        synced_count = 0
-        from .models import Vehicle
-        for device in devices:
-            if not default_tenant: continue
-            obj, created = Vehicle.objects.update_or_create(
-                traccar_device_id=device['id'],
-                defaults={
-                    'name': device.get('name', 'Sem Nome'),
-                    'tenant': default_tenant,
-                    'last_update': device.get('lastUpdate'),
-                }
+    def open_session(self):
+        """Login em /api/session; devolve o header Cookie exigido pelo /api/socket"""
+        response = self.session.post(
+            f"{self.base_url}/api/session",
+            data={'email': settings.TRACCAR_USER, 'password': settings.TRACCAR_PASSWORD},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return '; '.join(f"{name}={value}" for name, value in response.cookies.items())
+
+    @property
+    def socket_url(self):
+        if settings.TRACCAR_SOCKET_URL:
+            return settings.TRACCAR_SOCKET_URL
+        scheme, _, rest = self.base_url.partition('://')
+        return f"{'wss' if scheme == 'https' else 'ws'}://{rest.rstrip('/')}/api/socket"
+
+    def fetch_route(self, device_ids, start, end):
+        """Posições de /api/reports/route de vários devices numa janela (ordem do Traccar)"""
+        response = self.session.get(
+            f"{self.base_url}/api/reports/route",
+            params={'deviceId': list(device_ids), 'from': start.isoformat(), 'to': end.isoformat()},
+            headers={'Accept': 'application/json'},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def sync_devices(self, default_tenant=None, progress=None, chunk_size=None):
+        """
+        Sincroniza os devices do Traccar com os veículos.
+        Compara a lista com os veículos existentes numa query só; devices novos
+        são criados no default_tenant e os existentes só são gravados se o nome
+        ou o lastUpdate mudou, sempre em lotes (bulk_create/bulk_update).
+        progress(feitos, total, etapa) é chamado a cada lote.
+        """
+        result = {'devices': 0, 'created': 0, 'updated': 0, 'unchanged': 0}
+        if not default_tenant:
+            return result
+        from .resolver import get_device_resolver
+
+        chunk_size = chunk_size or settings.TRACCAR_SYNC_CHUNK_SIZE
+        report = progress or (lambda done, total, stage=None: None)
+
+        report(0, 0, 'fetch')
+        devices = self.fetch_devices()
+        result['devices'] = len(devices)
+
+        existing = {
+            device_id: (vehicle_id, tenant_id, name, last_update)
+            for device_id, vehicle_id, tenant_id, name, last_update in Vehicle.objects.values_list(
+                'traccar_device_id', 'id', 'tenant_id', 'name', 'last_update'
             )
-            synced_count += 1
-        return synced_count
+        }
+        now = timezone.now()
+        to_create, to_update = [], []
+        for device in devices:
+            name = device.get('name') or 'Sem Nome'
+            last_update = self.parse_last_update(device.get('lastUpdate'))
+            current = existing.get(device['id'])
+            if current is None:
+                to_create.append(Vehicle(
+                    tenant=default_tenant, traccar_device_id=device['id'], name=name, last_update=last_update
+                ))
+            elif current[2] == name and current[3] == last_update:
+                result['unchanged'] += 1
+            else:
+                to_update.append(Vehicle(
+                    id=current[0], tenant_id=current[1], traccar_device_id=device['id'],
+                    name=name, last_update=last_update, updated_at=now,
+                ))
+
+        total, done = len(to_create) + len(to_update), 0
+        report(done, total, 'write')
+        for chunk in chunked(to_create, chunk_size):
+            Vehicle.objects.bulk_create(chunk)
+            done += len(chunk)
+            report(done, total, 'write')
+        for chunk in chunked(to_update, chunk_size):
+            Vehicle.objects.bulk_update(chunk, ['name', 'last_update', 'updated_at'])
+            done += len(chunk)
+            report(done, total, 'write')
+
+        # bulk_* não disparam signals: carrega o cache com os veículos gravados
+        get_device_resolver().prime(to_create + to_update)
+        ScoreLeaderboard().add([(vehicle.tenant_id, vehicle.id) for vehicle in to_create])
+        result['created'], result['updated'] = len(to_create), len(to_update)
+        logger.info("Sincronização com o Traccar: %s", result)
+        return result
+
+    @staticmethod
+    def parse_last_update(value):
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is not None and timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed, dt_timezone.utc)
+        return parsed
 
 class ScoreService:
     """Processa eventos de telemetria e atualiza o Score"""
-    
-    @staticmethod
-    def process_event(vehicle, event_type):
-        today = timezone.now().date()
-        tenant = vehicle.tenant
 
-        # Pega ou cria o score de hoje
-        score_obj, created = DriverScore.objects.get_or_create(
-            vehicle=vehicle,
-            date=today,
-            defaults={'tenant': tenant, 'score': 100}
-        )
-        
-        penalty = 0
-        
-        # Aplica a penalidade baseada na configuração do Tenant
-        if event_type == 'overspeed':
-            score_obj.overspeed_count += 1
-            penalty = tenant.weight_overspeed
-            
-        elif event_type == 'hardAcceleration':
-            score_obj.harsh_acceleration_count += 1
-            penalty = tenant.weight_harsh_acceleration
-            
-        elif event_type == 'hardBraking':
-            score_obj.harsh_braking_count += 1
-            penalty = tenant.weight_harsh_braking
-            
-        elif event_type == 'hardCornering':
-            score_obj.harsh_cornering_count += 1
-            penalty = tenant.weight_harsh_cornering
+    # Alarme do Traccar -> (contador no DriverScore, peso no Tenant)
+    ALARMS = {
+        'overspeed': ('overspeed_count', 'weight_overspeed'),
+        'hardAcceleration': ('harsh_acceleration_count', 'weight_harsh_acceleration'),
+        'hardBraking': ('harsh_braking_count', 'weight_harsh_braking'),
+        'hardCornering': ('harsh_cornering_count', 'weight_harsh_cornering'),
+    }
 
-        # Atualiza o score (mínimo 0)
-        score_obj.score = max(0, score_obj.score - penalty)
-        score_obj.save()
-        
-        return score_obj
+    @classmethod
+    def process_event(cls, vehicle, event_type):
+        """Um alarme avulso; devolve o score do dia após o evento"""
+        return cls.process_events([(vehicle, event_type)])[0]
+
+    @classmethod
+    def process_events(cls, events):
+        """
+        Aplica os alarmes [(vehicle, tipo)] (vehicle.tenant carregado) no score
+        do dia e devolve o score após cada um, na mesma ordem.
+        Com SCORE_WRITE_BEHIND os contadores ficam no Redis e vão para o banco
+        em lote (scores.ScoreWriteBehind); sem ele, ou com o Redis fora, grava
+        direto no banco numa transação.
+        """
+        if not events:
+            return []
+        today = DriverScore.today()
+        scores = None
+        if settings.SCORE_WRITE_BEHIND:
+            from .scores import get_score_buffer
+            try:
+                scores = get_score_buffer().apply(events, today)
+            except RedisError:
+                logger.warning("Redis indisponível, gravando %d alarmes direto no DriverScore", len(events))
+        if scores is None:
+            scores = cls.apply_in_database(events, today)
+        ScoreLeaderboard().record(events, scores, today)
+        return scores
+
+    @classmethod
+    def apply_in_database(cls, events, day):
+        """
+        Um lote de alarmes com 3 queries, qualquer que seja o tamanho: cria as
+        linhas que faltam, trava as do lote (select_for_update, sem perder
+        incrementos de webhooks concorrentes) e grava tudo num bulk_update.
+        """
+        vehicles = {str(vehicle.id): vehicle for vehicle, _ in events}  # o DeviceResolver devolve id como str
+        with transaction.atomic():
+            DriverScore.objects.bulk_create(
+                [DriverScore(vehicle_id=vehicle_id, tenant_id=vehicle.tenant_id, date=day) for vehicle_id, vehicle in vehicles.items()],
+                ignore_conflicts=True,
+            )
+            rows = {
+                str(row.vehicle_id): row
+                for row in DriverScore.objects.select_for_update().filter(date=day, vehicle_id__in=list(vehicles))
+            }
+            scores = []
+            for vehicle, event_type in events:
+                row = rows[str(vehicle.id)]
+                # Aplica a penalidade baseada na configuração do Tenant (mínimo 0)
+                if event_type in cls.ALARMS:
+                    count_field, weight_field = cls.ALARMS[event_type]
+                    setattr(row, count_field, getattr(row, count_field) + 1)
+                    row.score = max(0, row.score - getattr(vehicle.tenant, weight_field))
+                scores.append(row.score)
+
+            now = timezone.now()
+            for row in rows.values():
+                row.updated_at = now
+            DriverScore.objects.bulk_update(
+                list(rows.values()), [count_field for count_field, _ in cls.ALARMS.values()] + ['score', 'updated_at']
+            )
+        return scores
+
+    @classmethod
+    def recompute(cls, days):
+        """
+        Refaz os scores a partir dos alarmes gravados no histórico de posições
+        (ex: depois de um backfill). days: {data (UTC): {vehicle_id, ...}}.
+        Conta o alarme do rastreador (attributes.alarm) e os detectados pela
+        telemetria (attributes.alarms), como o score ao vivo.
+        Contadores e score são regravados de uma vez (upsert por veículo + dia).
+        """
+        scores = {}
+
+        def count(vehicle_id, tenant_id, day, alarm_type, total):
+            key = (vehicle_id, day)
+            if key not in scores:
+                scores[key] = DriverScore(vehicle_id=vehicle_id, tenant_id=tenant_id, date=day)
+            count_field = cls.ALARMS[alarm_type][0]
+            setattr(scores[key], count_field, getattr(scores[key], count_field) + total)
+
+        for day, vehicle_ids in days.items():
+            start = datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc)
+            positions = Position.objects.filter(
+                vehicle_id__in=list(vehicle_ids), fix_time__gte=start, fix_time__lt=start + timedelta(days=1),
+            )
+            counts = (
+                positions
+                .filter(attributes__alarm__in=list(cls.ALARMS))
+                .exclude(attributes__has_key='alarmSuppressed')  # repetia um evento detectado pela telemetria
+                .values('vehicle_id', 'tenant_id', alarm=KT('attributes__alarm'))
+                .annotate(total=Count('id'))
+            )
+            for row in counts:
+                count(row['vehicle_id'], row['tenant_id'], day, row['alarm'], row['total'])
+            # Detecções são eventos raros: a lista de cada posição é contada aqui
+            for vehicle_id, tenant_id, alarms in positions.filter(attributes__has_key='alarms').values_list(
+                'vehicle_id', 'tenant_id', 'attributes__alarms',
+            ):
+                for alarm_type in alarms or ():
+                    if alarm_type in cls.ALARMS:
+                        count(vehicle_id, tenant_id, day, alarm_type, 1)
+        if not scores:
+            return 0
+
+        tenants = Tenant.objects.in_bulk({score.tenant_id for score in scores.values()})
+        for score in scores.values():
+            tenant = tenants[score.tenant_id]
+            penalty = sum(
+                getattr(score, count_field) * getattr(tenant, weight_field)
+                for count_field, weight_field in cls.ALARMS.values()
+            )
+            score.score = max(0, 100 - penalty)
+
+        count_fields = [count_field for count_field, _ in cls.ALARMS.values()]
+        DriverScore.objects.bulk_create(
+            list(scores.values()), batch_size=1000,
+            update_conflicts=True, unique_fields=['vehicle', 'date'],
+            update_fields=count_fields + ['score', 'updated_at'],
+        )
+        ScoreLeaderboard().store([(score.tenant_id, score.vehicle_id, score.date, score.score) for score in scores.values()])
+        if settings.SCORE_WRITE_BEHIND:
+            from .scores import get_score_buffer
+            try:
+                # O score ao vivo volta a partir do banco no próximo alarme
+                get_score_buffer().invalidate(scores)
+            except RedisError:
+                logger.warning("Não foi possível descartar %d scores ao vivo no Redis", len(scores))
+        return len(scores)
 
 class RouteOptimizer:
     """
-    Otimiza rotas usando a Heurística do Vizinho Mais Próximo (Nearest Neighbor).
-    Simples, rápido e eficaz para rotas do dia a dia.
+    Otimiza rotas: Vizinho Mais Próximo como ponto de partida e busca local
+    2-opt/Or-opt sobre a matriz de distâncias (optimization.optimize_path),
+    dentro de um orçamento de tempo. A matriz vem do provedor configurado,
+    via cache (distances.DistanceCache).
     """
     
     @staticmethod
@@ -98,43 +332,46 @@ class RouteOptimizer:
         return R * c
 
     @classmethod
-    def optimize_route(cls, route):
+    def optimize_route(cls, route, time_budget=None, progress=None):
+        """
+        Reordena as paradas pendentes. A primeira (menor sequence) é o
+        depósito/início e continua em primeiro; as sequências são gravadas num
+        bulk_update só. Devolve os km da ordem anterior e da nova.
+        progress(ids das paradas na ordem, km), se informado, recebe a melhor
+        ordem encontrada até o momento (uma vez por passada da busca local).
+        """
+        from .distances import get_distance_cache
+        from .optimization import optimize_path, path_length
+
         stops = list(route.stops.filter(status='PENDING'))
+        result = {'stops': len(stops), 'previous_km': 0.0, 'total_km': 0.0}
         if not stops:
-            return 0
-
-        # Ponto de partida (pode ser a posição atual do veículo ou a primeira parada)
-        # Aqui assumimos que a primeira parada (sequence 0 ou 1) é o depósito/início
-        # Se não tiver ordem, pegamos o primeiro da lista
-        current_stop = stops.pop(0) 
-        optimized_stops = [current_stop]
-        total_distance = 0
-
-        while stops:
-            nearest_stop = None
-            min_dist = float('inf')
-
-            for stop in stops:
-                dist = cls.haversine(
-                    current_stop.latitude, current_stop.longitude,
-                    stop.latitude, stop.longitude
-                )
-                if dist < min_dist:
-                    min_dist = dist
-                    nearest_stop = stop
+            return result
 
-            if nearest_stop:
-                total_distance += min_dist
-                optimized_stops.append(nearest_stop)
-                stops.remove(nearest_stop)
-                current_stop = nearest_stop
+        started = time.perf_counter()
+        matrix = get_distance_cache().matrix([stop.latitude for stop in stops], [stop.longitude for stop in stops])
+        budget = settings.ROUTE_OPTIMIZATION_TIME_BUDGET if time_budget is None else time_budget
+        on_pass = None
+        if progress is not None:
+            def on_pass(order):
+                progress([stops[index].id for index in order], round(path_length(matrix, order), 2))
+        order, stats = optimize_path(matrix, start=0, time_budget=budget, on_pass=on_pass)
 
-        # Salva a nova sequência no banco
+        now = timezone.now()
+        optimized_stops = [stops[index] for index in order]
         for index, stop in enumerate(optimized_stops):
             stop.sequence = index + 1
-            stop.save()
-            
-        return round(total_distance, 2)
+            stop.updated_at = now
+        RouteStop.objects.bulk_update(optimized_stops, ['sequence', 'updated_at'])
+
+        result.update(
+            stats,
+            previous_km=round(path_length(matrix, range(len(stops))), 2),
+            total_km=round(path_length(matrix, order), 2),
+            nearest_neighbor_km=round(stats['nearest_neighbor_km'], 2),
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 1),
+        )
+        return result
 
 # ... (Mantenha TraccarService, ScoreService, RouteOptimizer) ...
 
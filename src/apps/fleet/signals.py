@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from apps.tenants.models import Tenant
+from .models import Vehicle
+from .leaderboard import ScoreLeaderboard
+from .live_state import LiveStateStore
+from .resolver import get_device_resolver
+from .scores import schedule_tenant_recompute
+from .services import ScoreService
+
+WEIGHT_FIELDS = [weight_field for _, weight_field in ScoreService.ALARMS.values()]
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def invalidate_device_resolver(sender, instance, **kwargs):
+    """
+    Mantém o cache deviceId -> veículo coerente (inclusive se o deviceId mudou).
+    Dentro de uma transação invalida de novo após o commit: até lá uma
+    consulta de outro processo ainda enxerga a linha antiga no banco.
+    """
+    device_ids, vehicle_ids = [instance.traccar_device_id], [instance.id]
+    get_device_resolver().invalidate(device_ids=device_ids, vehicle_ids=vehicle_ids)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: get_device_resolver().invalidate(device_ids=device_ids, vehicle_ids=vehicle_ids))
+
+
+@receiver(post_delete, sender=Vehicle)
+def remove_live_state(sender, instance, **kwargs):
+    """Tira o veículo removido do snapshot do mapa ao vivo"""
+    LiveStateStore().remove(instance.tenant_id, instance.id)
+
+
+@receiver(post_save, sender=Vehicle)
+def add_to_leaderboard(sender, instance, created, **kwargs):
+    """Veículo novo aparece no ranking com 100 antes do primeiro alarme"""
+    if created:
+        transaction.on_commit(lambda: ScoreLeaderboard().add([(instance.tenant_id, instance.id)]))
+
+
+@receiver(post_delete, sender=Vehicle)
+def remove_from_leaderboard(sender, instance, **kwargs):
+    """Tira o veículo removido do ranking de scores"""
+    ScoreLeaderboard().remove(instance.tenant_id, instance.id)
+
+
+@receiver(pre_save, sender=Tenant)
+def remember_score_weights(sender, instance, **kwargs):
+    """Guarda os pesos gravados para o post_save saber se mudaram"""
+    if instance._state.adding:
+        return
+    instance._stored_weights = Tenant.objects.filter(pk=instance.pk).values(*WEIGHT_FIELDS).first()
+
+
+@receiver(post_save, sender=Tenant)
+def recompute_scores_on_weight_change(sender, instance, created, **kwargs):
+    """Pesos do score mudaram: recalcula os DriverScore do tenant depois do commit"""
+    stored = getattr(instance, '_stored_weights', None)
+    if created or not stored:
+        return
+    if any(stored[field] != getattr(instance, field) for field in WEIGHT_FIELDS):
+        transaction.on_commit(lambda: schedule_tenant_recompute(instance.pk))
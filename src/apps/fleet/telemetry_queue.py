@@ -0,0 +1,122 @@
+import json
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+from apps.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetryQueue:
+    """
+    Fila de posições do Traccar em Redis Streams.
+    Cada entrada do stream é um lote do webhook (JSON). Os workers leem via
+    consumer group, confirmam com XACK e reprocessam entradas pendentes
+    (XAUTOCLAIM); após TELEMETRY_MAX_RETRIES a entrada vai para o dead-letter.
+    """
+
+    GROUP = "ingestion"
+
+    def __init__(self, client=None, stream=None):
+        self.client = client or get_redis()
+        self.stream = stream or settings.TELEMETRY_STREAM
+        self.dead_letter = f"{self.stream}:dead"
+        self.max_retries = settings.TELEMETRY_MAX_RETRIES
+
+    def enqueue(self, positions):
+        return self.client.xadd(
+            self.stream,
+            {'payload': json.dumps(positions), 'received_at': time.time()},
+            maxlen=settings.TELEMETRY_STREAM_MAXLEN,
+            approximate=True,
+        )
+
+    def ensure_group(self):
+        try:
+            self.client.xgroup_create(self.stream, self.GROUP, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    @staticmethod
+    def decode(entries):
+        """[(id, {b'payload': ...})] -> [(id, positions)]"""
+        decoded = []
+        for entry_id, fields in entries:
+            if not fields:  # entrada removida do stream (trim) mas ainda pendente
+                decoded.append((entry_id, []))
+                continue
+            try:
+                decoded.append((entry_id, json.loads(fields[b'payload'])))
+            except (KeyError, ValueError):
+                logger.warning("Entrada inválida no stream de telemetria: %s", entry_id)
+                decoded.append((entry_id, []))
+        return decoded
+
+    def read(self, consumer, count=50, block_ms=1000):
+        """Lê entradas novas para este consumidor"""
+        response = self.client.xreadgroup(self.GROUP, consumer, {self.stream: '>'}, count=count, block=block_ms)
+        if not response:
+            return []
+        return self.decode(response[0][1])
+
+    def ack(self, entry_ids):
+        if entry_ids:
+            self.client.xack(self.stream, self.GROUP, *entry_ids)
+
+    def claim_stale(self, consumer, min_idle_ms=30000, count=50):
+        """
+        Assume entradas pendentes de consumidores parados/que falharam.
+        Entradas que já estouraram o limite de tentativas vão para o dead-letter.
+        """
+        _, entries, _ = self.client.xautoclaim(self.stream, self.GROUP, consumer, min_idle_ms, '0-0', count=count)
+        if not entries:
+            return []
+
+        pipe = self.client.pipeline()
+        for entry_id, _ in entries:
+            pipe.xpending_range(self.stream, self.GROUP, min=entry_id, max=entry_id, count=1)
+        deliveries = {
+            item['message_id']: item['times_delivered']
+            for result in pipe.execute() for item in result
+        }
+        retry, dead = [], []
+        for entry_id, fields in entries:
+            if deliveries.get(entry_id, 0) > self.max_retries:
+                dead.append((entry_id, fields))
+            else:
+                retry.append((entry_id, fields))
+
+        if dead:
+            pipe = self.client.pipeline()
+            for entry_id, fields in dead:
+                pipe.xadd(self.dead_letter, {**(fields or {}), 'original_id': entry_id})
+            pipe.xack(self.stream, self.GROUP, *[entry_id for entry_id, _ in dead])
+            pipe.execute()
+            logger.error("%d entradas de telemetria movidas para %s", len(dead), self.dead_letter)
+        return self.decode(retry)
+
+    def metrics(self):
+        """Métricas de backpressure: tamanho, lag do grupo e pendentes"""
+        data = {'stream': self.stream, 'length': self.client.xlen(self.stream), 'dead_letter': self.client.xlen(self.dead_letter)}
+        try:
+            groups = self.client.xinfo_groups(self.stream)
+        except redis.ResponseError:
+            groups = []
+        for group in groups:
+            name = group['name'].decode() if isinstance(group['name'], bytes) else group['name']
+            if name != self.GROUP:
+                continue
+            data.update({
+                'consumers': group['consumers'],
+                'pending': group['pending'],
+                'lag': group.get('lag'),
+            })
+            summary = self.client.xpending(self.stream, self.GROUP)
+            if summary['pending'] and summary['min']:
+                oldest_ms = int(summary['min'].decode().split('-')[0])
+                data['oldest_pending_seconds'] = round(time.time() - oldest_ms / 1000, 1)
+        return data
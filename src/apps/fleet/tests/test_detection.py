@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from apps.fleet.detection import HarshEventDetector
+
+TENANT_ID = 'tenant'
+BASE = datetime(2026, 1, 5, 12, 0, tzinfo=timezone.utc)
+
+
+class HarshEventDetectorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.detector = HarshEventDetector(cooldown=30)
+        # Limites padrão do Tenant sem passar pelo banco
+        self.detector._tenants[TENANT_ID] = (np.inf, np.array([3.0, 3.5, 3.5, 110.0]))
+        self.vehicle = SimpleNamespace(traccar_device_id=1, tenant_id=TENANT_ID)
+
+    def sample(self, seconds, knots, alarm=None):
+        pos = {'speed': knots, 'course': 0, 'fixTime': (BASE + timedelta(seconds=seconds)).isoformat()}
+        return self.vehicle, pos, {'alarm': alarm} if alarm else {}
+
+    def detect(self, *samples):
+        return self.detector.detect(list(samples))
+
+    def test_detects_braking(self):
+        self.assertEqual(self.detect(self.sample(0, 50), self.sample(2, 20)), ([(1, 'hardBraking')], []))
+
+    def test_tracker_alarm_after_detection_is_suppressed(self):
+        self.detect(self.sample(0, 50), self.sample(2, 20))
+        self.assertEqual(self.detect(self.sample(5, 20, 'hardBraking')), ([], [(0, 'hardBraking')]))
+
+    def test_detection_after_tracker_alarm_is_skipped(self):
+        self.assertEqual(self.detect(self.sample(0, 50, 'hardBraking')), ([], []))
+        self.assertEqual(self.detect(self.sample(2, 20)), ([], []))
+
+    def test_tracker_alarms_are_never_suppressed_by_each_other(self):
+        self.detect(self.sample(0, 20, 'hardBraking'))
+        self.assertEqual(self.detect(self.sample(5, 20, 'hardBraking')), ([], []))
+
+    def test_events_after_cooldown_count_again(self):
+        self.detect(self.sample(0, 50), self.sample(2, 20))
+        self.assertEqual(self.detect(self.sample(40, 20, 'hardBraking')), ([], []))
+        self.assertEqual(self.detect(self.sample(80, 50), self.sample(82, 20)), ([(1, 'hardBraking')], []))
+
+    def test_cooldown_is_per_event_type(self):
+        self.detect(self.sample(0, 50), self.sample(2, 20))
+        self.assertEqual(self.detect(self.sample(4, 50)), ([(0, 'hardAcceleration')], []))
+
+    def test_stale_and_repeated_samples_are_ignored(self):
+        self.detect(self.sample(10, 50))
+        self.assertEqual(self.detect(self.sample(5, 20), self.sample(10, 20)), ([], []))
+        # A amostra de referência continua a de 10s a 50 nós
+        self.assertEqual(self.detect(self.sample(12, 20)), ([(0, 'hardBraking')], []))
+
+    def test_out_of_order_batch_is_sorted_by_fix_time(self):
+        self.assertEqual(self.detect(self.sample(2, 20), self.sample(0, 50)), ([(0, 'hardBraking')], []))
+
+    def test_long_gaps_do_not_pair(self):
+        self.assertEqual(self.detect(self.sample(0, 50), self.sample(60, 20)), ([], []))
+
+    def test_disabled_tenant_only_tracks_tracker_alarms(self):
+        self.detector._tenants[TENANT_ID] = (np.inf, np.full(4, np.inf))
+        self.assertEqual(self.detect(self.sample(0, 50), self.sample(2, 20)), ([], []))
+        self.detect(self.sample(4, 20, 'hardBraking'))
+        self.assertEqual(self.detect(self.sample(6, 20, 'hardBraking')), ([], []))
@@ -0,0 +1,42 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from apps.fleet.optimization import distance_matrix, nearest_neighbor, optimize_path, path_length
+
+
+def random_matrix(seed, size):
+    rng = np.random.default_rng(seed)
+    return distance_matrix(rng.uniform(-23.7, -23.4, size), rng.uniform(-46.8, -46.4, size))
+
+
+class OptimizePathTests(SimpleTestCase):
+
+    def test_start_is_kept_and_result_is_a_permutation(self):
+        for seed, size, start in ((1, 30, 0), (2, 50, 17), (3, 5, 4)):
+            with self.subTest(seed=seed, size=size, start=start):
+                order, _ = optimize_path(random_matrix(seed, size), start=start)
+                self.assertEqual(order[0], start)
+                self.assertEqual(sorted(order.tolist()), list(range(size)))
+
+    def test_never_worse_than_nearest_neighbor(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                matrix = random_matrix(seed, 40)
+                order, stats = optimize_path(matrix, start=seed)
+                seed_km = path_length(matrix, nearest_neighbor(matrix, seed))
+                self.assertAlmostEqual(stats['nearest_neighbor_km'], seed_km)
+                self.assertLessEqual(path_length(matrix, order), seed_km + 1e-9)
+
+    def test_keeps_nearest_neighbor_on_timeout(self):
+        matrix = random_matrix(7, 40)
+        order, stats = optimize_path(matrix, start=3, time_budget=0)
+        self.assertTrue(stats['timed_out'])
+        self.assertEqual(order.tolist(), nearest_neighbor(matrix, 3).tolist())
+
+    def test_short_paths(self):
+        for size in (1, 2):
+            with self.subTest(size=size):
+                order, stats = optimize_path(random_matrix(size, size), start=size - 1)
+                self.assertEqual(order[0], size - 1)
+                self.assertEqual(sorted(order.tolist()), list(range(size)))
+                self.assertNotIn('timed_out', stats)
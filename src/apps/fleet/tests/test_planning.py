@@ -0,0 +1,65 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from apps.fleet.optimization import distance_matrix
+from apps.fleet.planning import VrpSolver
+
+DEPOT = (-23.55, -46.63)
+KM_PER_DEGREE = 111.2 * np.cos(np.radians(DEPOT[0]))  # em longitude, na latitude do depósito
+
+
+def solve(vehicles, stops_km, demand=None, window_start=None, window_end=None, capacity=None, service=5,
+          start_minute=480, speed_kmh=30):
+    """Veículos no depósito e paradas a stops_km a leste dele; devolve (resultado, solver)"""
+    size = len(stops_km)
+    lngs = [DEPOT[1]] * vehicles + [DEPOT[1] + km / KM_PER_DEGREE for km in stops_km]
+    matrix = distance_matrix([DEPOT[0]] * len(lngs), lngs)
+    solver = VrpSolver(
+        matrix, range(vehicles),
+        np.zeros(size) if demand is None else demand,
+        np.zeros(size) if window_start is None else window_start,
+        np.full(size, np.inf) if window_end is None else window_end,
+        np.full(size, service),
+        np.full(vehicles, np.inf) if capacity is None else capacity,
+        start_minute, speed_kmh, time_budget=2.0,
+    )
+    return solver.result(solver.solve()), solver
+
+
+class VrpSolverTests(SimpleTestCase):
+
+    def assertCovers(self, result, size):
+        assigned = [stop for route in result['routes'] for stop in route['stops']]
+        self.assertEqual(sorted(assigned + result['unassigned']), list(range(size)))
+
+    def test_capacity_is_respected(self):
+        result, _ = solve(2, [1, 2, 3, 4, 5, 6], demand=np.full(6, 4.0), capacity=np.array([10.0, 10.0]))
+        self.assertCovers(result, 6)
+        self.assertEqual(len(result['unassigned']), 2)
+        for route in result['routes']:
+            self.assertEqual(len(route['stops']), 2)
+            self.assertLessEqual(route['load'], 10)
+
+    def test_uncapacitated_vehicle_takes_every_stop(self):
+        result, _ = solve(1, [3, 1, 5, 2, 4])
+        self.assertEqual(result['unassigned'], [])
+        self.assertEqual(result['routes'][0]['stops'], [1, 3, 0, 4, 2])
+        self.assertAlmostEqual(result['routes'][0]['km'], 5, places=1)
+
+    def test_time_windows_are_respected(self):
+        window_start = np.array([600, 480, 0, 0])
+        window_end = np.array([620, 500, np.inf, 500])
+        result, solver = solve(1, [1, 2, 3, 50], window_start=window_start, window_end=window_end)
+        self.assertCovers(result, 4)
+        self.assertEqual(result['unassigned'], [3])  # 100 min de viagem, janela fecha às 8h20
+
+        route = result['routes'][0]
+        self.assertLess(route['stops'].index(1), route['stops'].index(0))
+        previous, previous_end = 0, 480  # nó 0 = partida do veículo
+        for stop, arrival in zip(route['stops'], route['arrivals']):
+            self.assertGreaterEqual(arrival, window_start[stop])
+            self.assertLessEqual(arrival, window_end[stop])
+            node = stop + 1
+            travel = solver.matrix[previous, node] * solver.minutes_per_km
+            self.assertGreaterEqual(arrival + 1e-6, previous_end + travel)
+            previous, previous_end = node, arrival + 5
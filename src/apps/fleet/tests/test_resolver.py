@@ -0,0 +1,65 @@
+from unittest import mock
+
+import redis
+from django.test import TestCase
+from redis.backoff import NoBackoff
+from redis.exceptions import RedisError
+from redis.retry import Retry
+
+from apps.core.redis_client import get_redis
+from apps.fleet.models import Vehicle
+from apps.fleet.resolver import DeviceResolver
+from apps.tenants.models import Tenant
+
+DEVICE_ID = 990401
+
+
+class DeviceResolverInvalidationTests(TestCase):
+    """Um mapeamento lido do banco antes de uma invalidação não pode ficar em cache"""
+
+    def setUp(self):
+        tenant = Tenant.objects.create(name="Resolver", subdomain="resolver-tests")
+        self.vehicle = Vehicle.objects.create(tenant=tenant, traccar_device_id=DEVICE_ID, name="Antigo")
+
+    def offline_client(self):
+        # Sem Redis: resolve pelo dicionário local + banco
+        return redis.Redis(host='127.0.0.1', port=1, socket_connect_timeout=0.1, retry=Retry(NoBackoff(), 0))
+
+    def resolve_racing_save(self, resolver):
+        """Resolve com o veículo renomeado (e invalidado) entre a query e o cache"""
+        original = Vehicle.objects.filter
+
+        def racing_filter(**lookups):
+            rows = list(original(**lookups).values_list('traccar_device_id', 'id', 'tenant_id', 'name'))
+            original(pk=self.vehicle.pk).update(name="Novo")
+            resolver.invalidate(device_ids=[DEVICE_ID], vehicle_ids=[self.vehicle.id])
+            return mock.Mock(values_list=mock.Mock(return_value=rows))
+
+        with mock.patch.object(Vehicle.objects, 'filter', side_effect=racing_filter):
+            return resolver.resolve(DEVICE_ID)
+
+    def test_local_cache_keeps_reads_without_invalidation(self):
+        resolver = DeviceResolver(ttl=60, negative_ttl=60, client=self.offline_client())
+        self.assertEqual(resolver.resolve(DEVICE_ID).name, "Antigo")
+        self.assertEqual(resolver.resolve(DEVICE_ID).name, "Antigo")
+        self.assertEqual(resolver.counters['local_hits'], 1)
+
+    def test_invalidation_during_query_skips_local_cache(self):
+        resolver = DeviceResolver(ttl=60, negative_ttl=60, client=self.offline_client())
+        self.assertEqual(self.resolve_racing_save(resolver).name, "Antigo")
+        self.assertEqual(resolver.resolve(DEVICE_ID).name, "Novo")
+        self.assertEqual(resolver.counters['local_hits'], 0)
+        self.assertEqual(resolver.counters['misses'], 2)
+
+    def test_invalidation_during_query_skips_redis(self):
+        client = get_redis()
+        try:
+            client.ping()
+        except RedisError:
+            self.skipTest("Redis indisponível")
+        DeviceResolver(client=client).invalidate(device_ids=[DEVICE_ID], vehicle_ids=[self.vehicle.id])
+
+        self.assertEqual(self.resolve_racing_save(DeviceResolver(ttl=60, negative_ttl=60, client=client)).name, "Antigo")
+        # Outro processo (cache local vazio) lê do Redis ou do banco, nunca o mapeamento antigo
+        self.assertEqual(DeviceResolver(ttl=60, negative_ttl=60, client=client).resolve(DEVICE_ID).name, "Novo")
+        DeviceResolver(client=client).invalidate(device_ids=[DEVICE_ID], vehicle_ids=[self.vehicle.id])
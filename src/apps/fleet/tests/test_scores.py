@@ -0,0 +1,51 @@
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.fleet.ingestion import TelemetryIngestionService
+from apps.fleet.models import DriverScore, Vehicle
+from apps.fleet.resolver import get_device_resolver
+from apps.fleet.services import ScoreService
+from apps.tenants.models import Tenant
+
+DEVICE_ID = 990417
+COUNT_FIELDS = ('score', 'overspeed_count', 'harsh_acceleration_count', 'harsh_braking_count', 'harsh_cornering_count')
+
+
+@override_settings(
+    HARSH_EVENT_DETECTION=True, HARSH_EVENT_COOLDOWN=30, SCORE_WRITE_BEHIND=False, FLEET_FANOUT_TICK_MS=0,
+    LIVE_ETA_ENABLED=False, STOP_ARRIVAL_DETECTION=False, GEOFENCE_DETECTION=False,
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class ScoreRecomputeAgreementTests(TestCase):
+    """ScoreService.recompute sobre o histórico tem que chegar no mesmo score do ingest ao vivo"""
+
+    def setUp(self):
+        tenant = Tenant.objects.create(name="Scores", subdomain="scores-tests", harsh_event_detection=True)
+        self.vehicle = Vehicle.objects.create(tenant=tenant, traccar_device_id=DEVICE_ID, name="Score 1")
+        get_device_resolver().invalidate(device_ids=[DEVICE_ID], vehicle_ids=[self.vehicle.id])
+        now = timezone.now().replace(microsecond=0)
+        self.base = max(now - timedelta(minutes=5), datetime.combine(now.date(), dt_time.min, tzinfo=dt_timezone.utc))
+
+    def position(self, seconds, knots, **attributes):
+        return {
+            'deviceId': DEVICE_ID, 'latitude': -23.5, 'longitude': -46.6, 'speed': knots, 'course': 0,
+            'fixTime': (self.base + timedelta(seconds=seconds)).isoformat(), 'attributes': attributes,
+        }
+
+    def test_recompute_matches_live_score(self):
+        TelemetryIngestionService().ingest([
+            self.position(0, 20),
+            self.position(5, 90),  # aceleração e excesso detectados aqui
+            self.position(10, 30, alarm='overspeed'),  # freada detectada; excesso do rastreador suprimido
+            self.position(15, 30, alarm='hardBraking'),  # suprimido
+            self.position(60, 30, alarm='hardCornering'),  # fora do cooldown: conta
+        ])
+        live = DriverScore.objects.get(vehicle=self.vehicle)
+        self.assertEqual([getattr(live, field) for field in COUNT_FIELDS], [75, 1, 1, 1, 1])
+
+        DriverScore.objects.filter(vehicle=self.vehicle).delete()
+        self.assertEqual(ScoreService.recompute({live.date: {self.vehicle.id}}), 1)
+        again = DriverScore.objects.get(vehicle=self.vehicle)
+        self.assertEqual([getattr(again, field) for field in COUNT_FIELDS], [getattr(live, field) for field in COUNT_FIELDS])
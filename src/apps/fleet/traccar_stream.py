@@ -0,0 +1,286 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from datetime import timedelta
+
+import requests
+import websockets
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from apps.core.redis_client import get_redis
+from .history import parse_fix_time
+from .ingestion import submit_positions
+from .services import TraccarService, chunked
+
+logger = logging.getLogger(__name__)
+
+
+class FixTimeTracker:
+    """
+    Último fixTime processado por device, para descartar posições repetidas
+    (o Traccar reenvia a última posição de cada device a cada conexão) e saber
+    de onde retomar após uma queda. Persistido num hash do Redis para
+    sobreviver a restarts do comando.
+    """
+
+    REDIS_KEY = "fleet:traccar_stream:last_fix"
+
+    def __init__(self, client=None):
+        self._client = client
+        self.last_fix = {}  # device_id -> datetime
+        self.persisted = {}  # device_id -> datetime já gravado no Redis
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def load(self):
+        try:
+            stored = self.client.hgetall(self.REDIS_KEY)
+        except RedisError:
+            logger.warning("Não foi possível carregar os últimos fixTime do Redis")
+            return
+        for device_id, value in stored.items():
+            self.last_fix[int(device_id)] = parse_fix_time({'fixTime': value.decode()})
+        self.persisted.update(self.last_fix)
+
+    def accept(self, pos):
+        """True se a posição é mais nova que a última vista do device (e a registra)"""
+        device_id = pos.get('deviceId')
+        if not device_id:
+            return False
+        fix_time = parse_fix_time(pos)
+        last = self.last_fix.get(device_id)
+        if last is not None and fix_time <= last:
+            return False
+        self.last_fix[device_id] = fix_time
+        return True
+
+    @property
+    def newest(self):
+        return max(self.last_fix.values(), default=None)
+
+    def persist(self, positions):
+        """Grava o fixTime das posições já processadas (o ponto de retomada)"""
+        processed = {}
+        for pos in positions:
+            fix_time = parse_fix_time(pos)
+            if pos['deviceId'] not in processed or fix_time > processed[pos['deviceId']]:
+                processed[pos['deviceId']] = fix_time
+        if not processed:
+            return
+        try:
+            self.client.hset(self.REDIS_KEY, mapping={
+                device_id: fix_time.isoformat() for device_id, fix_time in processed.items()
+            })
+        except RedisError:
+            logger.warning("Não foi possível gravar os últimos fixTime no Redis")
+            return
+        self.persisted.update(processed)
+
+    def rollback(self, positions):
+        """Devices de posições que falharam voltam ao último fixTime gravado (aceitas de novo se reenviadas)"""
+        for device_id in {pos['deviceId'] for pos in positions}:
+            if device_id in self.persisted:
+                self.last_fix[device_id] = self.persisted[device_id]
+            else:
+                self.last_fix.pop(device_id, None)
+
+
+class TraccarStream:
+    """
+    Ingestão contínua pelo WebSocket do Traccar (/api/socket).
+    Mensagens {"positions": [...]} são deduplicadas por fixTime (repetidas ou
+    mais antigas que a última do device são descartadas) e acumuladas
+    enquanto o lote anterior é processado (até batch_size ou batch_ms), e então
+    entram no mesmo pipeline do webhook (submit_positions). {"devices": [...]}
+    atualiza o lastUpdate dos veículos; {"events": [...]} só é contado, pois
+    os alarmes de score já chegam nos atributos da posição.
+    Quedas reconectam com backoff exponencial; na volta, a janela perdida é
+    reprocessada via /api/reports/route (até resume_max_gap segundos).
+    """
+
+    def __init__(self, batch_size=500, batch_ms=200, max_backoff=60, resume_max_gap=3600, service=None, tracker=None):
+        self.batch_size = batch_size
+        self.batch_ms = batch_ms
+        self.max_backoff = max_backoff
+        self.resume_max_gap = resume_max_gap
+        self.service = service or TraccarService()
+        self.tracker = tracker or FixTimeTracker()
+        self.positions = []
+        self.devices = {}
+        self.first_buffered_at = None
+        self.counters = {
+            'messages': 0, 'positions': 0, 'duplicates': 0, 'events': 0, 'processed': 0,
+            'device_updates': 0, 'batches': 0, 'replayed': 0, 'reconnects': 0,
+        }
+
+    async def run(self, stop):
+        await sync_to_async(self.tracker.load)()
+        backoff = 1
+        while not stop.is_set():
+            try:
+                cookie = await sync_to_async(self.service.open_session)()
+                async with websockets.connect(
+                    self.service.socket_url, extra_headers={'Cookie': cookie},
+                    max_size=None, ping_interval=20, close_timeout=2,
+                ) as socket:
+                    logger.info("Conectado ao Traccar em %s", self.service.socket_url)
+                    backoff = 1
+                    await self.resume()
+                    await self.consume(socket, stop)
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException, requests.RequestException) as e:
+                logger.warning("Conexão com o Traccar caiu: %s", e)
+            finally:
+                await self.drain()
+
+            if stop.is_set():
+                break
+            self.counters['reconnects'] += 1
+            delay = backoff * random.uniform(0.5, 1.0)
+            logger.info("Reconectando ao Traccar em %.1fs", delay)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def consume(self, socket, stop):
+        pending = None  # lote em processamento (os próximos acumulam enquanto isso)
+        try:
+            while not stop.is_set():
+                try:
+                    raw = await asyncio.wait_for(socket.recv(), timeout=self.batch_ms / 1000)
+                except asyncio.TimeoutError:
+                    raw = None
+                if raw is not None:
+                    self.handle(raw)
+
+                if pending is not None and (pending.done() or len(self.positions) >= self.batch_size):
+                    # Lote cheio esperando: para de ler e deixa o TCP segurar o Traccar
+                    await pending
+                    pending = None
+                if pending is None and self.ready():
+                    pending = asyncio.ensure_future(self.flush())
+        finally:
+            if pending is not None:
+                await pending
+
+    def handle(self, raw):
+        self.counters['messages'] += 1
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            logger.warning("Mensagem inválida do Traccar: %.200s", raw)
+            return
+
+        for pos in message.get('positions') or ():
+            self.counters['positions'] += 1
+            if self.tracker.accept(pos):
+                self.buffer([pos])
+            else:
+                self.counters['duplicates'] += 1
+        for device in message.get('devices') or ():
+            if device.get('id') and device.get('lastUpdate'):
+                self.devices[device['id']] = device['lastUpdate']
+                self.mark_buffered()
+        self.counters['events'] += len(message.get('events') or ())
+
+    def buffer(self, positions):
+        self.positions.extend(positions)
+        self.mark_buffered()
+
+    def mark_buffered(self):
+        if self.first_buffered_at is None:
+            self.first_buffered_at = time.monotonic()
+
+    def ready(self):
+        if self.first_buffered_at is None:
+            return False
+        return (
+            len(self.positions) >= self.batch_size
+            or time.monotonic() - self.first_buffered_at >= self.batch_ms / 1000
+        )
+
+    async def flush(self):
+        positions, self.positions = self.positions, []
+        devices, self.devices = self.devices, {}
+        self.first_buffered_at = None
+        if positions or devices:
+            await sync_to_async(self.process)(positions, devices)
+
+    async def drain(self):
+        while self.positions or self.devices:
+            await self.flush()
+
+    def process(self, positions, devices):
+        """Roda fora do event loop (thread do sync_to_async)"""
+        close_old_connections()
+        submitted, failed = [], []
+        for batch in chunked(positions, self.batch_size):
+            try:
+                submit_positions(batch)
+                self.counters['batches'] += 1
+                self.counters['processed'] += len(batch)
+                submitted += batch
+            except Exception:
+                # O stream segue, mas o lote não conta como processado: fica fora do ponto de retomada
+                logger.exception("Falha ao processar %d posições do Traccar", len(batch))
+                failed += batch
+        if devices:
+            try:
+                self.counters['device_updates'] += self.update_devices(devices)
+            except Exception:
+                logger.exception("Falha ao atualizar o lastUpdate de %d devices", len(devices))
+        self.tracker.persist(submitted)
+        if failed:
+            self.tracker.rollback(failed)
+
+    @staticmethod
+    def update_devices(devices):
+        """Grava o lastUpdate dos devices conhecidos (bulk_update sem carregar os veículos)"""
+        from .models import Vehicle
+        from .resolver import get_device_resolver
+
+        resolved = get_device_resolver().resolve_many(devices)
+        vehicles = [
+            Vehicle(id=device.vehicle_id, last_update=parse_fix_time({'fixTime': devices[device_id]}))
+            for device_id, device in resolved.items()
+        ]
+        Vehicle.objects.bulk_update(vehicles, ['last_update'])
+        return len(vehicles)
+
+    async def resume(self):
+        """Reprocessa as posições perdidas desde o último fixTime visto (no máximo resume_max_gap)"""
+        newest = self.tracker.newest
+        if newest is None or not self.resume_max_gap:
+            return
+        end = timezone.now()
+        start = max(newest, end - timedelta(seconds=self.resume_max_gap))
+        if end - start < timedelta(seconds=5):
+            return
+        if newest < start:
+            logger.warning("Queda maior que %ss: posições anteriores a %s não serão reprocessadas", self.resume_max_gap, start)
+
+        device_ids = sorted(self.tracker.last_fix)
+        replayed = 0
+        for chunk in chunked(device_ids, 200):
+            try:
+                route = await sync_to_async(self.service.fetch_route)(chunk, start, end)
+            except requests.RequestException as e:
+                logger.warning("Não foi possível reprocessar a janela perdida: %s", e)
+                return
+            route.sort(key=parse_fix_time)
+            accepted = [pos for pos in route if self.tracker.accept(pos)]
+            replayed += len(accepted)
+            self.buffer(accepted)
+            if len(self.positions) >= self.batch_size:
+                await self.flush()
+        await self.drain()
+        self.counters['replayed'] += replayed
+        logger.info("%d posições reprocessadas da janela %s - %s", replayed, start, end)
@@ -2,11 +2,12 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     # API ViewSets
-    VehicleViewSet, TraccarWebhookView, MapDashboardView,
+    VehicleViewSet, TraccarWebhookView, TelemetryStatsView, MapDashboardView,
     TireViewSet, MaintenancePlanViewSet, WorkOrderViewSet,
     DriverScoreViewSet, WorkShiftViewSet, 
     DeliveryRouteViewSet, RouteStopViewSet,
     ContractViewSet, ExpenseViewSet, FineViewSet,
+    GeofenceViewSet, GeofenceEventViewSet,
     # Frontend Views (Novas)
     VehicleListView, VehicleCreateView, VehicleUpdateView, VehicleDeleteView
 )
@@ -28,11 +29,14 @@ router.register(r'stops', RouteStopViewSet, basename='route-stop')
 router.register(r'financial/contracts', ContractViewSet, basename='contract')
 router.register(r'financial/expenses', ExpenseViewSet, basename='expense')
 router.register(r'financial/fines', FineViewSet, basename='fine')
+router.register(r'geofences', GeofenceViewSet, basename='geofence')
+router.register(r'geofence-events', GeofenceEventViewSet, basename='geofence-event')
 
 urlpatterns = [
     # ... rotas anteriores (API, Webhook, Map, Vehicle) ...
     path('', include(router.urls)),
     path('integrations/traccar/webhook/', TraccarWebhookView.as_view(), name='traccar-webhook'),
+    path('integrations/traccar/stats/', TelemetryStatsView.as_view(), name='telemetry-stats'),
     path('map/', MapDashboardView.as_view(), name='live-map'),
     
     # Frontend Veículos
@@ -3,13 +3,13 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from django.views.generic import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 from .models import WorkShift, ShiftEvent
 from .serializers import WorkShiftSerializer, ShiftEventSerializer
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.db import transaction
 from .models import DeliveryRoute, RouteStop
 from .serializers import DeliveryRouteSerializer, RouteStopSerializer
@@ -20,14 +20,53 @@ from .services import FinancialService
 from .forms import VehicleForm, DeliveryRouteForm, ExpenseForm, ContractForm
 from .models import Vehicle, Tire, MaintenancePlan, WorkOrder, DriverScore
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from .forms import VehicleForm
 from .serializers import (
     VehicleSerializer, TireSerializer, MaintenancePlanSerializer, 
     WorkOrderSerializer, DriverScoreSerializer
 )
 from apps.tenants.models import Tenant
-from .services import TraccarService, ScoreService
+from .services import TraccarService
+from .ingestion import submit_positions
+from .history import PositionHistoryService, parse_fix_time
+from .serializers import PositionSerializer
+from .telemetry_queue import TelemetryQueue
+from .resolver import get_device_resolver
+from .fanout import get_fanout
+from .live_state import LiveStateStore
+from .jobs import JobStore, run_in_background
+from .leaderboard import PERIODS, LeaderboardNotBuilt, ScoreLeaderboard
+from .planning import RoutePlanner, clock
+from .route_jobs import JOB_KIND as ROUTE_JOB_KIND, submit_route_optimization
+from .eta import get_eta_engine
+from .models import Geofence, GeofenceEvent
+from .serializers import GeofenceSerializer, GeofenceEventSerializer
+from datetime import date, time as dt_time, timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from redis.exceptions import RedisError
+import logging
+import uuid
+import requests
+
+logger = logging.getLogger(__name__)
+
+TRACCAR_SYNC_LOCK = 'traccar_sync'
+TRACCAR_SYNC_LOCK_TTL = 30 * 60  # segundos; libera o lock se o processo morrer no meio
+
+class PositionCursorPagination(CursorPagination):
+    """Histórico de posições em páginas por fix_time (cursor: sem OFFSET em janelas grandes)"""
+    ordering = 'fix_time'
+    page_size = 1000
+    page_size_query_param = 'page_size'
+    max_page_size = 5000
+
+class StandardPagination(PageNumberPagination):
+    """Paginação por número de página das listas que crescem sem limite (?page= e ?page_size=)"""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
 
 class VehicleViewSet(viewsets.ModelViewSet):
     serializer_class = VehicleSerializer
@@ -43,15 +82,147 @@ class VehicleViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'])
     def sync_traccar(self, request):
+        """Dispara a sincronização com o Traccar em background (202 + id do job)"""
         if not request.user.is_superuser:
             return Response({"error": "Apenas admin pode sincronizar"}, status=403)
         tenant_id = request.data.get('tenant_id')
         tenant = Tenant.objects.filter(id=tenant_id).first() if tenant_id else Tenant.objects.first()
         if not tenant:
             return Response({"error": "Nenhum Tenant encontrado"}, status=400)
+
         service = TraccarService()
-        count = service.sync_devices(default_tenant=tenant)
-        return Response({"status": "Sincronizado", "veiculos_processados": count})
+        try:
+            store = JobStore()
+            job = store.create('traccar_sync', tenant_id=str(tenant.id))
+            holder = store.acquire(TRACCAR_SYNC_LOCK, job['id'], ttl=TRACCAR_SYNC_LOCK_TTL)
+        except RedisError:
+            # Sem Redis não há como acompanhar o job: sincroniza no próprio request
+            logger.exception("Redis indisponível, sincronizando com o Traccar no próprio request")
+            try:
+                result = service.sync_devices(default_tenant=tenant)
+            except requests.exceptions.RequestException as e:
+                return Response({"error": f"Erro ao conectar no Traccar: {e}"}, status=502)
+            return Response({"status": "Sincronizado", "veiculos_processados": result['created'] + result['updated'], **result})
+
+        if holder is not True:
+            store.delete(job['id'])
+            return Response({"error": "Sincronização já em andamento", "job_id": holder}, status=409)
+
+        run_in_background(store, job, service.sync_devices, lock=TRACCAR_SYNC_LOCK, default_tenant=tenant)
+        return Response({
+            "status": "Sincronização iniciada",
+            "job_id": job['id'],
+            "status_url": reverse('vehicle-sync-traccar-status', kwargs={'job_id': job['id']}),
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path=r'sync_traccar/(?P<job_id>[0-9a-f]{32})')
+    def sync_traccar_status(self, request, job_id=None):
+        """Status/progresso de uma sincronização (done/total, resultado ou erro)"""
+        if not request.user.is_superuser:
+            return Response({"error": "Apenas admin"}, status=403)
+        job = JobStore().get(job_id)
+        if job is None or job.get('kind') != 'traccar_sync':
+            return Response({"error": "Job não encontrado"}, status=404)
+        return Response(job)
+
+    def spatial_tenant_id(self):
+        """Tenant das buscas espaciais: o do usuário; o superusuário sem tenant informa ?tenant_id="""
+        user = self.request.user
+        if hasattr(user, 'profile') and user.profile.tenant_id:
+            return str(user.profile.tenant_id)
+        if user.is_superuser:
+            try:
+                return str(uuid.UUID(self.request.query_params['tenant_id']))
+            except (KeyError, ValueError):
+                return None
+        return None
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        Veículos perto de um ponto, do mais perto ao mais longe, pelo índice GEO
+        do estado ao vivo. ?lat=&lng= com radius_km e/ou k (k mais próximos;
+        padrão 10 sem raio, máximo 500).
+        """
+        tenant_id = self.spatial_tenant_id()
+        if tenant_id is None:
+            return Response({"error": "Informe tenant_id"}, status=400)
+        params = request.query_params
+        try:
+            lat, lng = float(params['lat']), float(params['lng'])
+            radius = min(float(params['radius_km']), LiveStateStore.MAX_RADIUS_KM) if params.get('radius_km') else None
+            k = int(params['k']) if params.get('k') else (None if radius is not None else 10)
+        except (KeyError, ValueError):
+            return Response({"error": "Informe lat e lng; radius_km e k são opcionais"}, status=400)
+        if not LiveStateStore.valid_position(lat, lng) or (radius is not None and radius <= 0) or (k is not None and k < 1):
+            return Response({"error": "Ponto, raio ou k inválido"}, status=400)
+
+        try:
+            vehicles, source = LiveStateStore().nearby(tenant_id, lat, lng, radius_km=radius, k=k), 'live'
+        except RedisError:
+            logger.warning("Redis indisponível, busca por proximidade do tenant %s feita no banco", tenant_id)
+            vehicles = LiveStateStore.from_database(
+                self.get_queryset().filter(tenant_id=tenant_id), lat, lng, radius_km=radius, k=k,
+            )
+            source = 'database'
+        return Response({"count": len(vehicles), "source": source, "vehicles": vehicles})
+
+    @action(detail=False, methods=['get'], url_path='in-bbox')
+    def in_bbox(self, request):
+        """
+        Veículos dentro de uma bbox (?south=&west=&north=&east=; west > east
+        cruza o antimeridiano), os mais perto do centro primeiro; ?limit= (máximo 500).
+        """
+        tenant_id = self.spatial_tenant_id()
+        if tenant_id is None:
+            return Response({"error": "Informe tenant_id"}, status=400)
+        params = request.query_params
+        try:
+            bbox = tuple(float(params[name]) for name in ('south', 'west', 'north', 'east'))
+            limit = int(params['limit']) if params.get('limit') else None
+        except (KeyError, ValueError):
+            return Response({"error": "Informe south, west, north e east; limit é opcional"}, status=400)
+        south, west, north, east = bbox
+        if not (LiveStateStore.valid_position(south, west) and LiveStateStore.valid_position(north, east)) \
+                or south > north or (limit is not None and limit < 1):
+            return Response({"error": "bbox ou limit inválido"}, status=400)
+
+        try:
+            vehicles, source = LiveStateStore().in_bbox(tenant_id, *bbox, limit=limit), 'live'
+        except RedisError:
+            logger.warning("Redis indisponível, busca por bbox do tenant %s feita no banco", tenant_id)
+            vehicles = LiveStateStore.from_database(self.get_queryset().filter(tenant_id=tenant_id), bbox=bbox, k=limit)
+            source = 'database'
+        return Response({"count": len(vehicles), "source": source, "vehicles": vehicles})
+
+    @action(detail=True, methods=['get'])
+    def positions(self, request, pk=None):
+        """
+        Histórico de posições numa janela de tempo, paginado por cursor.
+        ?start=&end= em ISO 8601 (padrão: últimas 24h, máximo 7 dias);
+        ?page_size= até 5000 posições por página (padrão 1000).
+        """
+        vehicle = self.get_object()
+        bounds = {}
+        for name in ('start', 'end'):
+            value = request.query_params.get(name)
+            if not value:
+                continue
+            try:
+                parsed = parse_datetime(value)
+            except ValueError:  # formato certo, data impossível (ex.: mês 13)
+                parsed = None
+            if parsed is None:
+                return Response({"error": f"Data inválida em '{name}' (use ISO 8601)"}, status=400)
+            bounds[name] = parse_fix_time({'fixTime': parsed})  # sem fuso -> UTC
+        end = bounds.get('end') or timezone.now()
+        start = bounds.get('start') or end - timedelta(hours=24)
+        if start >= end or end - start > timedelta(days=7):
+            return Response({"error": "Janela inválida (máximo 7 dias)"}, status=400)
+
+        paginator = PositionCursorPagination()
+        page = paginator.paginate_queryset(PositionHistoryService.window(vehicle, start, end), request, view=self)
+        return paginator.get_paginated_response(PositionSerializer(page, many=True).data)
 
 class TireViewSet(viewsets.ModelViewSet):
     serializer_class = TireSerializer
@@ -76,7 +247,63 @@ class DriverScoreViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = DriverScoreSerializer
     permission_classes = [IsAuthenticated]
     def get_queryset(self):
-        return DriverScore.objects.filter(tenant=self.request.user.profile.tenant).order_by('-date', '-score')
+        return (
+            DriverScore.objects.filter(tenant=self.request.user.profile.tenant)
+            .select_related('vehicle').order_by('-date', '-score')
+        )
+
+    @action(detail=False, methods=['get'])
+    def leaderboard(self, request):
+        """
+        Ranking ao vivo do Redis.
+        ?period=day|7d|30d&date=YYYY-MM-DD&offset=&limit= (top-N) ou
+        ?vehicle=<id>&radius= (posição do veículo e vizinhos).
+        """
+        tenant_id = request.user.profile.tenant_id
+        period = request.query_params.get('period', 'day')
+        if period not in PERIODS:
+            return Response({"error": f"period inválido (use {', '.join(PERIODS)})"}, status=400)
+        try:
+            day = date.fromisoformat(request.query_params['date']) if request.query_params.get('date') else DriverScore.today()
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+            radius = min(max(int(request.query_params.get('radius', 5)), 0), 25)
+        except ValueError:
+            return Response({"error": "Parâmetros inválidos"}, status=400)
+        vehicle_id = request.query_params.get('vehicle')
+        if vehicle_id and not Vehicle.objects.filter(tenant_id=tenant_id, id=vehicle_id).exists():
+            return Response({"error": "Veículo não encontrado"}, status=404)
+
+        leaderboard = ScoreLeaderboard()
+        me = None
+        try:
+            if vehicle_id:
+                me, entries, total = leaderboard.around(tenant_id, vehicle_id, period, day, radius=radius)
+            else:
+                entries, total = leaderboard.top(tenant_id, period, day, offset=offset, limit=limit)
+        except (RedisError, LeaderboardNotBuilt) as e:
+            if isinstance(e, RedisError):
+                logger.warning("Redis indisponível, ranking do tenant %s calculado no banco", tenant_id)
+            ranking = ScoreLeaderboard.from_database(tenant_id, period, day)
+            total = len(ranking)
+            if vehicle_id:
+                index = next((index for index, entry in enumerate(ranking) if entry['vehicle_id'] == str(vehicle_id)), None)
+                me = ranking[index] if index is not None else None
+                entries = ranking[max(index - radius, 0):index + radius + 1] if index is not None else []
+            else:
+                entries = ranking[offset:offset + limit]
+
+        names = dict(Vehicle.objects.filter(id__in=[entry['vehicle_id'] for entry in entries]).values_list('id', 'name'))
+        names = {str(key): name for key, name in names.items()}
+        for entry in entries:
+            entry['vehicle_name'] = names.get(entry['vehicle_id'])
+        return Response({
+            "period": period,
+            "date": day.isoformat(),
+            "total": total,
+            "vehicle": me,
+            "results": entries,
+        })
 
 # ...
 class MapDashboardView(LoginRequiredMixin, TemplateView):
@@ -88,66 +315,37 @@ class TraccarWebhookView(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request):
+        if settings.TRACCAR_INGESTION != 'webhook':
+            # O traccar_stream já recebe estas posições: aceitar aqui as contaria duas vezes
+            logger.warning("Webhook do Traccar recebido com TRACCAR_INGESTION=%s; desligue o forward", settings.TRACCAR_INGESTION)
+            return Response({"error": "Ingestão pelo webhook desligada (TRACCAR_INGESTION)"}, status=status.HTTP_409_CONFLICT)
+
         data = request.data
         positions = data if isinstance(data, list) else [data]
-        channel_layer = get_channel_layer()
 
-        for pos in positions:
-            device_id = pos.get('deviceId')
-            if not device_id: continue
-                
-            try:
-                vehicle = Vehicle.objects.get(traccar_device_id=device_id)
-                
-                # 1. Atualiza Telemetria Básica
-                vehicle.last_position_lat = pos.get('latitude')
-                vehicle.last_position_lng = pos.get('longitude')
-                vehicle.last_speed = pos.get('speed', 0) * 1.852
-                attributes = pos.get('attributes', {})
-                vehicle.ignition = attributes.get('ignition', False)
-                
-                # Atualiza Hodômetro se disponível (totalDistance vem em metros)
-                if 'totalDistance' in attributes:
-                     vehicle.current_km = attributes['totalDistance'] / 1000.0
-                
-                vehicle.save()
+        # Com a fila ligada só enfileira; senão processa o lote inteiro (telemetria, score e WebSocket)
+        submit_positions(positions)
 
-                # 2. Processa Eventos de Score (Alarmes)
-                # O Traccar envia alarmes no campo 'attributes': {'alarm': 'overspeed'}
-                alarm_type = attributes.get('alarm')
-                score_updated = None
-                
-                if alarm_type:
-                    # Mapeia eventos do Traccar para nossa lógica
-                    # (overspeed, hardAcceleration, hardBraking, hardCornering)
-                    score_updated = ScoreService.process_event(vehicle, alarm_type)
-
-                # 3. Envia para WebSocket (Real-Time)
-                payload = {
-                    'id': vehicle.id,
-                    'name': vehicle.name,
-                    'lat': vehicle.last_position_lat,
-                    'lng': vehicle.last_position_lng,
-                    'speed': round(vehicle.last_speed, 1),
-                    'ignition': vehicle.ignition,
-                    'score': score_updated.score if score_updated else None
-                }
-
-                async_to_sync(channel_layer.group_send)(
-                    f"tenant_{vehicle.tenant.id}",
-                    {"type": "vehicle_update", "message": payload}
-                )
-                
-                # Envia para admin global também
-                async_to_sync(channel_layer.group_send)(
-                    "admin_global",
-                    {"type": "vehicle_update", "message": payload}
-                )
-
-            except Vehicle.DoesNotExist:
-                pass
-        
         return Response(status=status.HTTP_200_OK)
+
+
+class TelemetryStatsView(APIView):
+    """Métricas da ingestão de telemetria (lag e pendentes da fila)"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if not request.user.is_superuser:
+            return Response({"error": "Apenas admin"}, status=403)
+        data = {
+            'queue_enabled': settings.TELEMETRY_QUEUE_ENABLED,
+            'device_resolver': get_device_resolver().stats(),
+            'fanout': get_fanout().stats(),
+        }
+        try:
+            data['queue'] = TelemetryQueue().metrics()
+        except RedisError as e:
+            data['queue'] = {'error': str(e)}
+        return Response(data)
     
 class WorkShiftViewSet(viewsets.ModelViewSet):
     """
@@ -232,20 +430,136 @@ class DeliveryRouteViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def optimize(self, request, pk=None):
-        """Reordena as paradas para a menor distância total"""
+        """
+        Reordena as paradas para a menor distância total num processo do pool
+        (202 + id do job). A melhor ordem parcial e o resultado chegam pelo
+        WebSocket do tenant (route_progress); o resultado fica em optimize/<job_id>/.
+        Corpo opcional: time_budget (s).
+        """
         route = self.get_object()
-        
-        # Chama o serviço de otimização
-        total_km = RouteOptimizer.optimize_route(route)
-        
-        route.status = 'OPTIMIZED'
-        route.total_km_predicted = total_km
-        route.save()
-        
+        try:
+            budget = float(request.data.get('time_budget', settings.ROUTE_OPTIMIZATION_TIME_BUDGET))
+        except (TypeError, ValueError):
+            return Response({"error": "time_budget inválido"}, status=400)
+        budget = min(max(budget, 0), settings.ROUTE_OPTIMIZATION_MAX_TIME_BUDGET)
+
+        try:
+            job, holder = submit_route_optimization(route, budget)
+        except RedisError:
+            # Sem Redis não há como acompanhar o job: otimiza no próprio request
+            logger.exception("Redis indisponível, otimizando a rota %s no próprio request", route.pk)
+            result = RouteOptimizer.optimize_route(route, time_budget=min(budget, settings.ROUTE_OPTIMIZATION_TIME_BUDGET))
+            route.status = 'OPTIMIZED'
+            route.total_km_predicted = result['total_km']
+            route.save()
+            return Response({
+                "status": "Rota otimizada com sucesso",
+                "total_km_anterior": result['previous_km'],
+                "total_km_previsto": result['total_km'],
+                "otimizacao": result,
+                "stops": RouteStopSerializer(route.stops.all().order_by('sequence'), many=True).data
+            })
+
+        if job is None:
+            return Response({"error": "Rota já está sendo otimizada", "job_id": holder}, status=409)
         return Response({
-            "status": "Rota otimizada com sucesso",
-            "total_km_previsto": total_km,
-            "stops": RouteStopSerializer(route.stops.all().order_by('sequence'), many=True).data
+            "status": "Otimização iniciada",
+            "job_id": job['id'],
+            "status_url": reverse('delivery-route-optimize-status', kwargs={'job_id': job['id']}),
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path=r'optimize/(?P<job_id>[0-9a-f]{32})')
+    def optimize_status(self, request, job_id=None):
+        """Status/progresso de uma otimização; quando concluída, traz as paradas na nova ordem"""
+        job = JobStore().get(job_id)
+        if job is None or job.get('kind') != ROUTE_JOB_KIND or job.get('tenant_id') != str(request.user.profile.tenant_id):
+            return Response({"error": "Job não encontrado"}, status=404)
+        if job['status'] == 'done':
+            stops = RouteStop.objects.filter(route_id=job['route_id']).order_by('sequence')
+            job['stops'] = RouteStopSerializer(stops, many=True).data
+        return Response(job)
+
+    @action(detail=True, methods=['get'])
+    def eta(self, request, pk=None):
+        """
+        ETA ao vivo das paradas pendentes, mantido pela ingestão a cada posição
+        (e enviado no WebSocket do tenant como route_etas). Sem ETA publicado,
+        ou com o Redis fora, estima pela última posição gravada do veículo.
+        """
+        route = self.get_object()
+        if route.status != 'IN_PROGRESS':
+            return Response({"error": "Rota não está em andamento"}, status=400)
+        engine = get_eta_engine()
+        try:
+            data, source = engine.get(route.id), 'live'
+        except RedisError:
+            logger.warning("Redis indisponível, estimando o ETA da rota %s pelo banco", route.pk)
+            data = None
+        if data is None:
+            data, source = engine.estimate(route), 'estimate'
+        if data is None:
+            return Response({"error": "Rota sem veículo ou veículo sem posição"}, status=404)
+        return Response(dict(data, source=source))
+
+    @action(detail=False, methods=['post'])
+    def plan(self, request):
+        """
+        Distribui as paradas pendentes das rotas DRAFT da data entre os veículos.
+        Corpo: date (YYYY-MM-DD), vehicle_ids (opcional; padrão: todos do tenant),
+        depot {lat, lng} (opcional; sem ele cada veículo sai da última posição),
+        start_time (HH:MM, padrão 08:00), time_budget (s) e dry_run.
+        """
+        tenant = request.user.profile.tenant
+        try:
+            day = date.fromisoformat(request.data['date'])
+            start_time = dt_time.fromisoformat(request.data['start_time']) if request.data.get('start_time') else None
+            budget = min(float(request.data.get('time_budget', settings.ROUTE_PLAN_TIME_BUDGET)), settings.ROUTE_PLAN_TIME_BUDGET)
+            depot = request.data.get('depot')
+            depot = (float(depot['lat']), float(depot['lng'])) if depot else None
+        except (KeyError, TypeError, ValueError):
+            return Response({"error": "Informe date (YYYY-MM-DD); start_time, time_budget e depot {lat, lng} são opcionais"}, status=400)
+
+        vehicles = Vehicle.objects.filter(tenant=tenant).order_by('name')
+        vehicle_ids = request.data.get('vehicle_ids')
+        if vehicle_ids:
+            try:
+                vehicles = list(vehicles.filter(id__in=vehicle_ids))
+            except (TypeError, ValueError, DjangoValidationError):
+                return Response({"error": "vehicle_ids inválido"}, status=400)
+            if len(vehicles) != len(set(map(str, vehicle_ids))):
+                return Response({"error": "Veículo não encontrado"}, status=404)
+
+        planner = RoutePlanner(tenant, day, vehicles=vehicles, depot=depot, start_time=start_time)
+        if not planner.stops:
+            return Response({"error": "Nenhuma parada pendente em rotas DRAFT nesta data"}, status=400)
+        if not planner.vehicles:
+            return Response({"error": "Nenhum veículo disponível"}, status=400)
+        result = planner.plan(time_budget=max(budget, 0))
+        saved = [] if request.data.get('dry_run') else planner.save(result)
+
+        routes = []
+        saved = iter(saved)
+        for vehicle, planned in zip(planner.vehicles, result['routes']):
+            if not planned['stops']:
+                continue
+            route = next(saved, None)
+            routes.append({
+                "route_id": route.id if route else None,
+                "vehicle_id": vehicle.id,
+                "vehicle": vehicle.name,
+                "stops": [planner.stops[index].id for index in planned['stops']],
+                "km": round(planned['km'], 2),
+                "load": planned['load'],
+                "first_arrival": clock(planned['arrivals'][0]),
+                "last_arrival": clock(planned['arrivals'][-1]),
+            })
+        return Response({
+            "date": day.isoformat(),
+            "dry_run": bool(request.data.get('dry_run')),
+            "routes": routes,
+            "unassigned": [planner.stops[index].id for index in result['unassigned']],
+            "total_km": round(sum(route['km'] for route in routes), 2),
+            "stats": result['stats'],
         })
 
 class RouteStopViewSet(viewsets.ModelViewSet):
@@ -283,6 +597,38 @@ class FineViewSet(viewsets.ModelViewSet):
         return Fine.objects.filter(tenant=self.request.user.profile.tenant)
     
 
+class GeofenceViewSet(viewsets.ModelViewSet):
+    """Cercas virtuais do tenant; o GeofenceMonitor da ingestão relê as alteradas a cada GEOFENCE_REFRESH_SECONDS"""
+    serializer_class = GeofenceSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Geofence.objects.filter(tenant=self.request.user.profile.tenant).order_by('name')
+
+    def perform_create(self, serializer):
+        serializer.save(tenant=self.request.user.profile.tenant)
+
+
+class GeofenceEventViewSet(viewsets.ReadOnlyModelViewSet):
+    """Entradas/saídas das cercas, mais recentes primeiro; filtros ?vehicle= e ?geofence="""
+    serializer_class = GeofenceEventSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = StandardPagination
+
+    def get_queryset(self):
+        queryset = GeofenceEvent.objects.filter(
+            tenant=self.request.user.profile.tenant,
+        ).select_related('geofence', 'vehicle').order_by('-time')
+        for field in ('vehicle', 'geofence'):
+            value = self.request.query_params.get(field)
+            if value:
+                try:
+                    queryset = queryset.filter(**{f"{field}_id": uuid.UUID(value)})
+                except ValueError:
+                    return queryset.none()
+        return queryset
+
+
 class VehicleListView(LoginRequiredMixin, ListView):
     model = Vehicle
     template_name = 'fleet/vehicle_list.html'
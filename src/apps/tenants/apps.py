@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class TenantsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'apps.tenants'
\ No newline at end of file
+    name = 'apps.tenants'
+
+    def ready(self):
+        from . import signals  # Conecta os receivers
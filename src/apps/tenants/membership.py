@@ -0,0 +1,66 @@
+import threading
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+_MISSING = object()
+
+
+class TenantMembershipCache:
+    """
+    Cache curto de usuário -> tenant_id (None = sem tenant) por processo.
+    Usado no connect do WebSocket para não consultar o perfil a cada conexão
+    (ex: tempestade de reconexões após um deploy). Os signals de UserProfile
+    invalidam a entrada; nos outros processos a mudança vale quando o TTL expira.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else settings.TENANT_MEMBERSHIP_TTL
+        self._entries = {}  # user_id -> (expira_em, tenant_id)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None or entry[0] <= time.monotonic():
+            return _MISSING
+        return entry[1]
+
+    def set(self, user_id, tenant_id):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, tenant_id)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    async def tenant_id_for(self, user):
+        """tenant_id (str) do usuário ou None; consulta o banco fora do event loop"""
+        tenant_id = self.get(user.pk)
+        if tenant_id is _MISSING:
+            tenant_id = await _load_tenant_id(user.pk)
+            self.set(user.pk, tenant_id)
+        return tenant_id
+
+
+@database_sync_to_async
+def _load_tenant_id(user_id):
+    from .models import UserProfile
+
+    tenant_id = UserProfile.objects.filter(user_id=user_id).values_list('tenant_id', flat=True).first()
+    return str(tenant_id) if tenant_id else None
+
+
+_cache = None
+
+
+def get_membership_cache():
+    global _cache
+    if _cache is None:
+        _cache = TenantMembershipCache()
+    return _cache
@@ -1,5 +1,12 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
 from django.utils.deprecation import MiddlewareMixin
 from django.http import JsonResponse
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
 from .models import Tenant
 
 class TenantMiddleware(MiddlewareMixin):
@@ -22,4 +29,47 @@ class TenantMiddleware(MiddlewareMixin):
         request.tenant = tenant
         
         # Nota: Na Fase 2 implementaremos bloqueio se tenant for obrigatório para certas rotas
-        return None
\ No newline at end of file
+        return None
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Autenticação JWT para WebSockets (app mobile): token de acesso em
+    ?token=<access> ou no header "Authorization: Bearer <access>".
+    Sem token, mantém o usuário da sessão (AuthMiddlewareStack). Com token
+    válido, grava o usuário e as claims em scope['user'] / scope['token_claims'];
+    a claim tenant_id evita consultar o perfil no connect.
+    """
+
+    async def __call__(self, scope, receive, send):
+        raw_token = self.get_raw_token(scope)
+        if raw_token:
+            scope = dict(scope)
+            user, claims = await get_jwt_user(raw_token)
+            scope['user'] = user
+            if claims is not None:
+                scope['token_claims'] = claims
+        return await super().__call__(scope, receive, send)
+
+    @staticmethod
+    def get_raw_token(scope):
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        if token:
+            return token[0]
+        for name, value in scope.get('headers', []):
+            if name == b'authorization':
+                parts = value.decode().split()
+                if len(parts) == 2 and parts[0].lower() == 'bearer':
+                    return parts[1]
+        return None
+
+
+@database_sync_to_async
+def get_jwt_user(raw_token):
+    """(usuário, claims) ou (AnonymousUser, None) se o token for inválido/expirado"""
+    authentication = JWTAuthentication()
+    try:
+        validated = authentication.get_validated_token(raw_token)
+        user = authentication.get_user(validated)
+    except (InvalidToken, AuthenticationFailed):
+        return AnonymousUser(), None
+    return user, dict(validated.payload)
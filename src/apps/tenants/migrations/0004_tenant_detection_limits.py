@@ -0,0 +1,33 @@
+# Generated by Django 5.0.2 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0003_tenant_weight_harsh_acceleration_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenant',
+            name='harsh_acceleration_limit',
+            field=models.FloatField(default=3.0, verbose_name='Limite: Aceleração Brusca (m/s²)'),
+        ),
+        migrations.AddField(
+            model_name='tenant',
+            name='harsh_braking_limit',
+            field=models.FloatField(default=3.5, verbose_name='Limite: Freada Brusca (m/s²)'),
+        ),
+        migrations.AddField(
+            model_name='tenant',
+            name='harsh_cornering_limit',
+            field=models.FloatField(default=3.5, verbose_name='Limite: Curva Brusca (m/s² lateral)'),
+        ),
+        migrations.AddField(
+            model_name='tenant',
+            name='overspeed_limit',
+            field=models.FloatField(default=110, verbose_name='Limite de Velocidade (km/h)'),
+        ),
+    ]
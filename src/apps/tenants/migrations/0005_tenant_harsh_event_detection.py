@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0004_tenant_detection_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenant',
+            name='harsh_event_detection',
+            field=models.BooleanField(default=False, verbose_name='Detectar eventos pela telemetria'),
+        ),
+    ]
@@ -18,6 +18,13 @@ class Tenant(TimeStampedModel):
     weight_harsh_braking = models.IntegerField(default=5, verbose_name="Peso: Freada Brusca")
     weight_harsh_cornering = models.IntegerField(default=5, verbose_name="Peso: Curva Brusca")
 
+    # --- Detecção de eventos pela telemetria (opt-in; 0 desliga o evento) ---
+    harsh_event_detection = models.BooleanField(default=False, verbose_name="Detectar eventos pela telemetria")
+    overspeed_limit = models.FloatField(default=110, verbose_name="Limite de Velocidade (km/h)")
+    harsh_acceleration_limit = models.FloatField(default=3.0, verbose_name="Limite: Aceleração Brusca (m/s²)")
+    harsh_braking_limit = models.FloatField(default=3.5, verbose_name="Limite: Freada Brusca (m/s²)")
+    harsh_cornering_limit = models.FloatField(default=3.5, verbose_name="Limite: Curva Brusca (m/s² lateral)")
+
     def __str__(self):
         return self.name
 
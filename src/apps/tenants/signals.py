@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .membership import get_membership_cache
+from .models import UserProfile
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_membership(sender, instance, **kwargs):
+    """Usuário trocou de tenant: o próximo connect do WebSocket relê o perfil"""
+    get_membership_cache().invalidate(instance.user_id)
@@ -5,7 +5,6 @@ from .serializers import CustomTokenObtainPairSerializer, UserSerializer
 from django.views.generic import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from apps.fleet.models import Vehicle, WorkOrder, DriverScore
-from django.utils import timezone
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
@@ -35,7 +34,7 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         context['maintenance_pending'] = WorkOrder.objects.filter(tenant=tenant, status='PENDING').count()
         
         # Alertas Hoje (Baseado no Score que baixou pontos hoje)
-        today = timezone.now().date()
+        today = DriverScore.today()
         # Conta quantos scores foram criados/atualizados hoje com pontuação < 100
         context['alerts_today'] = DriverScore.objects.filter(
             tenant=tenant, 
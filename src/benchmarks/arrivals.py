@@ -0,0 +1,85 @@
+"""
+Custo do ArrivalDetector por posição (índice em grid das paradas por rota).
+
+    python -m benchmarks.arrivals --vehicles 5000 --stops-per-route 50 --positions 500000
+
+Monta as rotas direto na memória (sem banco): cada veículo do
+PositionGenerator tem uma rota IN_PROGRESS com paradas espalhadas a até
+~2 km do ponto de partida, e o detector recebe as posições em lotes.
+"""
+import argparse
+import random
+import sys
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vehicles', type=int, default=5000)
+    parser.add_argument('--stops-per-route', type=int, default=50)
+    parser.add_argument('--positions', type=int, default=500000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--interval', type=float, default=5.0, help="Segundos entre posições de um veículo")
+    parser.add_argument('--database-url', help="Banco (padrão: SQLite temporário)")
+    parser.add_argument('--redis-url', help="Redis (padrão: InMemoryChannelLayer)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from .ingestion import setup_django
+
+    args = parse_args(argv)
+    args.json_output = None
+    setup_django(args)
+
+    import uuid
+    from collections import Counter
+    from apps.fleet.arrivals import ArrivalDetector
+    from apps.fleet.models import Vehicle
+    from .generator import DEVICE_ID_OFFSET, PositionGenerator
+
+    device_ids = range(DEVICE_ID_OFFSET, DEVICE_ID_OFFSET + args.vehicles)
+    generator = PositionGenerator(device_ids, interval=args.interval, alarm_rate=0)
+    rng = random.Random(7)
+    tenant_id = uuid.uuid4()
+    vehicles, active, stops = {}, {}, {}
+    for device_id in device_ids:
+        # ids em texto, como o DeviceResolver entrega na ingestão
+        vehicle = vehicles[device_id] = Vehicle(id=str(uuid.uuid4()), tenant_id=tenant_id, traccar_device_id=device_id)
+        route_id = str(uuid.uuid4())
+        start = generator.state[device_id]
+        active[route_id] = (vehicle.id, tenant_id, None)
+        stops[route_id] = [
+            (str(uuid.uuid4()), start['lat'] + rng.uniform(-0.02, 0.02), start['lng'] + rng.uniform(-0.02, 0.02))
+            for _ in range(args.stops_per_route)
+        ]
+
+    detector = ArrivalDetector(dwell=0)  # sem permanência mínima: toda passagem pelo raio vira evento
+    started = time.perf_counter()
+    detector.load(active, stops)
+    load_elapsed = time.perf_counter() - started
+    detector.next_refresh = float('inf')
+
+    events = Counter()
+    elapsed = 0.0
+    processed = 0
+    while processed < args.positions:
+        positions = generator.batch(min(args.batch_size, args.positions - processed))
+        updates = [(vehicles[pos['deviceId']], pos, pos['attributes']) for pos in positions]
+        started = time.perf_counter()
+        found = detector.check(updates)
+        elapsed += time.perf_counter() - started
+        events.update(event['event'] for event in found)
+        processed += len(positions)
+
+    sys.stdout.write(
+        f"\n{args.vehicles} rotas x {args.stops_per_route} paradas (índice montado em {load_elapsed:.2f}s), "
+        f"{processed} posições em lotes de {args.batch_size}: "
+        f"{elapsed:.2f}s -> {processed / elapsed:,.0f} pos/s ({elapsed / processed * 1e6:.1f} µs/posição)\n"
+        f"eventos: {dict(events)}\n"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
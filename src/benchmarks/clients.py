@@ -0,0 +1,86 @@
+import asyncio
+import json
+import time
+import uuid
+
+import msgpack
+from channels.testing import WebsocketCommunicator
+
+from apps.fleet.protocol import COORD_SCALE, SUBPROTOCOL
+
+
+def position_key(vehicle_id, lat):
+    """Identifica uma posição no cliente (lat quantizada como no protocolo binário)"""
+    return vehicle_id, round(lat * COORD_SCALE)
+
+
+class LiveMapClient:
+    """
+    Cliente simulado do mapa ao vivo: conecta no FleetConsumer pela pilha ASGI
+    completa (JWT em ?token=) e mede a latência webhook -> WebSocket de cada
+    posição recebida, comparando com o horário de envio registrado em `sent`.
+    """
+
+    def __init__(self, application, token, sent, binary=False):
+        self.sent = sent  # position_key -> perf_counter do envio ao webhook
+        self.binary = binary
+        self.communicator = WebsocketCommunicator(
+            application, f"/ws/fleet/live/?token={token}", subprotocols=[SUBPROTOCOL] if binary else []
+        )
+        self.latencies = []
+        self.frames = 0
+        self.updates = 0
+        self.bytes_received = 0
+        self._task = None
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect()
+        if not connected:
+            raise RuntimeError("WebSocket recusado (token inválido?)")
+        await self.communicator.receive_output()  # snapshot inicial
+        self._task = asyncio.ensure_future(self._listen())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.communicator.disconnect()
+
+    async def _listen(self):
+        while True:
+            # Sem timeout: um timeout no communicator cancelaria o consumer
+            message = await self.communicator.receive_output(timeout=None)
+            received_at = time.perf_counter()
+            if message['type'] != 'websocket.send':
+                return
+            self.frames += 1
+            for key in self.decode(message):
+                self.updates += 1
+                sent_at = self.sent.get(key)
+                if sent_at is not None:
+                    self.latencies.append(received_at - sent_at)
+
+    def decode(self, message):
+        if self.binary:
+            frame = message.get('bytes') or b''
+            self.bytes_received += len(frame)
+            for vehicle_key, changes in msgpack.unpackb(frame).get('v', []):
+                if 'a' in changes:
+                    yield str(uuid.UUID(bytes=vehicle_key)), changes['a']
+            return
+
+        text = message.get('text') or ''
+        self.bytes_received += len(text)
+        data = json.loads(text)
+        if data.get('type') == 'vehicle_update':
+            payloads = [data['data']]
+        elif data.get('type') == 'vehicle_updates':
+            payloads = data['data']
+        else:
+            return
+        for payload in payloads:
+            if payload.get('lat') is not None:
+                yield position_key(payload['id'], payload['lat'])
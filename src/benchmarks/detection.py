@@ -0,0 +1,75 @@
+"""
+Custo do HarshEventDetector (CPU por posição e memória do estado por device).
+
+    python -m benchmarks.detection --vehicles 50000 --positions 500000 --batch-size 500
+
+Alimenta o detector direto (sem banco nem Redis no caminho) com as posições
+do PositionGenerator, sem alarmes do rastreador: tudo que sai foi detectado.
+"""
+import argparse
+import sys
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vehicles', type=int, default=50000)
+    parser.add_argument('--positions', type=int, default=500000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--interval', type=float, default=5.0, help="Segundos entre posições de um veículo")
+    parser.add_argument('--database-url', help="Banco (padrão: SQLite temporário)")
+    parser.add_argument('--redis-url', help="Redis (padrão: InMemoryChannelLayer)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from .ingestion import setup_django
+
+    args = parse_args(argv)
+    args.json_output = None
+    setup_django(args)
+
+    from collections import Counter
+    from apps.fleet.detection import HarshEventDetector
+    from apps.fleet.models import Vehicle
+    from apps.tenants.models import Tenant
+    from .generator import DEVICE_ID_OFFSET, SUBDOMAIN_PREFIX, PositionGenerator, teardown_fleet
+
+    teardown_fleet()
+    tenant = Tenant.objects.create(
+        name="Benchmark detecção", subdomain=f"{SUBDOMAIN_PREFIX}detection", harsh_event_detection=True,
+    )
+    device_ids = range(DEVICE_ID_OFFSET, DEVICE_ID_OFFSET + args.vehicles)
+    vehicles = {device_id: Vehicle(tenant_id=tenant.id, traccar_device_id=device_id) for device_id in device_ids}
+    generator = PositionGenerator(device_ids, interval=args.interval, alarm_rate=0)
+    detector = HarshEventDetector(cooldown=30)
+
+    events = Counter()
+    elapsed = 0.0
+    processed = 0
+    try:
+        while processed < args.positions:
+            positions = generator.batch(min(args.batch_size, args.positions - processed))
+            updates = [(vehicles[pos['deviceId']], pos, pos['attributes']) for pos in positions]
+            started = time.perf_counter()
+            detected, _ = detector.detect(updates)
+            elapsed += time.perf_counter() - started
+            events.update(alarm for _, alarm in detected)
+            processed += len(positions)
+    finally:
+        teardown_fleet()
+
+    state = detector.state
+    state_bytes = state.nbytes() + sys.getsizeof(state.slots)
+    sys.stdout.write(
+        f"\n{args.vehicles} veículos, {processed} posições em lotes de {args.batch_size}: "
+        f"{elapsed:.2f}s -> {processed / elapsed:,.0f} pos/s ({elapsed / processed * 1e6:.1f} µs/posição)\n"
+        f"eventos: {dict(events)}\n"
+        f"estado: {state_bytes / 1024 / 1024:.1f} MiB ({state_bytes / state.size:.0f} bytes/device, "
+        f"capacidade {len(state.time)})\n"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+DistanceCache com o OsrmProvider contra o OSRM falso (benchmarks.fake_osrm).
+
+    python -m benchmarks.distances --stops 50 200 1000 --latency 0.02 --redis-url redis://localhost:6379/0
+
+Para cada tamanho mede a matriz em linha reta, a primeira busca no OSRM
+(falta no cache, em blocos de --max-table-size coordenadas), a repetição
+(LRU local), a repetição noutro processo (simulado com um cache local vazio:
+vem do Redis) e os mesmos pontos em outra ordem (mesma chave).
+"""
+import argparse
+import sys
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stops', type=int, nargs='+', default=[50, 200, 1000])
+    parser.add_argument('--latency', type=float, default=0.02, help="Segundos por requisição ao OSRM falso")
+    parser.add_argument('--max-table-size', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', help="Banco (padrão: SQLite temporário)")
+    parser.add_argument('--redis-url', help="Redis (padrão: redis://127.0.0.1:6379/0)")
+    return parser.parse_args(argv)
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def main(argv=None):
+    from .ingestion import setup_django
+
+    args = parse_args(argv)
+    args.json_output = None
+    setup_django(args)
+
+    import numpy as np
+    from apps.fleet.distances import DistanceCache, OsrmProvider
+    from apps.fleet.optimization import distance_matrix
+    from .fake_osrm import FakeOsrm
+
+    fake = FakeOsrm(latency=args.latency, max_table_size=args.max_table_size)
+    provider = OsrmProvider(base_url=fake.start(), table_size=args.max_table_size)
+    rng = np.random.default_rng(args.seed)
+
+    sys.stdout.write(
+        f"\nlatência do OSRM falso: {args.latency * 1000:.0f} ms/req, até {args.max_table_size} coordenadas por req\n"
+        f"{'paradas':>8} {'haversine':>10} {'OSRM':>9} {'reqs':>5} {'local':>9} {'Redis':>9} {'outra ordem':>12}\n"
+    )
+    for size in args.stops:
+        lats = -23.55 + rng.uniform(-0.18, 0.18, size)
+        lngs = -46.63 + rng.uniform(-0.18, 0.18, size)
+        _, straight = timed(distance_matrix, lats, lngs)
+
+        cache = DistanceCache(provider=provider)
+        provider.requests = 0
+        cold_matrix, cold = timed(cache.matrix, lats, lngs)
+        requests = provider.requests
+        _, local = timed(cache.matrix, lats, lngs)
+        _, remote = timed(DistanceCache(provider=provider).matrix, lats, lngs)
+        shuffle = rng.permutation(size)
+        shuffled, reordered = timed(cache.matrix, lats[shuffle], lngs[shuffle])
+        assert provider.requests == requests, "repetição chamou o provedor"
+        assert np.allclose(shuffled, cold_matrix[np.ix_(shuffle, shuffle)], atol=1e-3)
+
+        sys.stdout.write(
+            f"{size:>8} {straight * 1000:>8.1f}ms {cold * 1000:>7.0f}ms {requests:>5} {local * 1000:>7.1f}ms "
+            f"{remote * 1000:>7.1f}ms {reordered * 1000:>10.1f}ms\n"
+        )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
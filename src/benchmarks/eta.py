@@ -0,0 +1,99 @@
+"""
+Custo do EtaEngine: posição (incremental) x materializar os ETAs da rota.
+
+    python -m benchmarks.eta --vehicles 5000 --stops-per-route 50 --positions 500000
+
+Monta as rotas direto na memória (sem banco), como benchmarks.arrivals. Mede
+o custo por posição do update() (guarda a posição e suaviza a velocidade) e
+o de materializar os ETAs de uma rota (o que a publicação faz no máximo a
+cada LIVE_ETA_PUBLISH_INTERVAL por rota), que é o custo por posição de
+recalcular a rota inteira a cada posição.
+"""
+import argparse
+import random
+import sys
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vehicles', type=int, default=5000)
+    parser.add_argument('--stops-per-route', type=int, default=50)
+    parser.add_argument('--positions', type=int, default=500000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--interval', type=float, default=5.0, help="Segundos entre posições de um veículo")
+    parser.add_argument('--publish-interval', type=float, default=15.0, help="Segundos entre publicações de uma rota")
+    parser.add_argument('--database-url', help="Banco (padrão: SQLite temporário)")
+    parser.add_argument('--redis-url', help="Redis (padrão: InMemoryChannelLayer)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from .ingestion import setup_django
+
+    args = parse_args(argv)
+    args.json_output = None
+    setup_django(args)
+
+    import uuid
+    from apps.fleet.eta import EtaEngine
+    from apps.fleet.models import Vehicle
+    from .generator import DEVICE_ID_OFFSET, PositionGenerator
+
+    device_ids = range(DEVICE_ID_OFFSET, DEVICE_ID_OFFSET + args.vehicles)
+    generator = PositionGenerator(device_ids, interval=args.interval, alarm_rate=0)
+    rng = random.Random(7)
+    tenant_id = uuid.uuid4()
+    vehicles, active, stops = {}, {}, {}
+    for device_id in device_ids:
+        vehicle = vehicles[device_id] = Vehicle(id=str(uuid.uuid4()), tenant_id=tenant_id, traccar_device_id=device_id)
+        route_id = str(uuid.uuid4())
+        start = generator.state[device_id]
+        active[route_id] = (vehicle.id, tenant_id, None)
+        stops[route_id] = [
+            (str(uuid.uuid4()), start['lat'] + rng.uniform(-0.02, 0.02), start['lng'] + rng.uniform(-0.02, 0.02),
+             300, None, None, None)
+            for _ in range(args.stops_per_route)
+        ]
+
+    engine = EtaEngine()
+    started = time.perf_counter()
+    engine.load(active, stops)
+    load_elapsed = time.perf_counter() - started
+    started = time.perf_counter()
+    engine.measure()
+    measure_elapsed = time.perf_counter() - started
+    engine.next_refresh = float('inf')
+
+    elapsed = 0.0
+    processed = 0
+    while processed < args.positions:
+        positions = generator.batch(min(args.batch_size, args.positions - processed))
+        updates = [(vehicles[pos['deviceId']], pos, pos['attributes']) for pos in positions]
+        started = time.perf_counter()
+        engine.update(updates)
+        elapsed += time.perf_counter() - started
+        processed += len(positions)
+
+    routes = list(engine.routes.values())
+    started = time.perf_counter()
+    for route in routes:
+        engine.snapshot(route)
+    snapshot = (time.perf_counter() - started) / len(routes)
+
+    # Publicações por posição: uma por rota a cada publish_interval, com uma posição a cada interval
+    publish_share = min(args.interval / args.publish_interval, 1.0)
+    sys.stdout.write(
+        f"\n{args.vehicles} rotas x {args.stops_per_route} paradas (montadas em {load_elapsed:.2f}s, "
+        f"distâncias em {measure_elapsed:.2f}s), "
+        f"{processed} posições em lotes de {args.batch_size}\n"
+        f"update: {elapsed / processed * 1e6:.1f} µs/posição ({processed / elapsed:,.0f} pos/s)\n"
+        f"ETAs de uma rota: {snapshot * 1e6:.1f} µs (recalcular a rota a cada posição)\n"
+        f"incremental com publicação a cada {args.publish_interval:.0f}s: "
+        f"{(elapsed / processed + snapshot * publish_share) * 1e6:.1f} µs/posição\n"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
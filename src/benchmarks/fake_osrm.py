@@ -0,0 +1,104 @@
+"""
+OSRM falso (serviço table) para testar o OsrmProvider sem um osrm-routed.
+
+    python -m benchmarks.fake_osrm --port 5000 --latency 0.05 --max-table-size 100
+
+Responde GET /table/v1/{perfil}/{lng,lat;...}?sources=&destinations=&annotations=distance
+com a distância em linha reta vezes um fator de desvio (em metros, levemente
+assimétrica como ruas de mão única) e a latência pedida por requisição.
+Acima de --max-table-size coordenadas responde TooBig, como o OSRM.
+Não depende do Django.
+"""
+import argparse
+import json
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+from apps.fleet.optimization import distance_matrix
+
+
+class FakeOsrm:
+    def __init__(self, latency=0.0, detour=1.3, max_table_size=100):
+        self.latency = latency
+        self.detour = detour
+        self.max_table_size = max_table_size
+        self.requests = 0
+        self.cells = 0
+
+    def table(self, coordinates, query):
+        points = [tuple(map(float, pair.split(','))) for pair in coordinates.split(';')]
+        if len(points) > self.max_table_size:
+            return HTTPStatus.BAD_REQUEST, {'code': 'TooBig', 'message': 'Too many table coordinates'}
+        sources = [int(index) for index in query['sources'][0].split(';')] if 'sources' in query else range(len(points))
+        destinations = (
+            [int(index) for index in query['destinations'][0].split(';')] if 'destinations' in query else range(len(points))
+        )
+        lngs, lats = np.array(points).T
+        meters = distance_matrix(lats, lngs) * 1000 * self.detour
+        meters *= 1 + 0.05 * np.triu(np.ones_like(meters), 1)  # uma das direções um pouco mais longa
+        block = meters[np.ix_(list(sources), list(destinations))]
+        self.requests += 1
+        self.cells += block.size
+        time.sleep(self.latency)
+        return HTTPStatus.OK, {'code': 'Ok', 'distances': np.round(block, 1).tolist()}
+
+    def http_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                parts = url.path.split('/')
+                if len(parts) == 5 and parts[1] == 'table' and parts[2] == 'v1':
+                    status, data = fake.table(unquote(parts[4]), parse_qs(url.query))
+                    self.reply(data, status)
+                else:
+                    self.reply({'code': 'InvalidUrl'}, HTTPStatus.BAD_REQUEST)
+
+            def reply(self, data, status=HTTPStatus.OK):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self, host='127.0.0.1', port=0):
+        """Sobe o servidor numa thread; devolve a URL para OSRM_BASE_URL"""
+        server = ThreadingHTTPServer((host, port), self.http_handler())
+        threading.Thread(target=server.serve_forever, name="fake-osrm", daemon=True).start()
+        return f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.05, help="Segundos por requisição")
+    parser.add_argument('--detour', type=float, default=1.3, help="Fator sobre a linha reta")
+    parser.add_argument('--max-table-size', type=int, default=100)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    fake = FakeOsrm(latency=args.latency, detour=args.detour, max_table_size=args.max_table_size)
+    base_url = fake.start(args.host, args.port)
+    print(f"OSRM falso: DISTANCE_PROVIDER=osrm OSRM_BASE_URL={base_url} (Ctrl+C encerra)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+Traccar falso para testes locais do traccar_stream / sync / backfill.
+
+    python -m benchmarks.fake_traccar --devices 1000 --rate 200 --port 8082 --socket-port 8083
+
+Serve a API REST (POST /api/session com cookie JSESSIONID, /api/devices,
+/api/reports/route com as posições já emitidas ou, com --route-interval, um
+histórico sintético) e, numa segunda porta, o WebSocket /api/socket, que
+empurra mensagens {"positions": [...]} no ritmo pedido (--rate 0 = o mais
+rápido possível). Não depende do Django.
+"""
+import argparse
+import asyncio
+import json
+import math
+import threading
+from datetime import datetime, timezone
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import websockets
+
+from .generator import ALARMS, DEVICE_ID_OFFSET, PositionGenerator
+
+SESSION_COOKIE = "JSESSIONID=fake-traccar-session"
+
+
+class FakeTraccar:
+    def __init__(self, device_ids, rate=100.0, message_size=10, interval=10.0, alarm_rate=0.01, drop_after=None,
+                 route_interval=None):
+        self.generator = PositionGenerator(device_ids, interval=interval, alarm_rate=alarm_rate)
+        self.alarm_rate = alarm_rate
+        self.route_interval = route_interval  # histórico sintético no /api/reports/route (backfill)
+        self.rate = rate
+        self.message_size = message_size
+        self.drop_after = drop_after  # derruba cada conexão após N mensagens (testa reconexão)
+        self.history = []
+        self.sent = 0
+        self.connections = 0
+        self.server = None
+
+    # --- HTTP ---
+
+    def http_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if urlsplit(self.path).path == '/api/session':
+                    self.reply({'id': 1, 'name': 'admin'}, [('Set-Cookie', f"{SESSION_COOKIE}; Path=/")])
+                else:
+                    self.reply(None, status=HTTPStatus.NOT_FOUND)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path == '/api/devices':
+                    self.reply(fake.devices())
+                elif url.path == '/api/reports/route':
+                    self.reply(fake.route(parse_qs(url.query)))
+                else:
+                    self.reply(None, status=HTTPStatus.NOT_FOUND)
+
+            def reply(self, data, headers=(), status=HTTPStatus.OK):
+                body = json.dumps(data).encode() if data is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def devices(self):
+        return [
+            {'id': device_id, 'name': f"Fake {device_id}", 'status': 'online',
+             'lastUpdate': self.generator.clock.isoformat()}
+            for device_id in self.generator.devices
+        ]
+
+    def route(self, query):
+        device_ids = {int(device_id) for device_id in query.get('deviceId', [])}
+        start = datetime.fromisoformat(query['from'][0])
+        end = datetime.fromisoformat(query['to'][0])
+        if self.route_interval:
+            return self.synthetic_route(sorted(device_ids), start, end)
+        return [
+            pos for pos in list(self.history)
+            if pos['deviceId'] in device_ids and start <= datetime.fromisoformat(pos['fixTime']) <= end
+        ]
+
+    def synthetic_route(self, device_ids, start, end):
+        """
+        Uma posição a cada route_interval segundos por device (horários
+        alinhados ao intervalo): a mesma janela sempre devolve as mesmas
+        posições, como um Traccar com histórico completo.
+        """
+        step = self.route_interval
+        first = math.ceil(start.timestamp() / step) * step
+        last = int(end.timestamp())
+        alarm_every = round(1 / self.alarm_rate) if self.alarm_rate else 0
+        positions = []
+        for device_id in device_ids:
+            state = self.generator.state.get(device_id)
+            if state is None:
+                continue
+            heading = math.radians(state['course'])
+            for moment in range(first, last + 1, step):
+                tick = moment // step
+                offset = (tick % 5000) * 0.0001  # anda ~11 m por posição e recomeça
+                attributes = {'ignition': True, 'totalDistance': state['distance'] + tick * 11.0}
+                if alarm_every and (device_id + tick) % alarm_every == 0:
+                    attributes['alarm'] = ALARMS[(tick // alarm_every) % len(ALARMS)]
+                positions.append({
+                    'id': tick,
+                    'deviceId': device_id,
+                    'latitude': round(state['lat'] + offset * math.cos(heading), 6),
+                    'longitude': round(state['lng'] + offset * math.sin(heading), 6),
+                    'speed': 20.0,
+                    'course': state['course'],
+                    'fixTime': datetime.fromtimestamp(moment, timezone.utc).isoformat(),
+                    'attributes': attributes,
+                })
+        return positions
+
+    @staticmethod
+    def check_session(path, headers):
+        if SESSION_COOKIE not in headers.get('Cookie', ''):
+            return HTTPStatus.UNAUTHORIZED, [], b'sessao invalida'
+        return None  # segue o handshake do WebSocket
+
+    # --- WebSocket ---
+
+    async def socket(self, websocket, path=None):
+        self.connections += 1
+        try:
+            await self.push(websocket)
+        except websockets.ConnectionClosed:
+            pass  # cliente encerrou
+
+    async def push(self, websocket):
+        # Como o Traccar: ao conectar manda a última posição conhecida de cada device
+        latest = {pos['deviceId']: pos for pos in self.history}
+        if latest:
+            await websocket.send(json.dumps({'positions': list(latest.values())}))
+
+        messages = 0
+        delay = self.message_size / self.rate if self.rate else 0
+        while True:
+            positions = self.generator.batch(self.message_size)
+            for pos in positions:
+                # Relógio real: a retomada pelo /api/reports/route usa o horário atual
+                pos['fixTime'] = datetime.now(timezone.utc).isoformat()
+            self.history.extend(positions)
+            await websocket.send(json.dumps({'positions': positions}))
+            self.sent += len(positions)
+            messages += 1
+            if self.drop_after and messages >= self.drop_after:
+                await websocket.close()
+                return
+            await asyncio.sleep(delay)
+
+    async def serve_socket(self, host, port):
+        self.server = await websockets.serve(self.socket, host, port, process_request=self.check_session, max_size=None)
+        return self.server
+
+    def start(self, host='127.0.0.1', http_port=0, socket_port=0):
+        """
+        Sobe a API REST (thread) e o WebSocket (loop próprio numa thread).
+        Devolve (base_url, socket_url) para TRACCAR_BASE_URL / TRACCAR_SOCKET_URL.
+        """
+        http_server = ThreadingHTTPServer((host, http_port), self.http_handler())
+        threading.Thread(target=http_server.serve_forever, name="fake-traccar-http", daemon=True).start()
+
+        ready = threading.Event()
+        address = {}
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            server = loop.run_until_complete(self.serve_socket(host, socket_port))
+            address['port'] = server.sockets[0].getsockname()[1]
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, name="fake-traccar-socket", daemon=True).start()
+        ready.wait(5)
+        return f"http://{host}:{http_server.server_address[1]}", f"ws://{host}:{address['port']}/api/socket"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--first-device-id', type=int, default=DEVICE_ID_OFFSET)
+    parser.add_argument('--rate', type=float, default=100.0, help="Posições por segundo (0 = sem limite)")
+    parser.add_argument('--message-size', type=int, default=10, help="Posições por mensagem do socket")
+    parser.add_argument('--drop-after', type=int, help="Fecha a conexão após N mensagens")
+    parser.add_argument(
+        '--route-interval', type=int,
+        help="Segundos entre posições do histórico sintético no /api/reports/route (para o backfill)",
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8082, help="Porta da API REST")
+    parser.add_argument('--socket-port', type=int, default=8083, help="Porta do WebSocket /api/socket")
+    args = parser.parse_args(argv)
+
+    fake = FakeTraccar(
+        range(args.first_device_id, args.first_device_id + args.devices),
+        rate=args.rate, message_size=args.message_size, drop_after=args.drop_after,
+        route_interval=args.route_interval,
+    )
+
+    base_url, socket_url = fake.start(args.host, args.port, args.socket_port)
+    print(f"Traccar falso: TRACCAR_BASE_URL={base_url} TRACCAR_SOCKET_URL={socket_url}")
+    print(f"{args.devices} devices, {args.rate or 'sem limite de'} pos/s (Ctrl+C encerra)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
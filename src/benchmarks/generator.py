@@ -0,0 +1,121 @@
+import math
+import random
+from datetime import datetime, timedelta, timezone
+
+ALARMS = ('overspeed', 'hardAcceleration', 'hardBraking', 'hardCornering')
+
+# deviceIds dos veículos sintéticos começam aqui para não colidir com os reais
+DEVICE_ID_OFFSET = 900_000_000
+SUBDOMAIN_PREFIX = 'bench-'
+
+
+def setup_fleet(vehicles, tenants):
+    """
+    Cria (ou recria) tenants, veículos e um usuário por tenant para o benchmark.
+    Devolve (devices, users): devices = [(device_id, vehicle_id, tenant_id)],
+    users = {tenant_id: User}.
+    """
+    from django.contrib.auth.models import User
+    from apps.fleet.models import Vehicle
+    from apps.tenants.models import Tenant, UserProfile
+
+    teardown_fleet()
+    tenant_objs = Tenant.objects.bulk_create([
+        Tenant(name=f"Benchmark {index}", subdomain=f"{SUBDOMAIN_PREFIX}{index}")
+        for index in range(tenants)
+    ])
+    vehicle_objs = Vehicle.objects.bulk_create([
+        Vehicle(
+            tenant=tenant_objs[index % tenants],
+            name=f"BENCH-{index:05d}",
+            plate=f"BCH{index:04d}",
+            traccar_device_id=DEVICE_ID_OFFSET + index,
+        )
+        for index in range(vehicles)
+    ])
+
+    users = {}
+    for tenant in tenant_objs:
+        user = User.objects.create_user(username=f"{tenant.subdomain}-manager", password=None)
+        UserProfile.objects.create(user=user, tenant=tenant, role='manager')
+        users[str(tenant.id)] = user
+
+    devices = [(vehicle.traccar_device_id, str(vehicle.id), str(vehicle.tenant_id)) for vehicle in vehicle_objs]
+    return devices, users
+
+
+def teardown_fleet():
+    from django.contrib.auth.models import User
+    from apps.fleet.models import Vehicle
+    from apps.tenants.models import Tenant
+
+    Vehicle.objects.filter(traccar_device_id__gte=DEVICE_ID_OFFSET).delete()
+    Tenant.objects.filter(subdomain__startswith=SUBDOMAIN_PREFIX).delete()
+    User.objects.filter(username__startswith=SUBDOMAIN_PREFIX).delete()
+
+
+class PositionGenerator:
+    """
+    Posições sintéticas no formato do webhook do Traccar.
+    Cada veículo parte de um ponto aleatório, muda pouco o rumo e reporta a
+    cada `interval` segundos (espalhados uniformemente); `alarm_rate` é a
+    probabilidade de uma posição trazer um alarme de score.
+    """
+
+    def __init__(self, device_ids, interval=10.0, alarm_rate=0.01, seed=42):
+        self.interval = interval
+        self.alarm_rate = alarm_rate
+        self.random = random.Random(seed)
+        self.state = {}
+        for device_id in device_ids:
+            self.state[device_id] = {
+                'lat': self.random.uniform(-30.0, -15.0),
+                'lng': self.random.uniform(-52.0, -40.0),
+                'course': self.random.uniform(0, 360),
+                'distance': self.random.uniform(0, 500_000),
+                'ignition': True,
+            }
+        self.devices = list(self.state)
+        self.cursor = 0
+        self.clock = datetime.now(timezone.utc)
+
+    @property
+    def rate(self):
+        """Posições por segundo da frota inteira"""
+        return len(self.devices) / self.interval
+
+    def position(self, device_id):
+        state = self.state[device_id]
+        speed = self.random.uniform(0, 60)  # nós
+        # Anda pelo menos ~10 m por posição: cada posição é distinguível no cliente
+        step = max(speed * 0.514 * self.interval, 10.0) / 111_000
+        state['lat'] += step * math.cos(math.radians(state['course']))
+        state['lng'] += step * math.sin(math.radians(state['course']))
+        state['course'] = (state['course'] + self.random.uniform(-15, 15)) % 360
+        state['distance'] += step * 111_000
+        if self.random.random() < 0.02:
+            state['ignition'] = not state['ignition']
+
+        attributes = {'ignition': state['ignition'], 'totalDistance': round(state['distance'], 1)}
+        if self.random.random() < self.alarm_rate:
+            attributes['alarm'] = self.random.choice(ALARMS)
+        return {
+            'deviceId': device_id,
+            'latitude': round(state['lat'], 6),
+            'longitude': round(state['lng'], 6),
+            'speed': round(speed, 2),
+            'course': round(state['course'], 1),
+            'fixTime': self.clock.isoformat(),
+            'attributes': attributes,
+        }
+
+    def batch(self, size):
+        """Próximas `size` posições na ordem de reporte da frota"""
+        positions = []
+        for _ in range(size):
+            positions.append(self.position(self.devices[self.cursor]))
+            self.cursor += 1
+            if self.cursor == len(self.devices):
+                self.cursor = 0
+                self.clock += timedelta(seconds=self.interval)
+        return positions
@@ -0,0 +1,127 @@
+"""
+Custo do GeofenceMonitor por posição (grid das cercas do tenant) x testar todas as cercas.
+
+    python -m benchmarks.geofences --vehicles 5000 --fences 5000 --positions 500000
+
+Monta as cercas direto na memória (sem banco), num tenant só: polígonos e
+círculos de --min-size a --max-size metros em volta dos pontos de partida
+dos veículos do PositionGenerator (para haver entradas e saídas), mais
+--large cercas grandes (regiões inteiras, fora do grid). Para comparar, a
+mesma verificação percorrendo todas as cercas do tenant com o pré-filtro
+de bbox, numa amostra de --naive-positions posições.
+"""
+import argparse
+import math
+import random
+import sys
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vehicles', type=int, default=5000)
+    parser.add_argument('--fences', type=int, default=5000)
+    parser.add_argument('--large', type=int, default=5, help="Cercas grandes (fora do grid)")
+    parser.add_argument('--min-size', type=float, default=100.0, help="Raio/meio lado mínimo das cercas (m)")
+    parser.add_argument('--max-size', type=float, default=2000.0, help="Raio/meio lado máximo das cercas (m)")
+    parser.add_argument('--positions', type=int, default=500000)
+    parser.add_argument('--naive-positions', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--interval', type=float, default=5.0, help="Segundos entre posições de um veículo")
+    parser.add_argument('--database-url', help="Banco (padrão: SQLite temporário)")
+    parser.add_argument('--redis-url', help="Redis (padrão: InMemoryChannelLayer)")
+    return parser.parse_args(argv)
+
+
+def polygon(rng, lat, lng, size_m):
+    """Polígono estrelado (simples) de 4 a 12 vértices em volta de (lat, lng)"""
+    vertices = rng.randint(4, 12)
+    d_lat = size_m / 111320.0
+    d_lng = d_lat / math.cos(math.radians(lat))
+    points = []
+    for index in range(vertices):
+        angle = 2 * math.pi * index / vertices
+        scale = rng.uniform(0.5, 1.0)
+        points.append([lat + d_lat * scale * math.sin(angle), lng + d_lng * scale * math.cos(angle)])
+    return points
+
+
+def main(argv=None):
+    from .ingestion import setup_django
+
+    args = parse_args(argv)
+    args.json_output = None
+    setup_django(args)
+
+    import uuid
+    from collections import Counter
+    from apps.fleet.geofences import FenceShape, GeofenceMonitor
+    from apps.fleet.models import Vehicle
+    from .generator import DEVICE_ID_OFFSET, PositionGenerator
+
+    device_ids = range(DEVICE_ID_OFFSET, DEVICE_ID_OFFSET + args.vehicles)
+    generator = PositionGenerator(device_ids, interval=args.interval, alarm_rate=0)
+    rng = random.Random(5)
+    tenant_id = str(uuid.uuid4())
+    vehicles = {
+        device_id: Vehicle(id=str(uuid.uuid4()), tenant_id=tenant_id, traccar_device_id=device_id)
+        for device_id in device_ids
+    }
+
+    rows = []
+    for index in range(args.fences):
+        start = generator.state[rng.choice(device_ids)]
+        size = rng.uniform(args.min_size, args.max_size)
+        lat = start['lat'] + rng.uniform(-size, size) / 111320.0
+        lng = start['lng'] + rng.uniform(-size, size) / 111320.0
+        if index % 2:
+            rows.append((str(uuid.uuid4()), f"C{index}", 'CUSTOMER', 'CIRCLE', None, lat, lng, size))
+        else:
+            rows.append((str(uuid.uuid4()), f"P{index}", 'CUSTOMER', 'POLYGON', polygon(rng, lat, lng, size), None, None, None))
+    for index in range(args.large):
+        lat, lng = rng.uniform(-28.0, -17.0), rng.uniform(-50.0, -42.0)
+        rows.append((str(uuid.uuid4()), f"R{index}", 'RESTRICTED', 'POLYGON', polygon(rng, lat, lng, 150000.0), None, None, None))
+
+    monitor = GeofenceMonitor(refresh=float('inf'))
+    started = time.perf_counter()
+    monitor.load({tenant_id: 1}, {tenant_id: rows})
+    load_elapsed = time.perf_counter() - started
+    monitor.next_refresh = float('inf')
+    index = monitor.indexes[tenant_id]
+
+    events = Counter()
+    elapsed = 0.0
+    processed = 0
+    sample = []
+    while processed < args.positions:
+        positions = generator.batch(min(args.batch_size, args.positions - processed))
+        updates = [(vehicles[pos['deviceId']], pos, pos['attributes']) for pos in positions]
+        started = time.perf_counter()
+        found = monitor.check(updates)
+        elapsed += time.perf_counter() - started
+        events.update(event['event'] for event in found)
+        processed += len(positions)
+        if len(sample) < args.naive_positions:
+            sample += [(pos['latitude'], pos['longitude']) for pos in positions]
+
+    # O que seria sem índice: testar todas as cercas do tenant a cada posição
+    shapes = [FenceShape(*row) for row in rows]
+    sample = sample[:args.naive_positions]
+    started = time.perf_counter()
+    naive = [frozenset(shape.id for shape in shapes if shape.contains(lat, lng)) for lat, lng in sample]
+    naive_elapsed = time.perf_counter() - started
+    mismatches = sum(index.query(lat, lng) != expected for (lat, lng), expected in zip(sample, naive))
+
+    sys.stdout.write(
+        f"\n{len(rows)} cercas ({len(index.large)} fora do grid, índice montado em {load_elapsed:.2f}s), "
+        f"{args.vehicles} veículos, {processed} posições em lotes de {args.batch_size}\n"
+        f"grid: {elapsed:.2f}s -> {processed / elapsed:,.0f} pos/s ({elapsed / processed * 1e6:.1f} µs/posição)\n"
+        f"todas as cercas: {naive_elapsed / len(sample) * 1e6:.1f} µs/posição "
+        f"({len(sample)} posições, {mismatches} divergências)\n"
+        f"eventos: {dict(events)}\n"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
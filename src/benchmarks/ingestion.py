@@ -0,0 +1,236 @@
+"""
+Carga no webhook do Traccar com clientes do mapa ao vivo conectados.
+
+Mede vazão (posições/s), latência do POST no webhook, latência ponta a ponta
+webhook -> WebSocket (p50/p95/p99) e queries por request.
+Uso: python -m benchmarks.ingestion --help
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vehicles', type=int, default=200)
+    parser.add_argument('--tenants', type=int, default=4)
+    parser.add_argument('--interval', type=float, default=10.0, help="Segundos entre posições de um mesmo veículo")
+    parser.add_argument('--alarm-rate', type=float, default=0.01, help="Fração das posições com alarme de score")
+    parser.add_argument('--batch-size', type=int, default=10, help="Posições por POST no webhook")
+    parser.add_argument('--duration', type=float, default=20.0, help="Segundos de carga")
+    parser.add_argument('--max-rate', action='store_true', help="Ignora o intervalo e envia o mais rápido possível")
+    parser.add_argument('--clients', type=int, default=8, help="Clientes WebSocket (distribuídos entre os tenants)")
+    parser.add_argument('--binary', action='store_true', help="Clientes com o subprotocolo MessagePack")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', help="Banco (padrão: SQLite temporário)")
+    parser.add_argument('--redis-url', help="Redis para channel layer/cache (padrão: InMemoryChannelLayer)")
+    parser.add_argument('--json', dest='json_output', help="Grava o relatório em JSON neste arquivo")
+    parser.add_argument('--max-p95-ms', type=float, help="Falha se o p95 ponta a ponta passar disso")
+    parser.add_argument('--max-queries-per-request', type=float, help="Falha se a média de queries passar disso")
+    return parser.parse_args(argv)
+
+
+def setup_django(args):
+    if args.database_url:
+        os.environ['BENCH_DATABASE_URL'] = args.database_url
+    if args.redis_url:
+        os.environ['BENCH_REDIS_URL'] = args.redis_url
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+class WebhookDriver:
+    """Envia os lotes ao TraccarWebhookView (django.test.Client) contando queries"""
+
+    def __init__(self, vehicle_ids, sent):
+        from django.test import Client
+        from django.urls import reverse
+
+        self.client = Client()
+        self.url = reverse('traccar-webhook')
+        self.vehicle_ids = vehicle_ids  # deviceId -> vehicle_id (como chega no WebSocket)
+        self.sent = sent
+        self.request_times = []
+        self.query_counts = []
+        self.positions = 0
+        self.errors = 0
+
+    def post(self, positions):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .clients import position_key
+
+        started = time.perf_counter()
+        for pos in positions:
+            self.sent[position_key(self.vehicle_ids[pos['deviceId']], pos['latitude'])] = started
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, json.dumps(positions), content_type='application/json')
+        self.request_times.append(time.perf_counter() - started)
+        self.query_counts.append(len(queries))
+        self.positions += len(positions)
+        if response.status_code != 200:
+            self.errors += 1
+
+
+async def run_load(args, driver, generator):
+    from asgiref.sync import sync_to_async
+
+    post = sync_to_async(driver.post)
+    rate = None if args.max_rate else generator.rate
+    started = time.perf_counter()
+    batches = 0
+    while time.perf_counter() - started < args.duration:
+        if rate:
+            # Segue o ritmo da frota; se atrasar, envia sem esperar (saturação)
+            due = started + batches * args.batch_size / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await post(generator.batch(args.batch_size))
+        batches += 1
+    elapsed = time.perf_counter() - started
+
+    # Dá tempo do último tick do fan-out chegar aos clientes
+    from django.conf import settings
+    await asyncio.sleep(settings.FLEET_FANOUT_TICK_MS / 1000 + 0.5)
+    return elapsed
+
+
+async def main_async(args, application, generator, vehicle_ids, tokens):
+    from .clients import LiveMapClient
+
+    sent = {}
+    driver = WebhookDriver(vehicle_ids, sent)
+    clients = [
+        LiveMapClient(application, tokens[index % len(tokens)], sent, binary=args.binary)
+        for index in range(args.clients)
+    ]
+    for client in clients:
+        await client.connect()
+    try:
+        elapsed = await run_load(args, driver, generator)
+    finally:
+        for client in clients:
+            await client.close()
+    return driver, clients, elapsed
+
+
+def build_report(args, driver, clients, elapsed):
+    from django.conf import settings
+    from apps.fleet.fanout import get_fanout
+    from apps.fleet.resolver import get_device_resolver
+    from .metrics import summarize
+
+    latencies = [latency for client in clients for latency in client.latencies]
+    requests = len(driver.request_times)
+    return {
+        'config': {
+            'vehicles': args.vehicles, 'tenants': args.tenants, 'interval': args.interval,
+            'alarm_rate': args.alarm_rate, 'batch_size': args.batch_size, 'clients': args.clients,
+            'binary': args.binary, 'max_rate': args.max_rate,
+            'database': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+            'channel_layer': settings.CHANNEL_LAYERS['default']['BACKEND'].rsplit('.', 1)[-1],
+            'fanout_tick_ms': settings.FLEET_FANOUT_TICK_MS,
+            'history': settings.POSITION_HISTORY_ENABLED,
+        },
+        'duration_s': round(elapsed, 3),
+        'positions': driver.positions,
+        'requests': requests,
+        'errors': driver.errors,
+        'throughput_positions_s': round(driver.positions / elapsed, 1) if elapsed else None,
+        'webhook_ms': summarize(driver.request_times),
+        'end_to_end_ms': summarize(latencies),
+        'queries': {
+            'total': sum(driver.query_counts),
+            'per_request': round(sum(driver.query_counts) / requests, 2) if requests else None,
+            'per_position': round(sum(driver.query_counts) / driver.positions, 3) if driver.positions else None,
+            'max_request': max(driver.query_counts, default=0),
+        },
+        'websocket': {
+            'frames': sum(client.frames for client in clients),
+            'updates': sum(client.updates for client in clients),
+            'bytes': sum(client.bytes_received for client in clients),
+        },
+        'device_resolver': get_device_resolver().stats(),
+        'fanout': get_fanout().stats(),
+    }
+
+
+def print_report(report, stream=sys.stdout):
+    config = report['config']
+    write = stream.write
+    write(
+        f"\n{config['vehicles']} veículos / {config['tenants']} tenants / {config['clients']} clientes "
+        f"({'msgpack' if config['binary'] else 'json'}) | {config['database']} + {config['channel_layer']} "
+        f"| tick {config['fanout_tick_ms']} ms | histórico {'on' if config['history'] else 'off'}\n"
+    )
+    write(f"posições: {report['positions']} em {report['duration_s']} s "
+          f"-> {report['throughput_positions_s']} pos/s ({report['requests']} requests, {report['errors']} erros)\n")
+    for label, key in (('webhook', 'webhook_ms'), ('ponta a ponta', 'end_to_end_ms')):
+        data = report[key]
+        if data['count']:
+            write(f"{label:>14}: p50 {data['p50']} ms | p95 {data['p95']} ms | p99 {data['p99']} ms "
+                  f"| max {data['max']} ms (n={data['count']})\n")
+        else:
+            write(f"{label:>14}: sem amostras\n")
+    queries = report['queries']
+    write(f"{'queries':>14}: {queries['per_request']} por request | {queries['per_position']} por posição "
+          f"| máx {queries['max_request']}\n")
+    websocket = report['websocket']
+    write(f"{'websocket':>14}: {websocket['frames']} frames | {websocket['updates']} atualizações "
+          f"| {websocket['bytes']} bytes\n")
+
+
+def check_thresholds(args, report):
+    failures = []
+    p95 = report['end_to_end_ms'].get('p95')
+    if args.max_p95_ms is not None and (p95 is None or p95 > args.max_p95_ms):
+        failures.append(f"p95 ponta a ponta {p95} ms > {args.max_p95_ms} ms")
+    per_request = report['queries']['per_request']
+    if args.max_queries_per_request is not None and per_request is not None and per_request > args.max_queries_per_request:
+        failures.append(f"{per_request} queries por request > {args.max_queries_per_request}")
+    if report['errors']:
+        failures.append(f"{report['errors']} requests com erro")
+    return failures
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_django(args)
+
+    from apps.tenants.serializers import CustomTokenObtainPairSerializer
+    from fleetvision.asgi import application
+    from .generator import PositionGenerator, setup_fleet, teardown_fleet
+
+    devices, users = setup_fleet(args.vehicles, args.tenants)
+    generator = PositionGenerator([device_id for device_id, _, _ in devices], args.interval, args.alarm_rate, args.seed)
+    vehicle_ids = {device_id: vehicle_id for device_id, vehicle_id, _ in devices}
+    tokens = [str(CustomTokenObtainPairSerializer.get_token(user).access_token) for user in users.values()]
+
+    try:
+        driver, clients, elapsed = asyncio.run(main_async(args, application, generator, vehicle_ids, tokens))
+    finally:
+        teardown_fleet()
+
+    report = build_report(args, driver, clients, elapsed)
+    print_report(report)
+    if args.json_output:
+        with open(args.json_output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    failures = check_thresholds(args, report)
+    for failure in failures:
+        sys.stderr.write(f"FALHOU: {failure}\n")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,28 @@
+import math
+
+
+def percentile(values, pct):
+    """Percentil por interpolação linear (values não precisa estar ordenado)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    if low == high:
+        return ordered[low]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values, unit_scale=1000.0):
+    """count/mean/p50/p95/p99/max; por padrão converte segundos em ms"""
+    if not values:
+        return {'count': 0}
+    scaled = [value * unit_scale for value in values]
+    return {
+        'count': len(scaled),
+        'mean': round(sum(scaled) / len(scaled), 3),
+        'p50': round(percentile(scaled, 50), 3),
+        'p95': round(percentile(scaled, 95), 3),
+        'p99': round(percentile(scaled, 99), 3),
+        'max': round(max(scaled), 3),
+    }
@@ -0,0 +1,122 @@
+"""
+RouteOptimizer.optimize_route contra a implementação anterior (vizinho mais
+próximo em Python puro e um save() por parada).
+
+    python -m benchmarks.routes --stops 50 200 500 --time-budget 2
+
+Para cada tamanho cria uma rota com paradas aleatórias numa área de ~40 km,
+roda as duas versões sobre a mesma ordem inicial e compara tempo e km.
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import date
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stops', type=int, nargs='+', default=[50, 200, 500])
+    parser.add_argument('--time-budget', type=float, default=2.0, help="Segundos de busca local (2-opt/Or-opt)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', help="Banco (padrão: SQLite temporário)")
+    parser.add_argument('--redis-url', help="Redis (padrão: InMemoryChannelLayer)")
+    return parser.parse_args(argv)
+
+
+def legacy_optimize_route(route):
+    """A versão anterior do RouteOptimizer.optimize_route, para comparação"""
+    from apps.fleet.services import RouteOptimizer
+
+    stops = list(route.stops.filter(status='PENDING'))
+    if not stops:
+        return 0
+    current_stop = stops.pop(0)
+    optimized_stops = [current_stop]
+    total_distance = 0
+    while stops:
+        nearest_stop = None
+        min_dist = float('inf')
+        for stop in stops:
+            dist = RouteOptimizer.haversine(current_stop.latitude, current_stop.longitude, stop.latitude, stop.longitude)
+            if dist < min_dist:
+                min_dist = dist
+                nearest_stop = stop
+        total_distance += min_dist
+        optimized_stops.append(nearest_stop)
+        stops.remove(nearest_stop)
+        current_stop = nearest_stop
+    for index, stop in enumerate(optimized_stops):
+        stop.sequence = index + 1
+        stop.save()
+    return round(total_distance, 2)
+
+
+def create_route(tenant, size, rng):
+    from apps.fleet.models import DeliveryRoute, RouteStop
+
+    route = DeliveryRoute.objects.create(tenant=tenant, name=f"Benchmark {size} paradas", date=date.today())
+    RouteStop.objects.bulk_create([
+        RouteStop(
+            route=route, sequence=index + 1, address=f"Parada {index + 1}",
+            latitude=-23.55 + rng.uniform(-0.18, 0.18), longitude=-46.63 + rng.uniform(-0.18, 0.18),
+        )
+        for index in range(size)
+    ])
+    return route
+
+
+def reset_sequence(route):
+    from apps.fleet.models import RouteStop
+
+    # Volta à ordem de criação ("Parada N"), a mesma que a versão anterior recebeu
+    stops = sorted(route.stops.all(), key=lambda stop: int(stop.address.split()[-1]))
+    for index, stop in enumerate(stops):
+        stop.sequence = index + 1
+    RouteStop.objects.bulk_update(stops, ['sequence'])
+
+
+def main(argv=None):
+    from .ingestion import setup_django
+
+    args = parse_args(argv)
+    args.json_output = None
+    setup_django(args)
+
+    from apps.fleet.services import RouteOptimizer
+    from apps.tenants.models import Tenant
+    from .generator import SUBDOMAIN_PREFIX, teardown_fleet
+
+    teardown_fleet()
+    tenant = Tenant.objects.create(name="Benchmark rotas", subdomain=f"{SUBDOMAIN_PREFIX}routes")
+    rng = random.Random(args.seed)
+    rows = []
+    try:
+        for size in args.stops:
+            route = create_route(tenant, size, rng)
+            started = time.perf_counter()
+            legacy_km = legacy_optimize_route(route)
+            legacy_elapsed = time.perf_counter() - started
+
+            reset_sequence(route)
+            started = time.perf_counter()
+            result = RouteOptimizer.optimize_route(route, time_budget=args.time_budget)
+            elapsed = time.perf_counter() - started
+            rows.append((size, legacy_elapsed, legacy_km, elapsed, result))
+    finally:
+        teardown_fleet()
+
+    sys.stdout.write(f"\norçamento da busca local: {args.time_budget}s\n")
+    sys.stdout.write(f"{'paradas':>8} {'anterior (s)':>13} {'km':>9} {'novo (s)':>9} {'km NN':>9} {'km':>9} {'ganho':>7}  movimentos\n")
+    for size, legacy_elapsed, legacy_km, elapsed, result in rows:
+        gain = 1 - result['total_km'] / legacy_km if legacy_km else 0
+        sys.stdout.write(
+            f"{size:>8} {legacy_elapsed:>13.3f} {legacy_km:>9.1f} {elapsed:>9.3f} {result['nearest_neighbor_km']:>9.1f} "
+            f"{result['total_km']:>9.1f} {gain:>7.1%}  2-opt {result.get('two_opt', 0)}, or-opt {result.get('or_opt', 0)}"
+            f"{' (tempo esgotado)' if result.get('timed_out') else ''}\n"
+        )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Recálculo dos scores de um tenant depois de uma mudança de pesos.
+
+    python -m benchmarks.scores --vehicles 2000 --days 365 --database-url postgres://...
+
+Cria um DriverScore por veículo e dia com contadores aleatórios, muda os
+weight_* do tenant e mede o TenantScoreRecompute (leitura, NumPy e gravação).
+"""
+import argparse
+import sys
+import time
+from datetime import timedelta
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vehicles', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--alarms-per-day', type=float, default=1.5, help="Média de alarmes por tipo, veículo e dia")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', help="Banco (padrão: SQLite temporário)")
+    parser.add_argument('--redis-url', help="Redis (padrão: InMemoryChannelLayer)")
+    return parser.parse_args(argv)
+
+
+def create_scores(tenant, vehicle_ids, days, alarms_per_day, seed):
+    import numpy as np
+    from django.utils import timezone
+    from apps.fleet.models import DriverScore
+    from apps.fleet.scores import COUNT_FIELDS, TenantScoreRecompute
+
+    rng = np.random.default_rng(seed)
+    weights = TenantScoreRecompute(tenant).weights()
+    today = timezone.now().date()
+    created = 0
+    for offset in range(days):
+        day = today - timedelta(days=offset + 1)
+        counts = rng.poisson(alarms_per_day, size=(len(vehicle_ids), len(COUNT_FIELDS)))
+        scores = np.maximum(0, 100 - counts @ weights)
+        DriverScore.objects.bulk_create([
+            DriverScore(
+                tenant=tenant, vehicle_id=vehicle_id, date=day, score=int(scores[index]),
+                **{field: int(value) for field, value in zip(COUNT_FIELDS, counts[index])},
+            )
+            for index, vehicle_id in enumerate(vehicle_ids)
+        ], batch_size=5000)
+        created += len(vehicle_ids)
+    return created
+
+
+def main(argv=None):
+    from .ingestion import setup_django
+
+    args = parse_args(argv)
+    args.json_output = None
+    setup_django(args)
+
+    from django.conf import settings
+    from apps.fleet.scores import TenantScoreRecompute
+    from apps.tenants.models import Tenant
+    from .generator import setup_fleet, teardown_fleet
+
+    devices, _ = setup_fleet(args.vehicles, 1)
+    tenant = Tenant.objects.get(id=devices[0][2])
+    try:
+        started = time.perf_counter()
+        created = create_scores(tenant, [vehicle_id for _, vehicle_id, _ in devices], args.days, args.alarms_per_day, args.seed)
+        setup_elapsed = time.perf_counter() - started
+
+        # update() não dispara o signal: o recálculo é medido aqui, sem thread
+        Tenant.objects.filter(pk=tenant.pk).update(weight_overspeed=15, weight_harsh_braking=8)
+        tenant.refresh_from_db()
+        started = time.perf_counter()
+        result = TenantScoreRecompute(tenant).run()
+        elapsed = time.perf_counter() - started
+    finally:
+        teardown_fleet()
+
+    sys.stdout.write(
+        f"\n{args.vehicles} veículos x {args.days} dias = {created} scores "
+        f"| {settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1]} (criados em {setup_elapsed:.1f}s)\n"
+        f"recálculo: {result['rows']} lidos, {result['updated']} alterados em {elapsed:.2f}s "
+        f"-> {result['rows'] / elapsed:,.0f} scores/s\n"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
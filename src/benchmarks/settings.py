@@ -0,0 +1,41 @@
+"""
+Settings dos benchmarks: as de produção com banco/channel layer locais.
+
+BENCH_DATABASE_URL  banco (padrão: SQLite em arquivo temporário)
+BENCH_REDIS_URL     Redis do channel layer, cache e fila (vazio = InMemoryChannelLayer)
+"""
+import os
+import tempfile
+
+os.environ.setdefault('DATABASE_URL', os.environ.get('BENCH_DATABASE_URL') or (
+    'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fleetvision_bench.sqlite3')
+))
+os.environ.setdefault('REDIS_URL', os.environ.get('BENCH_REDIS_URL') or 'redis://127.0.0.1:6379/0')
+
+from fleetvision.settings import *  # noqa: E402,F401,F403
+
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+
+# O webhook processa no próprio request (a fila tem benchmark próprio: telemetry_worker --stats)
+TELEMETRY_QUEUE_ENABLED = False
+
+if os.environ.get('BENCH_REDIS_URL'):
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": [REDIS_URL]},  # noqa: F405
+        },
+    }
+else:
+    # O InMemoryChannelLayer só funciona dentro de um event loop: sem tick no fan-out
+    CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    FLEET_FANOUT_TICK_MS = 0
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'root': {'handlers': ['console'], 'level': os.environ.get('BENCH_LOG_LEVEL', 'ERROR')},
+}
@@ -0,0 +1,120 @@
+"""
+Buscas espaciais do estado ao vivo (índice GEO por tenant) x varrer os Vehicle.
+
+    python -m benchmarks.spatial --vehicles 50000 --queries 200 --redis-url redis://localhost:6379/0
+
+Espalha --vehicles veículos de um tenant numa região de --spread graus,
+alimenta o LiveStateStore em lotes como a ingestão e mede a latência das
+buscas por raio, k mais próximos e bbox (do tamanho de uma tela do mapa).
+Para comparar, a mesma busca por raio carregando todos os Vehicle do tenant
+e filtrando em Python.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vehicles', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--spread', type=float, default=0.5, help="Graus de lado da região dos veículos")
+    parser.add_argument('--radius-km', type=float, default=5.0)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--bbox-km', type=float, default=10.0, help="Lado da bbox buscada")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--database-url', help="Banco (padrão: SQLite temporário)")
+    parser.add_argument('--redis-url', help="Redis (padrão: redis://127.0.0.1:6379/0)")
+    return parser.parse_args(argv)
+
+
+def latency(function, points):
+    elapsed, sizes = [], []
+    for point in points:
+        started = time.perf_counter()
+        sizes.append(len(function(*point)))
+        elapsed.append((time.perf_counter() - started) * 1000)
+    elapsed.sort()
+    return statistics.median(elapsed), elapsed[int(len(elapsed) * 0.95) - 1], statistics.mean(sizes)
+
+
+def main(argv=None):
+    from .ingestion import setup_django
+
+    args = parse_args(argv)
+    args.json_output = None
+    setup_django(args)
+
+    import uuid
+    from apps.fleet.live_state import LiveStateStore, haversine_km
+    from apps.fleet.models import Vehicle
+    from apps.tenants.models import Tenant
+
+    rng = random.Random(11)
+    center_lat, center_lng = -23.55, -46.63
+    tenant = Tenant.objects.create(name='Bench espacial', subdomain=f"spatial-{uuid.uuid4().hex[:8]}")
+    store = LiveStateStore()
+    for key in (store.KEY, store.SCORE_KEY, store.GEO_KEY):
+        store.client.delete(key.format(tenant_id=tenant.id))
+
+    vehicles = [
+        Vehicle(
+            tenant=tenant, name=f"V{index}", traccar_device_id=900000 + index, last_speed=30.0,
+            last_position_lat=center_lat + rng.uniform(-args.spread, args.spread) / 2,
+            last_position_lng=center_lng + rng.uniform(-args.spread, args.spread) / 2,
+        )
+        for index in range(args.vehicles)
+    ]
+    Vehicle.objects.bulk_create(vehicles, batch_size=2000)
+
+    started = time.perf_counter()
+    for offset in range(0, len(vehicles), args.batch_size):
+        store.update([
+            (tenant.id, {
+                'id': str(vehicle.id), 'name': vehicle.name, 'lat': vehicle.last_position_lat,
+                'lng': vehicle.last_position_lng, 'speed': 30.0, 'ignition': True, 'score': None,
+            })
+            for vehicle in vehicles[offset:offset + args.batch_size]
+        ])
+    update = (time.perf_counter() - started) / len(vehicles) * 1e6
+
+    points = [
+        (center_lat + rng.uniform(-args.spread, args.spread) / 3, center_lng + rng.uniform(-args.spread, args.spread) / 3)
+        for _ in range(args.queries)
+    ]
+    half = args.bbox_km / 2 / 111.32
+    queryset = Vehicle.objects.filter(tenant=tenant)
+
+    def scan(lat, lng):
+        # O que havia antes: carregar todos os Vehicle do tenant e filtrar em Python
+        return [
+            vehicle for vehicle in queryset
+            if haversine_km(lat, lng, vehicle.last_position_lat, vehicle.last_position_lng) <= args.radius_km
+        ]
+
+    results = [
+        ("raio", lambda lat, lng: store.nearby(tenant.id, lat, lng, radius_km=args.radius_km)),
+        (f"k={args.k}", lambda lat, lng: store.nearby(tenant.id, lat, lng, k=args.k)),
+        ("bbox", lambda lat, lng: store.in_bbox(tenant.id, lat - half, lng - half, lat + half, lng + half)),
+        ("raio (banco)", lambda lat, lng: LiveStateStore.from_database(queryset, lat, lng, radius_km=args.radius_km)),
+        ("varrer Vehicle", scan),
+    ]
+    sys.stdout.write(
+        f"\n{args.vehicles} veículos num quadrado de {args.spread}°; "
+        f"atualizar o estado ao vivo: {update:.1f} µs/veículo (lotes de {args.batch_size})\n"
+        f"{'busca':>15} {'p50':>9} {'p95':>9} {'veículos':>9}\n"
+    )
+    for name, function in results:
+        queries = points if 'banco' not in name and 'varrer' not in name else points[:max(len(points) // 10, 5)]
+        p50, p95, found = latency(function, queries)
+        sys.stdout.write(f"{name:>15} {p50:>7.2f}ms {p95:>7.2f}ms {found:>9.1f}\n")
+
+    for key in (store.KEY, store.SCORE_KEY, store.GEO_KEY):
+        store.client.delete(key.format(tenant_id=tenant.id))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
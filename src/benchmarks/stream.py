@@ -0,0 +1,113 @@
+"""
+Vazão do traccar_stream contra o Traccar falso (mesmo pipeline do webhook).
+
+    python -m benchmarks.stream --vehicles 1000 --rate 0 --duration 20
+
+Compare com python -m benchmarks.ingestion --max-rate --clients 0 nas mesmas
+condições. --drop-after força quedas para medir reconexão e retomada.
+"""
+import argparse
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vehicles', type=int, default=1000)
+    parser.add_argument('--tenants', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=0, help="Posições/s enviadas pelo Traccar falso (0 = sem limite)")
+    parser.add_argument('--message-size', type=int, default=10, help="Posições por mensagem do socket")
+    parser.add_argument('--alarm-rate', type=float, default=0.01)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--batch-ms', type=int, default=200)
+    parser.add_argument('--drop-after', type=int, help="Traccar falso derruba a conexão a cada N mensagens")
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--database-url', help="Banco (padrão: SQLite temporário)")
+    parser.add_argument('--redis-url', help="Redis (padrão: InMemoryChannelLayer)")
+    return parser.parse_args(argv)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Traccar falso não subiu na porta {port}")
+
+
+async def run_stream(stream, duration):
+    stop = asyncio.Event()
+    task = asyncio.ensure_future(stream.run(stop))
+    await asyncio.sleep(duration)
+    stop.set()
+    await task
+
+
+def main(argv=None):
+    from .ingestion import setup_django
+
+    args = parse_args(argv)
+    args.json_output = None
+    setup_django(args)
+
+    from django.conf import settings
+    from redis.exceptions import RedisError
+    from apps.fleet.traccar_stream import FixTimeTracker, TraccarStream
+    from .generator import setup_fleet, teardown_fleet
+
+    devices, _ = setup_fleet(args.vehicles, args.tenants)
+    # Processo separado, como o Traccar de verdade (não disputa o GIL com a ingestão)
+    http_port, socket_port = free_port(), free_port()
+    command = [
+        sys.executable, '-m', 'benchmarks.fake_traccar', '--devices', str(args.vehicles),
+        '--rate', str(args.rate), '--message-size', str(args.message_size),
+        '--port', str(http_port), '--socket-port', str(socket_port),
+    ]
+    if args.drop_after:
+        command += ['--drop-after', str(args.drop_after)]
+    fake = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    settings.TRACCAR_BASE_URL = f"http://127.0.0.1:{http_port}"
+    settings.TRACCAR_SOCKET_URL = f"ws://127.0.0.1:{socket_port}/api/socket"
+    wait_for_port(http_port)
+
+    tracker = FixTimeTracker()
+    try:
+        tracker.client.delete(tracker.REDIS_KEY)
+    except RedisError:
+        pass
+    stream = TraccarStream(batch_size=args.batch_size, batch_ms=args.batch_ms, max_backoff=1, tracker=tracker)
+
+    started = time.perf_counter()
+    try:
+        asyncio.run(run_stream(stream, args.duration))
+        elapsed = time.perf_counter() - started
+    finally:
+        fake.terminate()
+        teardown_fleet()
+
+    counters = stream.counters
+    sys.stdout.write(
+        f"\n{args.vehicles} veículos | {settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1]} "
+        f"| lote {args.batch_size}/{args.batch_ms} ms\n"
+        f"recebidas: {counters['positions']} | processadas: {counters['processed']} em {elapsed:.1f} s "
+        f"-> {counters['processed'] / elapsed:.1f} pos/s\n"
+        f"lotes: {counters['batches']} | duplicadas: {counters['duplicates']} | reconexões: {counters['reconnects']} "
+        f"| reprocessadas: {counters['replayed']}\n"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
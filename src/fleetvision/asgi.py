@@ -1,19 +1,27 @@
 import os
 from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fleetvision.settings')
+
+# Inicializa o Django antes de importar consumers/middlewares que usam models
+django_asgi_app = get_asgi_application()
+
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
+from apps.tenants.middleware import JWTAuthMiddleware
 import apps.fleet.routing
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fleetvision.settings')
-
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
+        # Sessão (navegador) ou JWT em ?token= (app mobile)
         AuthMiddlewareStack(
-            URLRouter(
-                apps.fleet.routing.websocket_urlpatterns
+            JWTAuthMiddleware(
+                URLRouter(
+                    apps.fleet.routing.websocket_urlpatterns
+                )
             )
         )
     ),
-})
\ No newline at end of file
+})
@@ -79,16 +79,22 @@ WSGI_APPLICATION = 'fleetvision.wsgi.application'
 ASGI_APPLICATION = 'fleetvision.asgi.application'
 
 # Database
-DATABASES = {
-    'default': env.db('DATABASE_URL', default=f"postgres://{env('DB_USER')}:{env('DB_PASSWORD')}@{env('DB_HOST')}:{env('DB_PORT')}/{env('DB_NAME')}")
-}
+# DATABASE_URL tem prioridade; as variáveis DB_* só são exigidas sem ela
+if env('DATABASE_URL', default=None):
+    DATABASES = {'default': env.db('DATABASE_URL')}
+else:
+    DATABASES = {
+        'default': env.db_url_config(f"postgres://{env('DB_USER')}:{env('DB_PASSWORD')}@{env('DB_HOST')}:{env('DB_PORT')}/{env('DB_NAME')}")
+    }
 
 # Channels / Redis
+REDIS_URL = env('REDIS_URL', default='redis://redis:6379/0')
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [("redis", 6379)],
+            "hosts": [REDIS_URL],
         },
     },
 }
@@ -148,6 +154,94 @@ CORS_ALLOW_ALL_ORIGINS = True
 TRACCAR_BASE_URL = env('TRACCAR_BASE_URL', default='http://localhost:8082')
 TRACCAR_USER = env('TRACCAR_USER', default='admin')
 TRACCAR_PASSWORD = env('TRACCAR_PASSWORD', default='admin')
+# WebSocket /api/socket (vazio = derivado do TRACCAR_BASE_URL)
+TRACCAR_SOCKET_URL = env('TRACCAR_SOCKET_URL', default='')
+# De onde vêm as posições: 'webhook' (forward do Traccar) ou 'stream' (comando
+# traccar_stream). São exclusivos: com os dois cada posição entraria duas vezes
+TRACCAR_INGESTION = env('TRACCAR_INGESTION', default='webhook')
+TRACCAR_TIMEOUT = env.int('TRACCAR_TIMEOUT', default=30)  # segundos por request
+TRACCAR_POOL_SIZE = env.int('TRACCAR_POOL_SIZE', default=10)  # conexões keep-alive
+TRACCAR_SYNC_CHUNK_SIZE = env.int('TRACCAR_SYNC_CHUNK_SIZE', default=1000)
+
+# Histórico de posições (tabela particionada por dia)
+POSITION_HISTORY_ENABLED = env.bool('POSITION_HISTORY_ENABLED', default=True)
+POSITION_RETENTION_DAYS = env.int('POSITION_RETENTION_DAYS', default=180)
+POSITION_PARTITIONS_AHEAD = env.int('POSITION_PARTITIONS_AHEAD', default=7)
+# A ingestão só cria partições de ontem/anteontem até amanhã: fixTime fora disso
+# (relógio do rastreador errado) cai na partição DEFAULT
+POSITION_AUTO_PARTITION_DAYS_BEHIND = env.int('POSITION_AUTO_PARTITION_DAYS_BEHIND', default=2)
+POSITION_AUTO_PARTITION_DAYS_AHEAD = env.int('POSITION_AUTO_PARTITION_DAYS_AHEAD', default=1)
+
+# Fila de telemetria (Redis Streams). Desligada = webhook processa na hora
+TELEMETRY_QUEUE_ENABLED = env.bool('TELEMETRY_QUEUE_ENABLED', default=False)
+TELEMETRY_STREAM = env('TELEMETRY_STREAM', default='fleet:telemetry')
+TELEMETRY_STREAM_MAXLEN = env.int('TELEMETRY_STREAM_MAXLEN', default=1000000)
+TELEMETRY_MAX_RETRIES = env.int('TELEMETRY_MAX_RETRIES', default=5)
+
+# Cache deviceId -> veículo/tenant (segundos)
+DEVICE_RESOLVER_TTL = env.int('DEVICE_RESOLVER_TTL', default=60)
+DEVICE_RESOLVER_NEGATIVE_TTL = env.int('DEVICE_RESOLVER_NEGATIVE_TTL', default=10)
+
+# Cache usuário -> tenant no connect do WebSocket (segundos)
+TENANT_MEMBERSHIP_TTL = env.int('TENANT_MEMBERSHIP_TTL', default=30)
+
+# Score do dia acumulado no Redis e gravado em lote a cada N segundos
+# (desligado = cada lote de alarmes grava direto no DriverScore)
+SCORE_WRITE_BEHIND = env.bool('SCORE_WRITE_BEHIND', default=True)
+SCORE_FLUSH_INTERVAL = env.int('SCORE_FLUSH_INTERVAL', default=5)
+
+# Alarmes de score detectados pela telemetria e intervalo mínimo entre dois
+# eventos do mesmo tipo por veículo (segundos). Liga a etapa; cada tenant
+# ainda precisa optar (Tenant.harsh_event_detection) e define os limites
+HARSH_EVENT_DETECTION = env.bool('HARSH_EVENT_DETECTION', default=True)
+HARSH_EVENT_COOLDOWN = env.int('HARSH_EVENT_COOLDOWN', default=30)
+
+# Chegada automática nas paradas das rotas IN_PROGRESS: raio (m), permanência
+# mínima (s) e intervalo de recarga das rotas em memória (s)
+STOP_ARRIVAL_DETECTION = env.bool('STOP_ARRIVAL_DETECTION', default=True)
+STOP_ARRIVAL_RADIUS_M = env.float('STOP_ARRIVAL_RADIUS_M', default=75.0)
+STOP_ARRIVAL_DWELL_SECONDS = env.int('STOP_ARRIVAL_DWELL_SECONDS', default=60)
+STOP_ARRIVAL_REFRESH_SECONDS = env.int('STOP_ARRIVAL_REFRESH_SECONDS', default=30)
+
+# ETA ao vivo das paradas das rotas IN_PROGRESS: janela (s) da média móvel da
+# velocidade do veículo e intervalo mínimo (s) entre duas publicações de uma rota
+LIVE_ETA_ENABLED = env.bool('LIVE_ETA_ENABLED', default=True)
+LIVE_ETA_SPEED_SMOOTHING_SECONDS = env.float('LIVE_ETA_SPEED_SMOOTHING_SECONDS', default=300.0)
+LIVE_ETA_PUBLISH_INTERVAL = env.float('LIVE_ETA_PUBLISH_INTERVAL', default=15.0)
+
+# Entrada/saída das cercas virtuais: intervalo de recarga das cercas em memória
+# (s) e lado (graus) das células do grid que indexa as cercas de cada tenant
+GEOFENCE_DETECTION = env.bool('GEOFENCE_DETECTION', default=True)
+GEOFENCE_REFRESH_SECONDS = env.int('GEOFENCE_REFRESH_SECONDS', default=10)
+GEOFENCE_GRID_DEGREES = env.float('GEOFENCE_GRID_DEGREES', default=0.01)
+
+# Tempo máximo (segundos) da busca local 2-opt/Or-opt ao otimizar uma rota
+ROUTE_OPTIMIZATION_TIME_BUDGET = env.float('ROUTE_OPTIMIZATION_TIME_BUDGET', default=2.0)
+# Otimização em background (routes/{id}/optimize/): teto do time_budget pedido,
+# processos do pool (0 = um por núcleo) e intervalo mínimo entre os route_progress
+ROUTE_OPTIMIZATION_MAX_TIME_BUDGET = env.float('ROUTE_OPTIMIZATION_MAX_TIME_BUDGET', default=30.0)
+ROUTE_OPTIMIZATION_WORKERS = env.int('ROUTE_OPTIMIZATION_WORKERS', default=0)
+ROUTE_OPTIMIZATION_PROGRESS_INTERVAL = env.float('ROUTE_OPTIMIZATION_PROGRESS_INTERVAL', default=0.5)
+
+# Planejamento multi-veículo (routes/plan/): tempo máximo do solver e
+# velocidade média usada para os horários de chegada
+ROUTE_PLAN_TIME_BUDGET = env.float('ROUTE_PLAN_TIME_BUDGET', default=10.0)
+ROUTE_AVERAGE_SPEED_KMH = env.float('ROUTE_AVERAGE_SPEED_KMH', default=30.0)
+
+# Distâncias das otimizações: 'haversine' (linha reta) ou 'osrm' (servidor
+# compatível com o serviço table do OSRM, em OSRM_BASE_URL)
+DISTANCE_PROVIDER = env('DISTANCE_PROVIDER', default='haversine')
+OSRM_BASE_URL = env('OSRM_BASE_URL', default='http://localhost:5000')
+OSRM_PROFILE = env('OSRM_PROFILE', default='driving')
+OSRM_TABLE_SIZE = env.int('OSRM_TABLE_SIZE', default=100)  # o --max-table-size do osrm-routed
+OSRM_TIMEOUT = env.int('OSRM_TIMEOUT', default=30)
+# Cache das matrizes (provedores remotos): LRU local em MB e no Redis por número de matrizes
+DISTANCE_CACHE_LOCAL_MB = env.int('DISTANCE_CACHE_LOCAL_MB', default=64)
+DISTANCE_CACHE_MAX_ENTRIES = env.int('DISTANCE_CACHE_MAX_ENTRIES', default=500)
+DISTANCE_CACHE_TTL = env.int('DISTANCE_CACHE_TTL', default=7 * 24 * 3600)
+
+# Fan-out do mapa ao vivo: um frame por grupo a cada tick (0 = envia na hora)
+FLEET_FANOUT_TICK_MS = env.int('FLEET_FANOUT_TICK_MS', default=500)
 
 # Login Redirects
 LOGIN_URL = '/admin/login/'
@@ -49,16 +49,26 @@ document.addEventListener('DOMContentLoaded', function() {
 
         socket.onopen = function(e) {
             console.log("🟢 Conectado ao Rastreamento em Tempo Real");
+            subscribeViewport(socket);
         };
 
         socket.onmessage = function(e) {
             const data = JSON.parse(e.data);
             if (data.type === 'vehicle_update') {
                 updateVehicle(data.data);
+            } else if (data.type === 'vehicle_updates' || data.type === 'snapshot') {
+                // Lote do fan-out (última posição de cada veículo no tick)
+                // ou estado completo da frota enviado na conexão
+                data.data.filter(v => v.lat !== null && v.lng !== null).forEach(updateVehicle);
             }
         };
 
+        // Servidor só envia os veículos da área visível (com margem)
+        const onMove = () => subscribeViewport(socket);
+        map.on('moveend', onMove);
+
         socket.onclose = function(e) {
+            map.off('moveend', onMove);
             console.error("🔴 Desconectado. Tentando reconectar em 5s...");
             setTimeout(connect, 5000);
         };
@@ -69,6 +79,24 @@ document.addEventListener('DOMContentLoaded', function() {
         };
     }
 
+    function subscribeViewport(socket) {
+        if (socket.readyState !== WebSocket.OPEN) return;
+        // Antes do primeiro veículo o mapa está no ponto padrão: recebe tudo
+        if (Object.keys(vehicleMarkers).length === 0) return;
+        const bounds = map.getBounds().pad(0.25);
+        socket.send(JSON.stringify({
+            action: 'subscribe',
+            bbox: {
+                south: bounds.getSouth(),
+                west: bounds.getWest(),
+                north: bounds.getNorth(),
+                east: bounds.getEast()
+            },
+            // Mantém atualizando quem já está com o popup aberto
+            vehicles: Object.keys(vehicleMarkers).filter(id => vehicleMarkers[id].isPopupOpen())
+        }));
+    }
+
     // 4. Atualiza Marcador no Mapa
     function updateVehicle(v) {
         const { id, lat, lng, name, speed, ignition, score } = v;